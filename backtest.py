@@ -0,0 +1,247 @@
+import argparse
+import os
+import typing
+
+import numpy as np
+import pandas as pd
+
+from candle_store import CandleStore
+from indicators import rsi_series, macd_series
+
+# Offline backtests of the TechnicalStrategy and BreakoutStrategy signals on a candle history.
+# The signals are computed for every candle at once with the same formulas as the live _check_signal() methods,
+# then the trades are simulated one position at a time (like Strategy.ongoing_position) with the take profit and
+# stop loss applied. Only the trades are looped over in Python, never the candles.
+#
+# How the live signals map to candles:
+# - Technical: check_trade() runs when a new candle starts and reads the indicators of the candle that just closed,
+#   the market order is filled at the first price of the new candle -> signal of candle i-1, entry at open[i]
+# - Breakout: check_trade() runs on every trade of the current candle. With candles only, the condition is evaluated
+#   on the closed candle (close[i] > high[i-1] and volume[i] > min_volume) -> entry at close[i]
+# - take profit / stop loss are percentages of the entry price. When a candle reaches both, the stop loss is assumed
+#   to come first; when a candle opens beyond a level, the exit is at the open price.
+
+COLUMNS = ("timestamp", "open", "high", "low", "close", "volume")
+
+# first length of the candle window searched for an exit, doubled until the exit is found
+_EXIT_SEARCH_CHUNK = 256
+
+
+class BacktestResult:
+    def __init__(self, trades: typing.Dict[str, np.ndarray], equity: np.ndarray, balance_pct: float):
+        # one array per field: entry_idx, exit_idx, side (1 long / -1 short), entry_price, exit_price, return_pct,
+        # exit_reason ("tp", "sl" or "open" when the position is still open at the last candle)
+        self.trades = trades
+        # equity after each trade, starting from 1, each trade risking balance_pct % of the equity
+        self.equity = equity
+        self.balance_pct = balance_pct
+
+        returns = trades['return_pct']
+
+        self.trades_number = len(returns)
+        self.wins = int(np.sum(returns > 0))
+        self.win_rate = self.wins / self.trades_number if self.trades_number > 0 else 0.0
+        # sum of the trade returns in % of the position, and in % of the account with compounding
+        self.pnl_pct = float(np.sum(returns))
+        self.total_return_pct = float((equity[-1] - 1) * 100) if len(equity) > 0 else 0.0
+        self.max_drawdown_pct = _max_drawdown_pct(equity)
+
+    def summary(self) -> typing.Dict[str, float]:
+        return {"trades": self.trades_number, "win_rate": round(self.win_rate, 4), "pnl_pct": round(self.pnl_pct, 4),
+                "total_return_pct": round(self.total_return_pct, 4),
+                "max_drawdown_pct": round(self.max_drawdown_pct, 4)}
+
+
+def _max_drawdown_pct(equity: np.ndarray) -> float:
+    if len(equity) == 0:
+        return 0.0
+
+    curve = np.concatenate(([1.0], equity))
+    peaks = np.maximum.accumulate(curve)
+
+    return float(np.max((peaks - curve) / peaks) * 100)
+
+
+def _as_columns(candles: typing.Union[CandleStore, typing.Dict[str, np.ndarray]]) -> typing.Dict[str, np.ndarray]:
+    if isinstance(candles, CandleStore):
+        return {"timestamp": candles.timestamps, "open": candles.opens, "high": candles.highs, "low": candles.lows,
+                "close": candles.closes, "volume": candles.volumes}
+
+    return {name: np.asarray(candles[name]) for name in COLUMNS}
+
+
+# 1 long / -1 short / 0 for each candle: signal of TechnicalStrategy._check_signal() evaluated when candle i starts
+def technical_signals(closes: np.ndarray, rsi_length: int, ema_fast: int, ema_slow: int,
+                      ema_signal: int) -> np.ndarray:
+    series = pd.Series(closes, dtype=float)
+
+    rsi = rsi_series(series, rsi_length).reindex(series.index).to_numpy()
+    macd_line, macd_signal = macd_series(series, ema_fast, ema_slow, ema_signal)
+    macd_line = macd_line.to_numpy()
+    macd_signal = macd_signal.to_numpy()
+
+    signals = np.zeros(len(closes), dtype=np.int8)
+
+    # the indicators of the last finished candle (i - 1)
+    signals[1:][(rsi[:-1] < 30) & (macd_line[:-1] > macd_signal[:-1])] = 1
+    signals[1:][(rsi[:-1] > 70) & (macd_line[:-1] < macd_signal[:-1])] = -1
+
+    return signals
+
+
+# 1 long / -1 short / 0 for each candle: signal of BreakoutStrategy._check_signal() on the closed candle i
+def breakout_signals(highs: np.ndarray, lows: np.ndarray, closes: np.ndarray, volumes: np.ndarray,
+                     min_volume: float) -> np.ndarray:
+    signals = np.zeros(len(closes), dtype=np.int8)
+
+    enough_volume = volumes[1:] > min_volume
+    signals[1:][(closes[1:] > highs[:-1]) & enough_volume] = 1
+    signals[1:][(closes[1:] < lows[:-1]) & enough_volume & (signals[1:] == 0)] = -1
+
+    return signals
+
+
+def _find_exit(opens: np.ndarray, highs: np.ndarray, lows: np.ndarray, start: int, side: int, take_profit: float,
+               stop_loss: float) -> typing.Tuple[int, float, str]:
+    n = len(highs)
+    chunk = _EXIT_SEARCH_CHUNK
+
+    while start < n:
+        end = min(start + chunk, n)
+
+        if side == 1:
+            sl_hit = lows[start:end] <= stop_loss
+            tp_hit = highs[start:end] >= take_profit
+        else:
+            sl_hit = highs[start:end] >= stop_loss
+            tp_hit = lows[start:end] <= take_profit
+
+        hits = np.flatnonzero(sl_hit | tp_hit)
+
+        if len(hits) > 0:
+            idx = start + hits[0]
+            open_price = opens[idx]
+
+            if sl_hit[hits[0]]:
+                gapped = open_price <= stop_loss if side == 1 else open_price >= stop_loss
+                return idx, open_price if gapped else stop_loss, "sl"
+
+            gapped = open_price >= take_profit if side == 1 else open_price <= take_profit
+            return idx, open_price if gapped else take_profit, "tp"
+
+        start = end
+        chunk *= 2
+
+    return n - 1, float("nan"), "open"
+
+
+def simulate(candles: typing.Union[CandleStore, typing.Dict[str, np.ndarray]], signals: np.ndarray,
+             entry_prices: np.ndarray, take_profit: float, stop_loss: float, exit_offset: int,
+             balance_pct: float = 100.0) -> BacktestResult:
+    # exit_offset: first candle where the exit can happen, relative to the entry candle (0 when the entry is at the
+    # open of the candle, 1 when it is at the close)
+    columns = _as_columns(candles)
+    opens, highs, lows, closes = columns['open'], columns['high'], columns['low'], columns['close']
+
+    signal_idx = np.flatnonzero(signals)
+
+    fields = {name: [] for name in ("entry_idx", "exit_idx", "side", "entry_price", "exit_price", "return_pct",
+                                    "exit_reason")}
+
+    pos = 0
+    while pos < len(signal_idx):
+        entry_idx = int(signal_idx[pos])
+        side = int(signals[entry_idx])
+        entry_price = float(entry_prices[entry_idx])
+
+        tp_price = entry_price * (1 + side * take_profit / 100)
+        sl_price = entry_price * (1 - side * stop_loss / 100)
+
+        exit_idx, exit_price, reason = _find_exit(opens, highs, lows, entry_idx + exit_offset, side, tp_price,
+                                                  sl_price)
+        if reason == "open":
+            exit_price = float(closes[-1])
+
+        fields['entry_idx'].append(entry_idx)
+        fields['exit_idx'].append(exit_idx)
+        fields['side'].append(side)
+        fields['entry_price'].append(entry_price)
+        fields['exit_price'].append(exit_price)
+        fields['return_pct'].append(side * (exit_price / entry_price - 1) * 100)
+        fields['exit_reason'].append(reason)
+
+        if reason == "open":
+            break
+
+        # like ongoing_position, no new signal is taken before the position is closed
+        pos = int(np.searchsorted(signal_idx, exit_idx, side="right"))
+
+    trades = {"entry_idx": np.array(fields['entry_idx'], dtype=np.int64),
+              "exit_idx": np.array(fields['exit_idx'], dtype=np.int64),
+              "side": np.array(fields['side'], dtype=np.int8),
+              "entry_price": np.array(fields['entry_price'], dtype=np.float64),
+              "exit_price": np.array(fields['exit_price'], dtype=np.float64),
+              "return_pct": np.array(fields['return_pct'], dtype=np.float64),
+              "exit_reason": np.array(fields['exit_reason'], dtype="<U4")}
+
+    equity = np.cumprod(1 + trades['return_pct'] / 100 * balance_pct / 100)
+
+    return BacktestResult(trades, equity, balance_pct)
+
+
+def backtest_technical(candles: typing.Union[CandleStore, typing.Dict[str, np.ndarray]], take_profit: float,
+                       stop_loss: float, other_params: typing.Dict, balance_pct: float = 100.0) -> BacktestResult:
+    columns = _as_columns(candles)
+
+    signals = technical_signals(columns['close'], other_params['rsi_length'], other_params['ema_fast'],
+                                other_params['ema_slow'], other_params['ema_signal'])
+
+    return simulate(columns, signals, columns['open'], take_profit, stop_loss, 0, balance_pct)
+
+
+def backtest_breakout(candles: typing.Union[CandleStore, typing.Dict[str, np.ndarray]], take_profit: float,
+                      stop_loss: float, other_params: typing.Dict, balance_pct: float = 100.0) -> BacktestResult:
+    columns = _as_columns(candles)
+
+    signals = breakout_signals(columns['high'], columns['low'], columns['close'], columns['volume'],
+                               other_params['min_volume'])
+
+    return simulate(columns, signals, columns['close'], take_profit, stop_loss, 1, balance_pct)
+
+
+BACKTESTS = {"Technical": backtest_technical, "Breakout": backtest_breakout}
+
+
+# backtest on the candles of the local history cache (see connectors/history.py)
+def main():
+    parser = argparse.ArgumentParser(description="Backtest a strategy on the cached candle history")
+    parser.add_argument("strategy", choices=list(BACKTESTS.keys()))
+    parser.add_argument("cache_file", help="e.g. cache/history/binance/BTCUSDT_1m.npz")
+    parser.add_argument("--take-profit", type=float, required=True)
+    parser.add_argument("--stop-loss", type=float, required=True)
+    parser.add_argument("--balance-pct", type=float, default=100.0)
+    parser.add_argument("--rsi-length", type=int, default=14)
+    parser.add_argument("--ema-fast", type=int, default=12)
+    parser.add_argument("--ema-slow", type=int, default=26)
+    parser.add_argument("--ema-signal", type=int, default=9)
+    parser.add_argument("--min-volume", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.cache_file):
+        parser.error(f"{args.cache_file} doesn't exist")
+
+    with np.load(args.cache_file) as cached:
+        candles = {name: cached[name] for name in COLUMNS}
+
+    other_params = {"rsi_length": args.rsi_length, "ema_fast": args.ema_fast, "ema_slow": args.ema_slow,
+                    "ema_signal": args.ema_signal, "min_volume": args.min_volume}
+
+    result = BACKTESTS[args.strategy](candles, args.take_profit, args.stop_loss, other_params, args.balance_pct)
+
+    print(f"{len(candles['timestamp'])} candles")
+    for key, value in result.summary().items():
+        print(f"{key}: {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# Websocket frames received by the Bitmex connector with the whole "trade" and "instrument" tables subscribed
+# ("tables", the former subscriptions) against the topics scoped to the symbols in use ("symbols": the trades of one
+# strategy symbol and the quotes of one watchlist symbol), fed by the mock exchange trading --symbols symbols.
+# The connector doesn't read the instrument table anymore: its frames are received but dropped before decoding.
+# Run from the repository root: python -m benchmarks.bench_bitmex_topics [--symbols N] [--rate R] [--seconds S]
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+import typing
+
+from connectors.bitmex import BitmexClient
+from mock_exchange.bitmex import MockBitmex
+
+
+def _measure(client: BitmexClient, seconds: float) -> typing.Dict[str, float]:
+    time.sleep(1)  # subscription answers and frames of the previous case
+    client.frame_rates()
+    time.sleep(seconds)
+
+    return client.frame_rates()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bitmex frames per second, whole tables against symbol topics")
+    parser.add_argument("--symbols", type=int, default=20, help="symbols traded by the mock exchange")
+    parser.add_argument("--rate", type=float, default=2000.0, help="mock trades per second over all the symbols")
+    parser.add_argument("--seconds", type=float, default=5.0, help="duration of each measurement")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+
+    symbols = ["XBTUSD", "ETHUSD"] + [f"SYM{i}USD" for i in range(args.symbols - 2)]
+    mock = MockBitmex(symbols=symbols, rate=args.rate)
+    mock.start()
+
+    # the contracts of the mock exchange mustn't replace the ones cached for the application
+    os.chdir(tempfile.mkdtemp())
+
+    client = BitmexClient("", "", testnet=True, base_url=mock.base_url, wss_url=mock.wss_url)
+    contract = client.contracts["XBTUSD"]
+
+    print(f"{'case':<10}{'frames/s':>12}{'decoded/s':>12}")
+
+    for case in ("tables", "symbols"):
+        if case == "tables":
+            topics = ["trade", "instrument"]
+        else:
+            topics = ["trade:" + contract.symbol]
+            client.watch(client.contracts["ETHUSD"])
+
+        for topic in topics:
+            client.subscribe_channel(topic)
+
+        rates = _measure(client, args.seconds)
+        print(f"{case:<10}{rates['received']:>12.1f}{rates['decoded']:>12.1f}")
+
+        for topic in topics:
+            client.unsubscribe_channel(topic)
+        if case == "symbols":
+            client.unwatch(client.contracts["ETHUSD"])
+
+    mock.stop()
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
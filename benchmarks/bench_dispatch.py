@@ -0,0 +1,85 @@
+# Dispatch cost of one aggTrade message with 1, 50 and 500 active strategies: the former linear scan over
+# client.strategies ("scan") against the symbol index of connectors.routing ("index").
+# Every strategy trades a different symbol and the message matches exactly one of them.
+# Run from the repository root: python -m benchmarks.bench_dispatch [--messages N]
+
+import argparse
+import json
+import time
+import typing
+
+from candle_store import CandleStore
+from connectors.routing import StrategyRouter
+
+
+class _Contract:
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+
+
+# strategy stand-in: the benchmark measures the dispatch, not the candle update
+class _Strategy:
+    def __init__(self, symbol: str):
+        self.contract = _Contract(symbol)
+        self.exchange = "binance"
+        self.tf = "1m"
+        self.tf_equiv = 60000
+        self.candles = CandleStore(2)
+
+    def parse_trades(self, price: float, size: float, timestamp: int) -> str:
+        return "same_candle"
+
+    def check_trade(self, tick_type: str):
+        pass
+
+
+def _message(symbol: str) -> str:
+    return json.dumps({"e": "aggTrade", "E": 1611568800123, "s": symbol, "a": 1, "p": "32200.75", "q": "0.010",
+                       "f": 1, "l": 1, "T": 1611568800120, "m": False})
+
+
+def dispatch_scan(strategies: typing.Dict[int, _Strategy], msg: str):
+    data = json.loads(msg)
+    symbol = data['s']
+    for key, strat in strategies.items():
+        if strat.contract.symbol == symbol:
+            res = strat.parse_trades(float(data['p']), float(data['q']), data['T'])
+            strat.check_trade(res)
+
+
+def dispatch_index(router: StrategyRouter, msg: str):
+    data = json.loads(msg)
+    for strat in router.get(data['s']):
+        res = strat.parse_trades(float(data['p']), float(data['q']), data['T'])
+        strat.check_trade(res)
+
+
+def _time_per_message(func: typing.Callable, target, messages: typing.List[str]) -> float:
+    start = time.perf_counter()
+    for msg in messages:
+        func(target, msg)
+    return (time.perf_counter() - start) / len(messages) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per message dispatch cost against the number of strategies")
+    parser.add_argument("--messages", type=int, default=50000)
+    args = parser.parse_args()
+
+    print(f"{'strategies':>10}{'scan us/msg':>14}{'index us/msg':>14}")
+
+    for count in (1, 50, 500):
+        router = StrategyRouter()
+        for i in range(count):
+            router.add(i, _Strategy(f"SYM{i}USDT"))
+
+        messages = [_message(f"SYM{i % count}USDT") for i in range(args.messages)]
+
+        scan = _time_per_message(dispatch_scan, router.strategies, messages)
+        index = _time_per_message(dispatch_index, router, messages)
+
+        print(f"{count:>10}{scan:>14.2f}{index:>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+# Memory and construction benchmark of the data models: bytes per object and objects built per second for the
+# slotted models of models.py ("after") and the former __dict__ based models branching on the exchange ("before").
+# Run from the repository root: python -m benchmarks.bench_models [--count N]
+
+import argparse
+import datetime
+import gc
+import time
+import tracemalloc
+import typing
+
+import dateutil.parser
+
+from models import Balance, Candle, Contract, OrderStatus, BITMEX_MULTIPLIER, BITMEX_TF_MINUTES, tick_to_decimals
+
+BINANCE_KLINE = [1611568800000, "32150.50", "32290.00", "32011.10", "32200.75", "1534.221", 1611568859999]
+BITMEX_BUCKET = {"timestamp": "2021-01-25T10:01:00.000Z", "symbol": "XBTUSD", "open": 32150.5, "high": 32290.0,
+                 "low": 32011.0, "close": 32200.5, "trades": 120, "volume": 1534221}
+BINANCE_SYMBOL = {"symbol": "BTCUSDT", "baseAsset": "BTC", "quoteAsset": "USDT", "marginAsset": "USDT",
+                  "pricePrecision": 2, "quantityPrecision": 3}
+BITMEX_INSTRUMENT = {"symbol": "XBTUSD", "rootSymbol": "XBT", "quoteCurrency": "USD", "tickSize": 0.5, "lotSize": 100,
+                     "isQuanto": False, "isInverse": True, "multiplier": -100000000}
+BINANCE_ORDER = {"orderId": 2712346, "status": "NEW", "avgPrice": "0.00000"}
+BITMEX_ORDER = {"orderID": "f7063268-fdff-4764-9dbb-bb36a395e75e", "ordStatus": "Filled", "avgPx": 32200.5}
+BINANCE_BALANCE = {"initialMargin": "10.5", "maintMargin": "1.2", "marginBalance": "1000.0",
+                   "walletBalance": "1000.0", "unrealizedProfit": "0.0"}
+BITMEX_BALANCE = {"initMargin": 1050, "maintMargin": 120, "marginBalance": 100000000, "walletBalance": 100000000,
+                  "unrealisedPnl": 0}
+
+
+# models as they were before the slotted rewrite, kept here as the reference of the comparison
+class LegacyBalance:
+    def __init__(self, info, exchange):
+        if exchange == "binance":
+            self.initial_margin = float(info['initialMargin'])
+            self.maintenance_margin = float(info['maintMargin'])
+            self.margin_balance = float(info['marginBalance'])
+            self.wallet_balance = float(info['walletBalance'])
+            self.unrealized_pnl = float(info['unrealizedProfit'])
+
+        elif exchange == "bitmex":
+            self.initial_margin = info['initMargin'] * BITMEX_MULTIPLIER
+            self.maintenance_margin = info['maintMargin'] * BITMEX_MULTIPLIER
+            self.margin_balance = info['marginBalance'] * BITMEX_MULTIPLIER
+            self.wallet_balance = info['walletBalance'] * BITMEX_MULTIPLIER
+            self.unrealized_pnl = info['unrealisedPnl'] * BITMEX_MULTIPLIER
+
+
+class LegacyCandle:
+    def __init__(self, candle_info, timeframe, exchange):
+        if exchange == "binance":
+            self.timestamp = candle_info[0]
+            self.open = float(candle_info[1])
+            self.high = float(candle_info[2])
+            self.low = float(candle_info[3])
+            self.close = float(candle_info[4])
+            self.volume = float(candle_info[5])
+
+        elif exchange == "bitmex":
+            self.timestamp = dateutil.parser.isoparse(candle_info['timestamp'])
+            self.timestamp = self.timestamp - datetime.timedelta(minutes=BITMEX_TF_MINUTES[timeframe])
+            self.timestamp = int(self.timestamp.timestamp() * 1000)
+            self.open = candle_info['open']
+            self.high = candle_info['high']
+            self.low = candle_info['low']
+            self.close = candle_info['close']
+            self.volume = candle_info['volume']
+
+
+class LegacyContract:
+    def __init__(self, contract_info, exchange):
+        if exchange == "binance":
+            self.symbol = contract_info['symbol']
+            self.base_asset = contract_info['baseAsset']
+            self.quote_asset = contract_info['quoteAsset']
+            self.price_decimals = contract_info['pricePrecision']
+            self.quantity_decimals = contract_info['quantityPrecision']
+            self.tick_size = 1 / pow(10, contract_info['pricePrecision'])
+            self.lot_size = 1 / pow(10, contract_info['quantityPrecision'])
+
+        elif exchange == "bitmex":
+            self.symbol = contract_info['symbol']
+            self.base_asset = contract_info['rootSymbol']
+            self.quote_asset = contract_info['quoteCurrency']
+            self.price_decimals = tick_to_decimals(contract_info['tickSize'])
+            self.quantity_decimals = tick_to_decimals(contract_info['lotSize'])
+            self.tick_size = contract_info['tickSize']
+            self.lot_size = contract_info['lotSize']
+            self.quanto = contract_info['isQuanto']
+            self.inverse = contract_info['isInverse']
+            self.multiplier = contract_info['multiplier'] * BITMEX_MULTIPLIER
+            if self.inverse:
+                self.multiplier *= -1
+
+
+class LegacyOrderStatus:
+    def __init__(self, order_info, exchange):
+        if exchange == "binance":
+            self.order_id = order_info['orderId']
+            self.status = order_info['status'].lower()
+            self.avg_price = float(order_info['avgPrice'])
+        elif exchange == "bitmex":
+            self.order_id = order_info['orderID']
+            self.status = order_info['ordStatus'].lower()
+            self.avg_price = order_info['avgPx']
+
+
+# name -> (before factory, after factory)
+CASES: typing.Dict[str, typing.Tuple[typing.Callable, typing.Callable]] = {
+    "Candle binance": (lambda: LegacyCandle(BINANCE_KLINE, "1m", "binance"),
+                       lambda: Candle.from_binance(BINANCE_KLINE)),
+    "Candle bitmex": (lambda: LegacyCandle(BITMEX_BUCKET, "1m", "bitmex"),
+                      lambda: Candle.from_bitmex(BITMEX_BUCKET, "1m")),
+    "Contract binance": (lambda: LegacyContract(BINANCE_SYMBOL, "binance"),
+                         lambda: Contract.from_binance(BINANCE_SYMBOL)),
+    "Contract bitmex": (lambda: LegacyContract(BITMEX_INSTRUMENT, "bitmex"),
+                        lambda: Contract.from_bitmex(BITMEX_INSTRUMENT)),
+    "OrderStatus binance": (lambda: LegacyOrderStatus(BINANCE_ORDER, "binance"),
+                            lambda: OrderStatus.from_binance(BINANCE_ORDER)),
+    "OrderStatus bitmex": (lambda: LegacyOrderStatus(BITMEX_ORDER, "bitmex"),
+                           lambda: OrderStatus.from_bitmex(BITMEX_ORDER)),
+    "Balance binance": (lambda: LegacyBalance(BINANCE_BALANCE, "binance"),
+                        lambda: Balance.from_binance(BINANCE_BALANCE)),
+    "Balance bitmex": (lambda: LegacyBalance(BITMEX_BALANCE, "bitmex"),
+                       lambda: Balance.from_bitmex(BITMEX_BALANCE)),
+}
+
+
+def bytes_per_object(factory: typing.Callable, count: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    objects = [factory() for _ in range(count)]
+
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # the list holding the objects is not part of the object cost
+    return (after - before - objects.__sizeof__()) / count
+
+
+def objects_per_second(factory: typing.Callable, count: int) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        factory()
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes per object and construction throughput of the models")
+    parser.add_argument("--count", type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f"{'model':<22}{'bytes before':>14}{'bytes after':>14}{'objs/s before':>16}{'objs/s after':>16}")
+
+    for name, (before, after) in CASES.items():
+        print(f"{name:<22}{bytes_per_object(before, args.count):>14.1f}{bytes_per_object(after, args.count):>14.1f}"
+              f"{objects_per_second(before, args.count):>16,.0f}{objects_per_second(after, args.count):>16,.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# Bitmex timestamp parsing: dateutil.parser.isoparse (former trade and candle paths) against models.iso_to_ms.
+# The timestamps follow a trade stream: many prints per minute, so the minute prefix cache is exercised the way
+# the websocket does. Run from the repository root: python -m benchmarks.bench_timeparse [--count N]
+
+import argparse
+import datetime
+import random
+import time
+import typing
+
+import dateutil.parser
+
+from models import iso_to_ms
+
+
+def dateutil_to_ms(timestamp: str) -> int:
+    return int(dateutil.parser.isoparse(timestamp).timestamp() * 1000)
+
+
+def trade_timestamps(count: int) -> typing.List[str]:
+    random.seed(1)
+    ts = datetime.datetime(2021, 1, 24, 10, 0, tzinfo=datetime.timezone.utc)
+    timestamps = []
+    for _ in range(count):
+        ts += datetime.timedelta(milliseconds=random.randint(0, 400))
+        timestamps.append(ts.strftime("%Y-%m-%dT%H:%M:%S.") + f"{ts.microsecond // 1000:03d}Z")
+    return timestamps
+
+
+def _time_per_call(func: typing.Callable, timestamps: typing.List[str]) -> float:
+    start = time.perf_counter()
+    for ts in timestamps:
+        func(ts)
+    return (time.perf_counter() - start) / len(timestamps) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bitmex ISO 8601 timestamp parsing cost")
+    parser.add_argument("--count", type=int, default=200000)
+    args = parser.parse_args()
+
+    timestamps = trade_timestamps(args.count)
+
+    # dateutil goes through a float and truncates, its result can be 1 ms below the exact value
+    mismatches = sum(1 for ts in timestamps if abs(iso_to_ms(ts) - dateutil_to_ms(ts)) > 1)
+
+    before = _time_per_call(dateutil_to_ms, timestamps)
+    after = _time_per_call(iso_to_ms, timestamps)
+
+    print(f"dateutil isoparse: {before:8.0f} ns/call")
+    print(f"iso_to_ms:         {after:8.0f} ns/call  ({before / after:.1f}x)")
+    print(f"mismatches over 1 ms: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
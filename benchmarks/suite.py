@@ -0,0 +1,366 @@
+# Benchmark suite of the tick-to-signal hot path, from the websocket frame to the strategy signal:
+# - parse_trades: trade in the current candle, trade starting the next candle, trade after a gap of missing candles
+# - TechnicalStrategy: _rsi, _macd and _check_signal on a newly closed candle, and the first call warming them up
+# - BreakoutStrategy.check_trade on a trade of the current candle
+# - Candle construction from a Binance kline and a Bitmex bucket
+# - _on_message of both connectors: frame decoding, dispatch and processing by the strategies (offline clients)
+# Each case runs at several candle history sizes or strategy counts. The results are written as JSON and compared
+# against a stored baseline, any case slower than the baseline by more than the threshold is reported as a regression
+# and the command exits with status 1. To keep the noise of the machine below the threshold, each time is the best of
+# several measurements taken after warm-up runs and spread over several passes of the suite, and the cases found
+# slower are measured again before being reported.
+# The times depend on the machine: the baseline is stored with --save-baseline on the machine the comparison runs on
+# (the deploy machine), a baseline from another machine only gives an idea.
+#
+# Run from the repository root:
+# python -m benchmarks.suite                       compare with benchmarks/baseline.json
+# python -m benchmarks.suite --save-baseline       store the results as the new baseline
+# python -m benchmarks.suite --output results.json --filter parse_trades
+
+import argparse
+import datetime
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import typing
+
+import numpy as np
+
+from candle_store import CandleStore, DEFAULT_CAPACITY
+from connectors.decoding import JSON_BACKEND
+from indicator_cache import IndicatorCache
+from models import Candle, Contract
+from strategies import TechnicalStrategy, BreakoutStrategy
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_SIZES = (100, 1000, 5000)
+DEFAULT_STRATEGY_COUNTS = (1, 10, 100)
+# a case is a regression when its time per operation is above the baseline by more than this fraction
+DEFAULT_THRESHOLD = 0.25
+# measurements per case in each round, the best one is kept, after untimed warm-up runs (first allocations, caches,
+# lazy imports)
+DEFAULT_REPEAT = 5
+DEFAULT_WARMUP = 2
+DEFAULT_ROUNDS = 3
+# passes over the groups of the cases found slower than the baseline, a busy period of the machine passes
+DEFAULT_RECHECKS = 2
+
+TIMEFRAME = "1m"
+TF_MS = 60000
+START_TS = 1611568800000
+TECHNICAL_PARAMS = {"rsi_length": 14, "ema_fast": 12, "ema_slow": 26, "ema_signal": 9}
+BREAKOUT_PARAMS = {"min_volume": 0.0}
+
+BINANCE_KLINE = [1611568800000, "32150.50", "32290.00", "32011.10", "32200.75", "1534.221", 1611568859999]
+BITMEX_BUCKET = {"timestamp": "2021-01-25T10:01:00.000Z", "symbol": "XBTUSD", "open": 32150.5, "high": 32290.0,
+                 "low": 32011.0, "close": 32200.5, "trades": 120, "volume": 1534221}
+
+
+# random walk candles, the last one closing inside the range of the previous one so Breakout has no signal
+def _history(size: int) -> CandleStore:
+    rng = np.random.default_rng(size)
+    closes = 100 + np.cumsum(rng.normal(0, 0.5, size))
+    opens = np.concatenate(([closes[0]], closes[:-1]))
+    highs = np.maximum(opens, closes) + 1
+    lows = np.minimum(opens, closes) - 1
+    closes[-1] = opens[-1] = (highs[-2] + lows[-2]) / 2
+    timestamps = START_TS + np.arange(size, dtype=np.int64) * TF_MS
+
+    return CandleStore.from_arrays(timestamps, opens, highs, lows, closes, rng.uniform(1, 10, size),
+                                   capacity=max(DEFAULT_CAPACITY, size))
+
+
+def _contract(symbol: str) -> Contract:
+    return Contract(symbol, "", "", 2, 3, 0.01, 0.001)
+
+
+def _strategy(strategy_class, size: int, client=None, symbol: str = "BTCUSDT"):
+    # each strategy computes its own indicators, a shared cache would serve them to the next strategies
+    if strategy_class is TechnicalStrategy:
+        strat = TechnicalStrategy(client, _contract(symbol), "binance", TIMEFRAME, 1, 1, 1, TECHNICAL_PARAMS,
+                                  indicator_cache=IndicatorCache())
+    else:
+        strat = BreakoutStrategy(client, _contract(symbol), "binance", TIMEFRAME, 1, 1, 1, BREAKOUT_PARAMS)
+    strat.candles = _history(size)
+    return strat
+
+
+# best time per operation in microseconds of `repeat` runs of run(), which performs `ops` operations. Like timeit,
+# the garbage collector is paused during the timed runs so a collection doesn't land in one of them
+def _measure(run: typing.Callable[[], None], ops: int, repeat: int, warmup: int = DEFAULT_WARMUP) -> float:
+    for _ in range(warmup):
+        run()
+
+    best = float("inf")
+    gc_enabled = gc.isenabled()
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - start)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    return best / ops * 1e6
+
+
+def bench_parse_trades(sizes: typing.Iterable[int], ops: int, repeat: int) -> typing.Dict[str, float]:
+    results = dict()
+
+    for size in sizes:
+        strat = _strategy(BreakoutStrategy, size)
+
+        def same_candle():
+            ts = strat.candles.last_timestamp + 1
+            for i in range(ops):
+                strat.parse_trades(100.0 + (i & 7), 0.1, ts)
+
+        def new_candle():
+            ts = strat.candles.last_timestamp
+            for _ in range(ops):
+                ts += TF_MS
+                strat.parse_trades(100.0, 0.1, ts)
+
+        def gap():
+            ts = strat.candles.last_timestamp
+            for _ in range(ops):
+                ts += 5 * TF_MS
+                strat.parse_trades(100.0, 0.1, ts)
+
+        results[f"parse_trades.same_candle[history={size}]"] = _measure(same_candle, ops, repeat)
+        results[f"parse_trades.new_candle[history={size}]"] = _measure(new_candle, ops, repeat)
+        results[f"parse_trades.gap[history={size}]"] = _measure(gap, ops, repeat)
+
+    return results
+
+
+def bench_technical(sizes: typing.Iterable[int], ops: int, repeat: int) -> typing.Dict[str, float]:
+    results = dict()
+
+    for size in sizes:
+        for name in ("_rsi", "_macd", "_check_signal"):
+            strat = _strategy(TechnicalStrategy, size)
+            method = getattr(strat, name)
+            method()
+
+            # a candle closes before each call, like check_trade() on a "new_candle" tick
+            def run():
+                candles = strat.candles
+                for i in range(ops):
+                    price = 100.0 + (i & 15)
+                    candles.append(candles.last_timestamp + TF_MS, price, price + 1, price - 1, price, 1.0)
+                    method()
+
+            results[f"technical.{name}[history={size}]"] = _measure(run, ops, repeat)
+
+        warm_ops = max(1, ops // 100)
+
+        # first signal of a strategy: the indicators are computed on the whole history
+        def warm_up():
+            for _ in range(warm_ops):
+                strat = TechnicalStrategy(None, _contract("BTCUSDT"), "binance", TIMEFRAME, 1, 1, 1, TECHNICAL_PARAMS,
+                                          indicator_cache=IndicatorCache())
+                strat.candles = history
+                strat._check_signal()
+
+        history = _history(size)
+        results[f"technical.warm_up[history={size}]"] = _measure(warm_up, warm_ops, repeat)
+
+    return results
+
+
+def bench_breakout(sizes: typing.Iterable[int], ops: int, repeat: int) -> typing.Dict[str, float]:
+    results = dict()
+
+    for size in sizes:
+        strat = _strategy(BreakoutStrategy, size)
+
+        def run():
+            for _ in range(ops):
+                strat.check_trade("same_candle")
+
+        results[f"breakout.check_trade[history={size}]"] = _measure(run, ops, repeat)
+
+    return results
+
+
+def bench_candles(ops: int, repeat: int) -> typing.Dict[str, float]:
+    def binance():
+        for _ in range(ops):
+            Candle.from_binance(BINANCE_KLINE)
+
+    def bitmex():
+        for _ in range(ops):
+            Candle.from_bitmex(BITMEX_BUCKET, TIMEFRAME)
+
+    return {"candle.from_binance": _measure(binance, ops, repeat), "candle.from_bitmex": _measure(bitmex, ops, repeat)}
+
+
+def _binance_frame(symbol: str, price: float, ts: int) -> str:
+    return json.dumps({"e": "aggTrade", "E": ts, "s": symbol, "a": 1, "p": f"{price:.2f}", "q": "0.010", "f": 1,
+                       "l": 1, "T": ts, "m": False}, separators=(",", ":"))
+
+
+def _bitmex_frame(symbol: str, price: float, ts: int, trades: int) -> str:
+    iso = datetime.datetime.fromtimestamp(ts / 1000, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+    data = [{"timestamp": iso + "Z", "symbol": symbol, "side": "Buy", "size": 100, "price": price,
+             "tickDirection": "ZeroPlusTick", "trdMatchID": "00000000-0000-0000-0000-000000000000",
+             "grossValue": 310000, "homeNotional": 0.0031, "foreignNotional": 100}] * trades
+    return json.dumps({"table": "trade", "action": "insert", "data": data}, separators=(",", ":"))
+
+
+# frames of the symbols traded by the strategies, all inside the current candle
+def bench_on_message(strategy_counts: typing.Iterable[int], ops: int, repeat: int) -> typing.Dict[str, float]:
+    from connectors.binance_futures import BinanceFuturesClient
+    from connectors.bitmex import BitmexClient
+
+    results = dict()
+
+    for exchange, client_class in (("binance", BinanceFuturesClient), ("bitmex", BitmexClient)):
+        for count in strategy_counts:
+            client = client_class("", "", True, connect=False)
+            symbols = [f"SYM{i}" for i in range(min(count, 10))]
+
+            for i in range(count):
+                client.add_strategy(i, _strategy(BreakoutStrategy, 100, client, symbols[i % len(symbols)]))
+
+            # the seeded history is flat around 100 with a range of +/- 1: a trade at 100 never breaks out
+            ts = START_TS + 99 * TF_MS + 1
+            if exchange == "binance":
+                frames = [_binance_frame(symbols[i % len(symbols)], 100.0, ts) for i in range(ops)]
+            else:
+                frames = [_bitmex_frame(symbols[i % len(symbols)], 100.0, ts, 5) for i in range(ops)]
+
+            def run():
+                for msg in frames:
+                    client._on_message(None, msg)
+                client.wait_idle()
+
+            results[f"on_message.{exchange}[strategies={count}]"] = _measure(run, ops, repeat)
+
+    return results
+
+
+# the measurements of a case are spread over `rounds` passes of the whole suite, the best one is kept: a slow period
+# of a shared machine lasting longer than the measurements of a case doesn't decide its time
+def run_suite(sizes: typing.Iterable[int], strategy_counts: typing.Iterable[int], ops: int,
+              repeat: int, name_filter: typing.Optional[str] = None,
+              rounds: int = DEFAULT_ROUNDS) -> typing.Dict[str, float]:
+    groups = {
+        "parse_trades": lambda: bench_parse_trades(sizes, ops, repeat),
+        "technical": lambda: bench_technical(sizes, ops, repeat),
+        "breakout": lambda: bench_breakout(sizes, ops, repeat),
+        "candle": lambda: bench_candles(ops, repeat),
+        "on_message": lambda: bench_on_message(strategy_counts, ops, repeat),
+    }
+
+    results = dict()
+    for _ in range(rounds):
+        for group, run in groups.items():
+            if name_filter is None or name_filter in group:
+                for name, value in run().items():
+                    results[name] = min(value, results.get(name, value))
+
+    return results
+
+
+# case -> (baseline us/op, current us/op, relative change) for the cases present in both runs
+def compare(results: typing.Dict[str, float], baseline: typing.Dict[str, float],
+            threshold: float) -> typing.Tuple[typing.Dict[str, typing.Tuple[float, float, float]], typing.List[str]]:
+    changes = dict()
+    regressions = []
+
+    for name, current in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        change = (current - before) / before if before > 0 else 0.0
+        changes[name] = (before, current, change)
+        if change > threshold:
+            regressions.append(name)
+
+    return changes, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tick-to-signal hot path benchmarks with baseline comparison")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="comma separated candle history sizes")
+    parser.add_argument("--strategies", default=",".join(str(s) for s in DEFAULT_STRATEGY_COUNTS),
+                        help="comma separated strategy counts of the _on_message cases")
+    parser.add_argument("--ops", type=int, default=2000, help="operations per measurement")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help="measurements per case in each round, the best one is kept")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS, help="passes of the whole suite")
+    parser.add_argument("--filter", default=None, help="only run the groups containing this text")
+    parser.add_argument("--output", default=None, help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--rechecks", type=int, default=DEFAULT_RECHECKS,
+                        help="measurements of the slower cases again before reporting them")
+    args = parser.parse_args()
+
+    # the benchmark trades are old: the trade lag warnings and the new candle logs would be measured too
+    logging.basicConfig(level=logging.ERROR)
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    strategy_counts = [int(s) for s in args.strategies.split(",")]
+
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    results = run_suite(sizes, strategy_counts, args.ops, args.repeat, args.filter, args.rounds)
+    changes, regressions = compare(results, baseline or dict(), args.threshold)
+
+    # a slower case is measured again: only the cases still slower after the rechecks are regressions
+    for _ in range(args.rechecks):
+        if len(regressions) == 0:
+            break
+        for group in sorted({name.split(".")[0] for name in regressions}):
+            for name, value in run_suite(sizes, strategy_counts, args.ops, args.repeat, group, 1).items():
+                results[name] = min(value, results[name])
+        changes, regressions = compare(results, baseline or dict(), args.threshold)
+
+    report = {"unit": "us/op",
+              "meta": {"date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                       "python": platform.python_version(), "machine": platform.machine(),
+                       "numpy": np.__version__, "json_backend": JSON_BACKEND, "ops": args.ops, "repeat": args.repeat,
+                       "warmup": DEFAULT_WARMUP, "rounds": args.rounds},
+              "results": {name: round(value, 4) for name, value in results.items()}}
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    print(f"{'case':<45}{'us/op':>12}{'baseline':>12}{'change':>10}")
+    for name, value in results.items():
+        if name in changes:
+            before, _, change = changes[name]
+            flag = "  REGRESSION" if name in regressions else ""
+            print(f"{name:<45}{value:>12.3f}{before:>12.3f}{change:>+10.1%}{flag}")
+        else:
+            print(f"{name:<45}{value:>12.3f}{'-':>12}{'-':>10}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif baseline is None:
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create it")
+    elif len(regressions) > 0:
+        print(f"{len(regressions)} case(s) slower than the baseline by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+import logging
+import time
+import typing
+
+from candle_store import CandleStore
+
+logger = logging.getLogger()
+
+
+# 3 cases: update same current candle, new candle, new candle + missing candles
+# by comparing the timestamp of the new trade with the timestamp of the most recent candle we have recorded.
+# Returns "same_candle" or "new_candle" and the number of flat candles added for the missing ones
+def fold_trade(candles: CandleStore, tf_ms: int, price: float, size: float, timestamp: int) -> typing.Tuple[str, int]:
+    last_ts = candles.last_timestamp
+
+    # Same Candle: update same current candle
+    if timestamp < last_ts + tf_ms:
+        candles.update_last(price, size)
+        return "same_candle", 0
+
+    return "new_candle", _add_candles(candles, tf_ms, price, size, timestamp, last_ts)
+
+
+# several trades of the same symbol at once (e.g. a Bitmex frame): the consecutive trades of the current candle
+# are folded into a single update of the candle. The candles are the same as calling fold_trade() for each
+# trade, but only one event is returned: "new_candle" if at least one candle was started, else "same_candle"
+def fold_trades(candles: CandleStore, tf_ms: int,
+                trades: typing.List[typing.Tuple[float, float, int]]) -> typing.Tuple[str, int]:
+    tick_type = "same_candle"
+    missing = 0
+
+    last_ts = candles.last_timestamp
+    high = low = close = None
+    volume = 0.0
+
+    for price, size, timestamp in trades:
+        if timestamp < last_ts + tf_ms:
+            if close is None:
+                high = low = price
+            elif price > high:
+                high = price
+            elif price < low:
+                low = price
+            close = price
+            volume += size
+        else:
+            if close is not None:
+                candles.merge_last(high, low, close, volume)
+                close = None
+                volume = 0.0
+
+            missing += _add_candles(candles, tf_ms, price, size, timestamp, last_ts)
+            last_ts = candles.last_timestamp
+            tick_type = "new_candle"
+
+    if close is not None:
+        candles.merge_last(high, low, close, volume)
+
+    return tick_type, missing
+
+
+def _add_candles(candles: CandleStore, tf_ms: int, price: float, size: float, timestamp: int, last_ts: int) -> int:
+    missing_candles = 0
+
+    # Missing Candle(s): flat at the last close price
+    if timestamp >= last_ts + 2 * tf_ms:
+        missing_candles = int((timestamp - last_ts) / tf_ms) - 1
+
+        last_close = candles.last_close
+        for missing in range(missing_candles):
+            last_ts += tf_ms
+            candles.append(last_ts, last_close, last_close, last_close, last_close, 0)
+
+    # New Candle
+    candles.append(last_ts + tf_ms, price, price, price, price, size)
+
+    return missing_candles
+
+
+def log_new_candles(exchange: str, symbol: str, timeframe: str, missing: int):
+    if missing > 0:
+        logger.info("%s missing %s candles for %s %s", exchange, missing, symbol, timeframe)
+    else:
+        logger.info("%s New candle for %s %s", exchange, symbol, timeframe)
+
+
+def check_latency(exchange: str, symbol: str, timestamp: int):
+    timestamp_diff = int(time.time() * 1000) - timestamp
+    if timestamp_diff >= 2000:
+        logger.warning("%s %s: %s milliseconds of difference between the current time and the trade time",
+                       exchange, symbol, timestamp_diff)
+        # if you see this msg to often means there is something wrong with check_signal that slows websocket updates
+
+
+class _Series:
+    def __init__(self, timeframe: str, tf_ms: int, candles: CandleStore):
+        self.timeframe = timeframe
+        self.tf_ms = tf_ms
+        self.candles = candles
+        self.users = 0
+        # the current candle of the base timeframe lies inside the current candle of this one
+        self.aligned = False
+
+
+# Candles of one symbol in every timeframe used by its strategies, built once per trade whatever the number of
+# strategies reading them: the strategies of a symbol and timeframe share the same CandleStore.
+# The trades are parsed into the smallest timeframe (the base), the higher timeframes follow it: while the base
+# candle doesn't change, the trades go straight into their current candle, their candle boundaries are only checked
+# when a new base candle opens.
+# update() is called from a single thread (the dispatcher worker of the symbol), add() / remove() from any other:
+# the timeframes are a copy-on-write tuple read without locking.
+class CandleAggregator:
+    def __init__(self, exchange: str, symbol: str):
+        self.exchange = exchange
+        self.symbol = symbol
+
+        self._series: typing.Tuple[_Series, ...] = tuple()
+
+    def __len__(self) -> int:
+        return len(self._series)
+
+    def timeframes(self) -> typing.List[str]:
+        return [s.timeframe for s in self._series]
+
+    def candles(self, timeframe: str) -> typing.Optional[CandleStore]:
+        for s in self._series:
+            if s.timeframe == timeframe:
+                return s.candles
+        return None
+
+    # one more user of the timeframe, `candles` (its history) is only kept when the timeframe isn't built yet.
+    # Returns the candles shared by the users of the timeframe
+    def add(self, timeframe: str, tf_ms: int, candles: CandleStore) -> CandleStore:
+        series = list(self._series)
+
+        for s in series:
+            if s.timeframe == timeframe:
+                s.users += 1
+                return s.candles
+
+        new = _Series(timeframe, tf_ms, candles)
+        new.users = 1
+        series.append(new)
+        series.sort(key=lambda s: s.tf_ms)
+
+        # a new base timeframe: the alignments are checked again on the next trade
+        for s in series:
+            s.aligned = False
+
+        self._series = tuple(series)
+
+        return candles
+
+    # one less user of the timeframe, it isn't built anymore after its last user
+    def remove(self, timeframe: str):
+        series = list(self._series)
+
+        for s in series:
+            if s.timeframe == timeframe:
+                s.users -= 1
+                if s.users == 0:
+                    series.remove(s)
+                    for other in series:
+                        other.aligned = False
+                break
+
+        self._series = tuple(series)
+
+    @staticmethod
+    def _aligned(s: _Series, base: _Series) -> bool:
+        base_ts = base.candles.last_timestamp
+        last_ts = s.candles.last_timestamp
+        return last_ts <= base_ts and base_ts + base.tf_ms <= last_ts + s.tf_ms
+
+    # timeframe -> "same_candle" / "new_candle"
+    def update(self, price: float, size: float, timestamp: int) -> typing.Dict[str, str]:
+        series = self._series
+        if len(series) == 0:
+            return dict()
+
+        check_latency(self.exchange, self.symbol, timestamp)
+
+        base = series[0]
+        base_tick, missing = fold_trade(base.candles, base.tf_ms, price, size, timestamp)
+        ticks = {base.timeframe: base_tick}
+        if base_tick == "new_candle":
+            log_new_candles(self.exchange, self.symbol, base.timeframe, missing)
+
+        for s in series[1:]:
+            if base_tick == "same_candle" and s.aligned:
+                s.candles.update_last(price, size)
+                ticks[s.timeframe] = "same_candle"
+                continue
+
+            tick_type, missing = fold_trade(s.candles, s.tf_ms, price, size, timestamp)
+            ticks[s.timeframe] = tick_type
+            if tick_type == "new_candle":
+                log_new_candles(self.exchange, self.symbol, s.timeframe, missing)
+
+            s.aligned = self._aligned(s, base)
+
+        return ticks
+
+    # several trades of the symbol at once, one event per timeframe (see fold_trades())
+    def update_batch(self, trades: typing.List[typing.Tuple[float, float, int]]) -> typing.Dict[str, str]:
+        series = self._series
+        if len(series) == 0:
+            return dict()
+
+        check_latency(self.exchange, self.symbol, trades[-1][2])
+
+        base = series[0]
+        base_tick, missing = fold_trades(base.candles, base.tf_ms, trades)
+        ticks = {base.timeframe: base_tick}
+        if base_tick == "new_candle":
+            log_new_candles(self.exchange, self.symbol, base.timeframe, missing)
+
+        high = low = None
+
+        for s in series[1:]:
+            if base_tick == "same_candle" and s.aligned:
+                if high is None:
+                    high = max(t[0] for t in trades)
+                    low = min(t[0] for t in trades)
+                    volume = sum(t[1] for t in trades)
+                s.candles.merge_last(high, low, trades[-1][0], volume)
+                ticks[s.timeframe] = "same_candle"
+                continue
+
+            tick_type, missing = fold_trades(s.candles, s.tf_ms, trades)
+            ticks[s.timeframe] = tick_type
+            if tick_type == "new_candle":
+                log_new_candles(self.exchange, self.symbol, s.timeframe, missing)
+
+            s.aligned = self._aligned(s, base)
+
+        return ticks
@@ -0,0 +1,162 @@
+import typing
+
+import numpy as np
+
+from models import Candle
+
+# default number of candles kept by a store: larger than one page of historical candles (1000 on Binance,
+# 500 on Bitmex) so the indicators warm up on the full download, and bounded so a long running strategy
+# doesn't keep allocating candles forever
+DEFAULT_CAPACITY = 5000
+
+
+# Bounded, columnar candle history (timestamp, open, high, low, close, volume).
+# Each row is written twice, at its ring position and at ring position + capacity, so the last len(store) rows
+# are always contiguous in memory: the column properties return zero-copy numpy views that indicators can read
+# directly. A view reflects the rows present when it was taken and must be requested again after an append.
+class CandleStore:
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        if capacity < 2:
+            raise ValueError("A candle store needs a capacity of at least 2 candles")
+
+        self.capacity = capacity
+
+        self._timestamps = np.zeros(2 * capacity, dtype=np.int64)
+        self._ohlcv = np.zeros((5, 2 * capacity), dtype=np.float64)
+
+        self._next = 0  # ring position of the next candle
+        self._size = 0
+
+    @classmethod
+    def from_candles(cls, candles: typing.Iterable[Candle], capacity: int = DEFAULT_CAPACITY) -> "CandleStore":
+        store = cls(capacity)
+        for candle in candles:
+            store.append(candle.timestamp, candle.open, candle.high, candle.low, candle.close, candle.volume)
+        return store
+
+    # bulk load of columns ordered by timestamp, only the last `capacity` rows are kept
+    @classmethod
+    def from_arrays(cls, timestamps: np.ndarray, opens: np.ndarray, highs: np.ndarray, lows: np.ndarray,
+                    closes: np.ndarray, volumes: np.ndarray, capacity: int = DEFAULT_CAPACITY) -> "CandleStore":
+        store = cls(capacity)
+
+        n = min(len(timestamps), capacity)
+        if n == 0:
+            return store
+
+        for offset in (0, capacity):
+            store._timestamps[offset:offset + n] = timestamps[-n:]
+            for row, column in enumerate((opens, highs, lows, closes, volumes)):
+                store._ohlcv[row, offset:offset + n] = column[-n:]
+
+        store._next = n % capacity
+        store._size = n
+
+        return store
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _bounds(self) -> typing.Tuple[int, int]:
+        end = self._next + self.capacity
+        return end - self._size, end
+
+    def _position(self, idx: int) -> int:
+        if idx < 0:
+            idx += self._size
+        if idx < 0 or idx >= self._size:
+            raise IndexError("candle index out of range")
+
+        return self._next + self.capacity - self._size + idx
+
+    # O(1): a new candle overwrites the oldest one when the store is full
+    def append(self, timestamp: int, open_: float, high: float, low: float, close: float, volume: float):
+        pos = self._next
+
+        for p in (pos, pos + self.capacity):
+            self._timestamps[p] = timestamp
+            self._ohlcv[:, p] = (open_, high, low, close, volume)
+
+        self._next = (pos + 1) % self.capacity
+        if self._size < self.capacity:
+            self._size += 1
+
+    def _last_position(self) -> int:
+        if self._size == 0:
+            raise IndexError("no current candle to update in an empty store")
+
+        return self._next - 1 if self._next > 0 else self.capacity - 1
+
+    # in place update of the current (last) candle with a new trade
+    def update_last(self, price: float, size: float):
+        pos = self._last_position()
+        ohlcv = self._ohlcv
+
+        for p in (pos, pos + self.capacity):
+            ohlcv[3, p] = price
+            ohlcv[4, p] += size
+
+            if price > ohlcv[1, p]:
+                ohlcv[1, p] = price
+            elif price < ohlcv[2, p]:
+                ohlcv[2, p] = price
+
+    # in place update of the current candle with several trades already folded together
+    def merge_last(self, high: float, low: float, close: float, volume: float):
+        pos = self._last_position()
+        ohlcv = self._ohlcv
+
+        for p in (pos, pos + self.capacity):
+            ohlcv[3, p] = close
+            ohlcv[4, p] += volume
+
+            if high > ohlcv[1, p]:
+                ohlcv[1, p] = high
+            if low < ohlcv[2, p]:
+                ohlcv[2, p] = low
+
+    def __getitem__(self, idx: int) -> Candle:
+        p = self._position(idx)
+        return Candle(int(self._timestamps[p]), *self._ohlcv[:, p].tolist())
+
+    def __iter__(self) -> typing.Iterator[Candle]:
+        for idx in range(self._size):
+            yield self[idx]
+
+    @property
+    def last_timestamp(self) -> int:
+        return int(self._timestamps[self._position(-1)])
+
+    @property
+    def last_close(self) -> float:
+        return float(self._ohlcv[3, self._position(-1)])
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        start, end = self._bounds()
+        return self._timestamps[start:end]
+
+    @property
+    def opens(self) -> np.ndarray:
+        start, end = self._bounds()
+        return self._ohlcv[0, start:end]
+
+    @property
+    def highs(self) -> np.ndarray:
+        start, end = self._bounds()
+        return self._ohlcv[1, start:end]
+
+    @property
+    def lows(self) -> np.ndarray:
+        start, end = self._bounds()
+        return self._ohlcv[2, start:end]
+
+    @property
+    def closes(self) -> np.ndarray:
+        start, end = self._bounds()
+        return self._ohlcv[3, start:end]
+
+    @property
+    def volumes(self) -> np.ndarray:
+        start, end = self._bounds()
+        return self._ohlcv[4, start:end]
@@ -0,0 +1,550 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+import typing
+
+from urllib.parse import urlencode
+
+import aiohttp
+
+from models import *
+
+from candle_store import CandleStore
+
+from strategies import TechnicalStrategy, BreakoutStrategy
+
+from connectors.aio_session import create_async_session, request_json, run_websocket
+from connectors.binance_futures import HISTORY_PAGE_SIZE, HISTORY_REQUESTS_PER_SECOND, LISTEN_KEY_KEEPALIVE
+from connectors.decoding import FrameDecoder
+from connectors.history import HistoryService
+from connectors.recorder import FrameRecorder
+from connectors.contracts import ContractCache, DEFAULT_TTL
+from connectors.balances import BalanceCache, DEFAULT_MAX_STALENESS, DEFAULT_RECONCILE_INTERVAL
+from connectors.orders import OrderTracker
+from connectors.dispatch import TradeDispatcher, DEFAULT_WORKERS, DEFAULT_QUEUE_SIZE
+from connectors.http_session import DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT
+from connectors.routing import StrategyRouter
+from connectors.subscriptions import DEFAULT_MAX_STREAMS
+from connectors.startup import StartupTimer
+
+logger = logging.getLogger()
+
+
+# asyncio version of BinanceFuturesClient: the REST requests, the market stream, the user data stream and the
+# periodic tasks (listen key keepalive, balance reconciliation, contract refresh) all run on one event loop instead of
+# a thread each. The coroutines keep the names and arguments of the BinanceFuturesClient methods, the strategies and
+# the interface use the client through connectors/sync_adapter.py.
+# The strategies still run on the dispatcher worker threads, the event loop only decodes the frames.
+class AsyncBinanceFuturesClient:
+    def __init__(self, public_key: str, secret_key: str, testnet: bool, pool_size: int = DEFAULT_POOL_SIZE,
+                 timeout: typing.Tuple[float, float] = DEFAULT_TIMEOUT,
+                 dispatch_workers: int = DEFAULT_WORKERS, dispatch_queue_size: int = DEFAULT_QUEUE_SIZE,
+                 dispatch_overflow: str = "block", base_url: typing.Optional[str] = None,
+                 wss_url: typing.Optional[str] = None, balance_max_staleness: float = DEFAULT_MAX_STALENESS,
+                 balance_reconcile_interval: float = DEFAULT_RECONCILE_INTERVAL, contracts_ttl: float = DEFAULT_TTL):
+        self._startup = StartupTimer("Binance")
+
+        if testnet:
+            self._base_url = "https://testnet.binancefuture.com"
+            self._wss_url = "wss://stream.binancefuture.com/ws"
+        else:
+            self._base_url = "https://fapi.binance.com"
+            self._wss_url = "wss://fstream.binance.com/ws"
+
+        if base_url is not None:
+            self._base_url = base_url
+        if wss_url is not None:
+            self._wss_url = wss_url
+
+        self._public_key = public_key
+        self._secret_key = secret_key
+
+        self._headers = {'X-MBX-APIKEY': self._public_key}
+
+        # created by start(), on the event loop
+        self._session: typing.Optional[aiohttp.ClientSession] = None
+        self._pool_size = pool_size
+        self._timeout = timeout
+        self._tasks: typing.List[asyncio.Task] = []
+
+        self.history = HistoryService(self, "binance", HISTORY_PAGE_SIZE, HISTORY_REQUESTS_PER_SECOND)
+
+        self._contracts = ContractCache("binance", None, ttl=contracts_ttl)
+
+        self._balances = BalanceCache("Binance", None, balance_max_staleness)
+        self._balance_reconcile_interval = balance_reconcile_interval
+        self.balances = self._balances.balances
+
+        self.prices = dict()
+        self._router = StrategyRouter()
+        self.strategies: typing.Dict[int, typing.Union[TechnicalStrategy, BreakoutStrategy]] = self._router.strategies
+
+        self.logs = []
+
+        self._ws_id = 1
+        self._ws: typing.Optional[aiohttp.ClientWebSocketResponse] = None
+        # stream -> number of users (strategies, watchlist rows), and streams subscribed on the current connection
+        self._stream_users: typing.Dict[str, int] = dict()
+        self._streams_lock = threading.Lock()
+        self._subscribed: typing.Set[str] = set()
+        self._loop: typing.Optional[asyncio.AbstractEventLoop] = None
+
+        self._decoder = FrameDecoder("e", ["aggTrade", "bookTicker", "kline"])
+
+        # interval -> callback of the candles closed on the kline streams, see watch_candles()
+        self._candle_callbacks: typing.Dict[str, typing.Callable[[str, Candle], None]] = dict()
+
+        # with "block" the market websocket isn't read while a queue is full (see run_websocket()), submit() never
+        # blocks the event loop the orders of the strategies are placed on
+        self._dispatcher = TradeDispatcher(self._router, "Binance", dispatch_workers, dispatch_queue_size,
+                                           dispatch_overflow)
+        self._dispatcher.start()
+
+        self._recorder: typing.Optional[FrameRecorder] = None
+
+        self._orders = OrderTracker("Binance", None)
+        self._user_decoder = FrameDecoder("e", ["ORDER_TRADE_UPDATE", "ACCOUNT_UPDATE", "listenKeyExpired"])
+        self._listen_key: typing.Optional[str] = None
+
+        self._startup.mark("init")
+
+    # loads the contracts and starts the connections and the periodic tasks, to be awaited on the event loop
+    async def start(self):
+        self._session = create_async_session(self._pool_size, self._timeout, self._headers)
+
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        start = time.monotonic()
+
+        loaded = await loop.run_in_executor(None, self._contracts.load_file)
+        if not loaded:
+            self._contracts.replace(await self.get_contracts())
+
+        self._contracts.loaded(time.monotonic() - start)
+        self._startup.mark("contracts")
+
+        for coro in (self._refresh_contracts(loaded), self._reconcile_balances(), self._keep_alive_listen_key(),
+                     run_websocket(self._session, "Binance", self._wss_url, self._on_open, self._on_message,
+                                   ready=self._dispatcher.has_room),
+                     run_websocket(self._session, "Binance user data stream", self._user_stream_url,
+                                   self._on_user_open, self._on_user_message, self._on_user_close)):
+            self._tasks.append(loop.create_task(coro))
+
+        logger.info("Binance Futures async client successfully started")
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+        if self._session is not None:
+            await self._session.close()
+
+    # a task cancelled by close(), forgotten once done
+    def _start_task(self, coro: typing.Coroutine):
+        task = self._loop.create_task(coro)
+        self._tasks.append(task)
+        task.add_done_callback(self._tasks.remove)
+
+    def _add_log(self, msg: str):
+        logger.info("%s", msg)
+        self.logs.append({"log": msg, "displayed": False})
+
+    @property
+    def contracts(self) -> typing.Dict[str, Contract]:
+        return self._contracts.contracts
+
+    def startup_stats(self) -> typing.Dict[str, float]:
+        return self._startup.stats()
+
+    def contract_stats(self) -> typing.Dict[str, typing.Union[int, float, str, None]]:
+        return self._contracts.stats()
+
+    def decoder_stats(self) -> typing.Dict[str, typing.Dict[str, float]]:
+        return self._decoder.stats()
+
+    def frame_rates(self) -> typing.Dict[str, float]:
+        return self._decoder.frame_rates()
+
+    def dispatch_stats(self) -> typing.Dict[str, typing.Union[int, typing.List[int]]]:
+        return self._dispatcher.stats()
+
+    # symbols and timeframes whose candles are built for the strategies
+    def candle_stats(self) -> typing.Dict[str, typing.Union[int, typing.Dict[str, typing.List[str]]]]:
+        return self._router.stats()
+
+    def wait_idle(self):
+        self._dispatcher.wait_idle()
+
+    def start_recording(self, directory: str):
+        self._recorder = FrameRecorder(directory, "binance")
+
+    def stop_recording(self):
+        recorder = self._recorder
+        self._recorder = None
+        if recorder is not None:
+            recorder.close()
+
+    def track_order(self, contract: Contract, order_id: int, callback: typing.Callable[[OrderStatus], None]):
+        self._orders.track(contract, order_id, callback)
+
+    def order_stats(self) -> typing.Dict[str, int]:
+        return {"pending": self._orders.pending(), "pushed": self._orders.pushed, "polled": self._orders.polled}
+
+    def balance_stats(self) -> typing.Dict[str, typing.Union[int, float, bool]]:
+        return self._balances.stats()
+
+    # called from the interface thread: the subscription changes are sent from the event loop
+    def add_strategy(self, b_index: int, strategy: typing.Union[TechnicalStrategy, BreakoutStrategy]):
+        self._router.add(b_index, strategy)
+        self._acquire_streams([strategy.contract], "aggTrade")
+
+    def remove_strategy(self, b_index: int):
+        strategy = self._router.remove(b_index)
+        if strategy is not None:
+            self._release_streams([strategy.contract], "aggTrade")
+
+    def watch(self, contract: Contract):
+        self._acquire_streams([contract], "bookTicker")
+
+    def unwatch(self, contract: Contract):
+        self._release_streams([contract], "bookTicker")
+
+    # see BinanceFuturesClient.watch_candles(), the callback runs on the event loop. The streams of this client share
+    # a single connection: the kline streams of a whole contract universe usually don't fit on it
+    def watch_candles(self, contracts: typing.List[Contract], interval: str,
+                      callback: typing.Callable[[str, Candle], None]):
+        with self._streams_lock:
+            if len(self._stream_users) + len(contracts) > DEFAULT_MAX_STREAMS:
+                raise ValueError(f"{len(contracts)} kline streams don't fit on the connection of the asyncio client "
+                                 f"({DEFAULT_MAX_STREAMS} streams), use BinanceFuturesClient")
+
+        self._candle_callbacks[interval] = callback
+        self._acquire_streams(contracts, "kline_" + interval)
+
+    def unwatch_candles(self, contracts: typing.List[Contract], interval: str):
+        self._release_streams(contracts, "kline_" + interval)
+
+    def _acquire_streams(self, contracts: typing.List[Contract], channel: str):
+        with self._streams_lock:
+            for contract in contracts:
+                stream = contract.symbol.lower() + "@" + channel
+                self._stream_users[stream] = self._stream_users.get(stream, 0) + 1
+
+        self._schedule_subscriptions()
+
+    def _release_streams(self, contracts: typing.List[Contract], channel: str):
+        with self._streams_lock:
+            for contract in contracts:
+                stream = contract.symbol.lower() + "@" + channel
+                users = self._stream_users.get(stream, 0)
+                if users > 1:
+                    self._stream_users[stream] = users - 1
+                elif users == 1:
+                    del self._stream_users[stream]
+
+        self._schedule_subscriptions()
+
+    def _schedule_subscriptions(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._update_subscriptions(), self._loop)
+
+    def _generate_signature(self, data: typing.Dict) -> str:
+        return hmac.new(self._secret_key.encode(), urlencode(data).encode(), hashlib.sha256).hexdigest()
+
+    async def _make_request(self, method: str, endpoint: str, data: typing.Dict):
+        return await request_json(self._session, method, self._base_url, endpoint, data)
+
+    async def get_contracts(self) -> typing.Dict[str, Contract]:
+        exchange_info = await self._make_request("GET", "/fapi/v1/exchangeInfo", dict())
+
+        contracts = dict()
+
+        if exchange_info is not None:
+            for contract_data in exchange_info['symbols']:
+                if contract_data['marginAsset'] != "BUSD":
+                    contracts[contract_data['symbol']] = Contract.from_binance(contract_data)
+
+        return contracts
+
+    async def _refresh_contracts(self, loaded: bool):
+        if loaded and self._contracts.expired():
+            self._contracts.replace(await self.get_contracts())
+
+        while True:
+            await asyncio.sleep(self._contracts.next_refresh())
+            self._contracts.replace(await self.get_contracts())
+
+    async def get_candles_page(self, contract: Contract, interval: str, start_time: typing.Optional[int] = None,
+                               end_time: typing.Optional[int] = None) -> typing.Optional[typing.List[Candle]]:
+        data = dict()
+        data['symbol'] = contract.symbol
+        data['interval'] = interval
+        data['limit'] = HISTORY_PAGE_SIZE
+
+        if start_time is not None:
+            data['startTime'] = start_time
+        if end_time is not None:
+            data['endTime'] = end_time
+
+        raw_candles = await self._make_request("GET", "/fapi/v1/klines", data)
+
+        if raw_candles is None:
+            return None
+
+        return [Candle.from_binance(c) for c in raw_candles]
+
+    async def get_historical_candles(self, contract: Contract, interval: str,
+                                     depth: int = HISTORY_PAGE_SIZE) -> CandleStore:
+        return await self.history.get_candles_async(contract, interval, depth)
+
+    # candles of a new strategy: the ones already built for another strategy of the symbol and timeframe, shared
+    # with it, else the history
+    async def get_strategy_candles(self, contract: Contract, interval: str) -> CandleStore:
+        candles = self._router.candles(contract.symbol, interval)
+        if candles is None:
+            candles = await self.get_historical_candles(contract, interval)
+        return candles
+
+    async def get_bid_ask(self, contract: Contract) -> typing.Dict[str, float]:
+        data = dict()
+        data['symbol'] = contract.symbol
+        ob_data = await self._make_request("GET", "/fapi/v1/ticker/bookTicker", data)
+
+        if ob_data is not None:
+            if contract.symbol not in self.prices:
+                self.prices[contract.symbol] = {'bid': float(ob_data['bidPrice']), 'ask': float(ob_data['askPrice'])}
+            else:
+                self.prices[contract.symbol]['bid'] = float(ob_data['bidPrice'])
+                self.prices[contract.symbol]['ask'] = float(ob_data['askPrice'])
+
+            return self.prices[contract.symbol]
+
+    async def get_balances(self) -> typing.Dict[str, Balance]:
+        data = dict()
+        data['timestamp'] = int(time.time() * 1000)
+        data['signature'] = self._generate_signature(data)
+
+        balances = dict()
+
+        account_data = await self._make_request("GET", "/fapi/v1/account", data)
+
+        if account_data is not None:
+            for a in account_data['assets']:
+                balances[a['asset']] = Balance.from_binance(a)
+
+        return balances
+
+    async def _reconcile_balances(self):
+        self._balances.replace(await self.get_balances())
+        self._startup.mark("balances")
+
+        while True:
+            await asyncio.sleep(self._balance_reconcile_interval)
+            self._balances.replace(await self.get_balances())
+
+    async def place_order(self, contract: Contract, order_type: str, quantity: float, side: str, price=None,
+                          tif=None) -> OrderStatus:
+        data = dict()
+        data['symbol'] = contract.symbol
+        data['side'] = side.upper()
+        data['quantity'] = round(round(quantity / contract.lot_size) * contract.lot_size, 8)
+        data['type'] = order_type
+
+        if price is not None:
+            data['price'] = round(round(price / contract.tick_size) * contract.tick_size, 8)
+
+        if tif is not None:
+            data['timeInForce'] = tif
+
+        data['timestamp'] = int(time.time() * 1000)
+        data['signature'] = self._generate_signature(data)
+
+        order_status = await self._make_request("POST", "/fapi/v1/order", data)
+
+        if order_status is not None:
+            order_status = OrderStatus.from_binance(order_status)
+
+        return order_status
+
+    async def cancel_order(self, contract: Contract, order_id: int) -> OrderStatus:
+        data = dict()
+        data['orderId'] = order_id
+        data['symbol'] = contract.symbol
+
+        data['timestamp'] = int(time.time() * 1000)
+        data['signature'] = self._generate_signature(data)
+
+        order_status = await self._make_request("DELETE", "/fapi/v1/order", data)
+
+        if order_status is not None:
+            order_status = OrderStatus.from_binance(order_status)
+
+        return order_status
+
+    async def get_order_status(self, contract: Contract, order_id: int) -> OrderStatus:
+        data = dict()
+        data['timestamp'] = int(time.time() * 1000)
+        data['symbol'] = contract.symbol
+        data['orderId'] = order_id
+        data['signature'] = self._generate_signature(data)
+
+        order_status = await self._make_request("GET", "/fapi/v1/order", data)
+
+        if order_status is not None:
+            order_status = OrderStatus.from_binance(order_status)
+
+        return order_status
+
+    async def _on_open(self, ws: aiohttp.ClientWebSocketResponse):
+        self._ws = ws
+        self._startup.mark("websocket")
+
+        # a new connection starts without any subscription
+        self._subscribed = set()
+        await self._update_subscriptions()
+
+    def _on_message(self, ws: aiohttp.ClientWebSocketResponse, msg: str):
+
+        recorder = self._recorder
+        if recorder is not None:
+            recorder.record(msg)
+
+        data = self._decoder.decode(msg)
+        if data is None:
+            return
+
+        if data.get('e') == "bookTicker":
+
+            symbol = data['s']
+
+            if symbol not in self.prices:
+                self.prices[symbol] = {'bid': float(data['b']), 'ask': float(data['a'])}
+            else:
+                self.prices[symbol]['bid'] = float(data['b'])
+                self.prices[symbol]['ask'] = float(data['a'])
+
+        elif data.get('e') == "aggTrade":
+
+            self._dispatcher.submit(data['s'], float(data['p']), float(data['q']), data['T'])
+
+        elif data.get('e') == "kline":
+
+            kline = data['k']
+            callback = self._candle_callbacks.get(kline['i'])
+            if kline['x'] and callback is not None:
+                callback(data['s'], Candle.from_binance_stream(kline))
+
+    # only the streams with users are subscribed, on a single connection: unlike BinanceFuturesClient the streams
+    # aren't spread over several connections, this client is meant for fewer than DEFAULT_MAX_STREAMS streams
+    async def subscribe_channel(self, contracts: typing.List[Contract], channel: str):
+        self._acquire_streams(contracts, channel)
+
+    async def unsubscribe_channel(self, contracts: typing.List[Contract], channel: str):
+        self._release_streams(contracts, channel)
+
+    # sends the difference between the streams with users and the streams subscribed
+    async def _update_subscriptions(self):
+        if self._ws is None or self._ws.closed:
+            return
+
+        with self._streams_lock:
+            wanted = set(self._stream_users.keys())
+        added = sorted(wanted - self._subscribed)
+        removed = sorted(self._subscribed - wanted)
+        self._subscribed = wanted
+
+        for method, streams in (("SUBSCRIBE", added), ("UNSUBSCRIBE", removed)):
+            if len(streams) == 0:
+                continue
+
+            data = dict()
+            data['method'] = method
+            data['params'] = streams
+            data['id'] = self._ws_id
+            self._ws_id += 1
+
+            try:
+                await self._ws.send_str(json.dumps(data))
+            except Exception as e:
+                logger.error("Websocket error while sending %s of %s streams: %s", method, len(streams), e)
+
+    # user data stream: a new listen key for every connection
+    async def _user_stream_url(self) -> typing.Optional[str]:
+        data = await self._make_request("POST", "/fapi/v1/listenKey", dict())
+
+        self._listen_key = data['listenKey'] if data is not None else None
+
+        if self._listen_key is not None:
+            return self._wss_url + "/" + self._listen_key
+
+    async def _keep_alive_listen_key(self):
+        while True:
+            await asyncio.sleep(LISTEN_KEY_KEEPALIVE)
+
+            if self._listen_key is not None:
+                await self._make_request("PUT", "/fapi/v1/listenKey", dict())
+
+    async def _on_user_open(self, ws: aiohttp.ClientWebSocketResponse):
+        self._startup.mark("user_stream")
+
+        # the updates of the orders placed and of the balances while disconnected may have been missed
+        self._balances.set_stream_up(True)
+        self._start_task(self._reload_balances())
+        self._start_task(self._resync_orders())
+
+    async def _reload_balances(self):
+        self._balances.replace(await self.get_balances())
+
+    # not awaited by _on_user_open(): the frames of the stream are read meanwhile
+    async def _resync_orders(self):
+        for contract, order_id in self._orders.pending_orders():
+            order_status = await self.get_order_status(contract, order_id)
+            if order_status is not None:
+                self._orders.on_polled(order_status)
+
+    def _on_user_close(self):
+        self._balances.set_stream_up(False)
+
+    def _on_user_message(self, ws: aiohttp.ClientWebSocketResponse, msg: str):
+
+        data = self._user_decoder.decode(msg)
+        if data is None:
+            return
+
+        if data.get('e') == "ORDER_TRADE_UPDATE":
+            self._orders.on_update(OrderStatus.from_binance_stream(data['o']))
+
+        elif data.get('e') == "ACCOUNT_UPDATE":
+            for b in data['a']['B']:
+                self._balances.on_update(b['a'], lambda balance, info=b: balance.update_from_binance_stream(info))
+
+        # the connection is closed and opened again with a new listen key
+        elif data.get('e') == "listenKeyExpired":
+            logger.warning("Binance listen key expired")
+            asyncio.ensure_future(ws.close())
+
+    async def get_trade_size(self, contract: Contract, price: float, balance_pct: float):
+
+        # cached balance, only requested over REST when too old
+        if self._balances.stale() and not self._balances.replace(await self.get_balances()):
+            self._balances.refresh_failed()
+            return None
+
+        balance = self._balances.balances.get('USDT')
+        if balance is None:
+            return None
+        balance = balance.wallet_balance
+
+        trade_size = (balance * balance_pct / 100) / price
+
+        trade_size = round(round(trade_size / contract.lot_size) * contract.lot_size, 8)
+
+        logger.info("Binance Futures current USDT balance = %s, trade size = %s", balance, trade_size)
+
+        return trade_size
@@ -0,0 +1,564 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+import typing
+
+from urllib.parse import urlencode
+
+import aiohttp
+
+from models import *
+
+from candle_store import CandleStore
+
+from strategies import TechnicalStrategy, BreakoutStrategy
+
+from connectors.aio_session import create_async_session, request_json, run_websocket
+from connectors.bitmex import HISTORY_PAGE_SIZE, HISTORY_REQUESTS_PER_SECOND
+from connectors.decoding import FrameDecoder
+from connectors.history import HistoryService
+from connectors.recorder import FrameRecorder
+from connectors.contracts import ContractCache, DEFAULT_TTL
+from connectors.balances import BalanceCache, DEFAULT_MAX_STALENESS, DEFAULT_RECONCILE_INTERVAL
+from connectors.orders import OrderTracker, OrderCache
+from connectors.dispatch import TradeDispatcher, DEFAULT_WORKERS, DEFAULT_QUEUE_SIZE
+from connectors.http_session import DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT
+from connectors.routing import StrategyRouter
+from connectors.startup import StartupTimer
+
+logger = logging.getLogger()
+
+
+# asyncio version of BitmexClient: the REST requests, the websocket and the periodic tasks (balance reconciliation,
+# contract refresh) all run on one event loop. The coroutines keep the names and arguments of the BitmexClient
+# methods, the strategies and the interface use the client through connectors/sync_adapter.py.
+class AsyncBitmexClient:
+    def __init__(self, public_key: str, secret_key: str, testnet: bool, pool_size: int = DEFAULT_POOL_SIZE,
+                 timeout: typing.Tuple[float, float] = DEFAULT_TIMEOUT,
+                 dispatch_workers: int = DEFAULT_WORKERS, dispatch_queue_size: int = DEFAULT_QUEUE_SIZE,
+                 dispatch_overflow: str = "block", base_url: typing.Optional[str] = None,
+                 wss_url: typing.Optional[str] = None, balance_max_staleness: float = DEFAULT_MAX_STALENESS,
+                 balance_reconcile_interval: float = DEFAULT_RECONCILE_INTERVAL, contracts_ttl: float = DEFAULT_TTL):
+        self._startup = StartupTimer("Bitmex")
+
+        if testnet:
+            self._base_url = "https://testnet.bitmex.com"
+            self._wss_url = "wss://testnet.bitmex.com/realtime"
+        else:
+            self._base_url = "https://www.bitmex.com"
+            self._wss_url = "wss://www.bitmex.com/realtime"
+
+        if base_url is not None:
+            self._base_url = base_url
+        if wss_url is not None:
+            self._wss_url = wss_url
+
+        self._public_key = public_key
+        self._secret_key = secret_key
+
+        # created by start(), on the event loop
+        self._session: typing.Optional[aiohttp.ClientSession] = None
+        self._pool_size = pool_size
+        self._timeout = timeout
+        self._tasks: typing.List[asyncio.Task] = []
+
+        self.history = HistoryService(self, "bitmex", HISTORY_PAGE_SIZE, HISTORY_REQUESTS_PER_SECOND)
+
+        self._ws: typing.Optional[aiohttp.ClientWebSocketResponse] = None
+
+        self._decoder = FrameDecoder("table", ["quote", "trade", "execution", "order", "margin"] +
+                                     ["tradeBin" + timeframe for timeframe in BITMEX_TF_MINUTES])
+
+        # timeframe -> callback of the buckets closed on the tradeBin tables, see watch_candles()
+        self._candle_callbacks: typing.Dict[str, typing.Callable[[str, Candle], None]] = dict()
+
+        # topic -> number of users, and topics subscribed on the current connection
+        self._topic_users: typing.Dict[str, int] = dict()
+        self._topics_lock = threading.Lock()
+        self._subscribed: typing.Set[str] = set()
+        self._loop: typing.Optional[asyncio.AbstractEventLoop] = None
+
+        self._contracts = ContractCache("bitmex", None, ttl=contracts_ttl)
+
+        self._balances = BalanceCache("Bitmex", None, balance_max_staleness)
+        self._balance_reconcile_interval = balance_reconcile_interval
+        self.balances = self._balances.balances
+
+        self.prices = dict()
+        self._router = StrategyRouter()
+        self.strategies: typing.Dict[int, typing.Union[TechnicalStrategy, BreakoutStrategy]] = self._router.strategies
+
+        self.logs = []
+
+        # with "block" the market websocket isn't read while a queue is full (see run_websocket()), submit() never
+        # blocks the event loop the orders of the strategies are placed on
+        self._dispatcher = TradeDispatcher(self._router, "Bitmex", dispatch_workers, dispatch_queue_size,
+                                           dispatch_overflow)
+        self._dispatcher.start()
+
+        self._recorder: typing.Optional[FrameRecorder] = None
+
+        self._orders = OrderTracker("Bitmex", None)
+        self._order_cache = OrderCache()
+
+        self._startup.mark("init")
+
+    # loads the contracts and starts the connection and the periodic tasks, to be awaited on the event loop
+    async def start(self):
+        self._session = create_async_session(self._pool_size, self._timeout)
+
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        start = time.monotonic()
+
+        loaded = await loop.run_in_executor(None, self._contracts.load_file)
+        if not loaded:
+            self._contracts.replace(await self.get_contracts())
+
+        self._contracts.loaded(time.monotonic() - start)
+        self._startup.mark("contracts")
+
+        for coro in (self._refresh_contracts(loaded), self._reconcile_balances(),
+                     run_websocket(self._session, "Bitmex", self._wss_url, self._on_open, self._on_message,
+                                   self._on_close, self._dispatcher.has_room)):
+            self._tasks.append(loop.create_task(coro))
+
+        logger.info("Bitmex async client successfully started")
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+        if self._session is not None:
+            await self._session.close()
+
+    # a task cancelled by close(), forgotten once done
+    def _start_task(self, coro: typing.Coroutine):
+        task = self._loop.create_task(coro)
+        self._tasks.append(task)
+        task.add_done_callback(self._tasks.remove)
+
+    def _add_log(self, msg: str):
+        logger.info("%s", msg)
+        self.logs.append({"log": msg, "displayed": False})
+
+    @property
+    def contracts(self) -> typing.Dict[str, Contract]:
+        return self._contracts.contracts
+
+    def startup_stats(self) -> typing.Dict[str, float]:
+        return self._startup.stats()
+
+    def contract_stats(self) -> typing.Dict[str, typing.Union[int, float, str, None]]:
+        return self._contracts.stats()
+
+    def decoder_stats(self) -> typing.Dict[str, typing.Dict[str, float]]:
+        return self._decoder.stats()
+
+    def frame_rates(self) -> typing.Dict[str, float]:
+        return self._decoder.frame_rates()
+
+    def dispatch_stats(self) -> typing.Dict[str, typing.Union[int, typing.List[int]]]:
+        return self._dispatcher.stats()
+
+    # symbols and timeframes whose candles are built for the strategies
+    def candle_stats(self) -> typing.Dict[str, typing.Union[int, typing.Dict[str, typing.List[str]]]]:
+        return self._router.stats()
+
+    def wait_idle(self):
+        self._dispatcher.wait_idle()
+
+    def start_recording(self, directory: str):
+        self._recorder = FrameRecorder(directory, "bitmex")
+
+    def stop_recording(self):
+        recorder = self._recorder
+        self._recorder = None
+        if recorder is not None:
+            recorder.close()
+
+    def track_order(self, contract: Contract, order_id: str, callback: typing.Callable[[OrderStatus], None]):
+        self._orders.track(contract, order_id, callback)
+
+    def order_stats(self) -> typing.Dict[str, int]:
+        return {"pending": self._orders.pending(), "pushed": self._orders.pushed, "polled": self._orders.polled}
+
+    def order_cache_stats(self) -> typing.Dict[str, typing.Union[int, float]]:
+        return self._order_cache.stats()
+
+    def balance_stats(self) -> typing.Dict[str, typing.Union[int, float, bool]]:
+        return self._balances.stats()
+
+    def subscription_stats(self) -> typing.Dict[str, typing.Union[int, typing.List[str]]]:
+        with self._topics_lock:
+            return {"topics": len(self._topic_users), "subscribed": sorted(self._topic_users.keys())}
+
+    # called from the interface thread: the subscription changes are sent from the event loop
+    def add_strategy(self, b_index: int, strategy: typing.Union[TechnicalStrategy, BreakoutStrategy]):
+        self._router.add(b_index, strategy)
+        self._acquire_topic("trade:" + strategy.contract.symbol)
+
+    def remove_strategy(self, b_index: int):
+        strategy = self._router.remove(b_index)
+        if strategy is not None:
+            self._release_topic("trade:" + strategy.contract.symbol)
+
+    def watch(self, contract: Contract):
+        self._acquire_topic("quote:" + contract.symbol)
+
+    def unwatch(self, contract: Contract):
+        self._release_topic("quote:" + contract.symbol)
+
+    # see BitmexClient.watch_candles(), the callback runs on the event loop
+    def watch_candles(self, contracts: typing.List[Contract], timeframe: str,
+                      callback: typing.Callable[[str, Candle], None]):
+        if timeframe not in BITMEX_TF_MINUTES:
+            raise ValueError(f"Bitmex doesn't provide {timeframe} candles")
+
+        self._candle_callbacks[timeframe] = callback
+        for contract in contracts:
+            self._acquire_topic("tradeBin" + timeframe + ":" + contract.symbol)
+
+    def unwatch_candles(self, contracts: typing.List[Contract], timeframe: str):
+        for contract in contracts:
+            self._release_topic("tradeBin" + timeframe + ":" + contract.symbol)
+
+    def _acquire_topic(self, topic: str):
+        with self._topics_lock:
+            self._topic_users[topic] = self._topic_users.get(topic, 0) + 1
+
+        self._schedule_subscriptions()
+
+    def _release_topic(self, topic: str):
+        with self._topics_lock:
+            users = self._topic_users.get(topic, 0)
+            if users > 1:
+                self._topic_users[topic] = users - 1
+            elif users == 1:
+                del self._topic_users[topic]
+
+        self._schedule_subscriptions()
+
+    def _schedule_subscriptions(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._update_subscriptions(), self._loop)
+
+    def _generate_signature(self, method: str, endpoint: str, expires: str, data: typing.Dict) -> str:
+
+        message = method + endpoint + "?" + urlencode(data) + expires if len(data) > 0 else method + endpoint + expires
+        return hmac.new(self._secret_key.encode(), message.encode(), hashlib.sha256).hexdigest()
+
+    async def _make_request(self, method: str, endpoint: str, data: typing.Dict):
+        headers = dict()
+        expires = str(int(time.time()) + 5)
+        headers['api-expires'] = expires
+        headers['api-key'] = self._public_key
+        headers['api-signature'] = self._generate_signature(method, endpoint, expires, data)
+
+        return await request_json(self._session, method, self._base_url, endpoint, data, headers)
+
+    async def get_contracts(self) -> typing.Dict[str, Contract]:
+
+        instruments = await self._make_request("GET", "/api/v1/instrument/active", dict())
+
+        contracts = dict()
+
+        if instruments is not None:
+            for s in instruments:
+                contracts[s['symbol']] = Contract.from_bitmex(s)
+
+        return contracts
+
+    async def _refresh_contracts(self, loaded: bool):
+        if loaded and self._contracts.expired():
+            self._contracts.replace(await self.get_contracts())
+
+        while True:
+            await asyncio.sleep(self._contracts.next_refresh())
+            self._contracts.replace(await self.get_contracts())
+
+    async def get_balances(self) -> typing.Dict[str, Balance]:
+        data = dict()
+        data['currency'] = "all"
+
+        margin_data = await self._make_request("GET", "/api/v1/user/margin", data)
+
+        balances = dict()
+
+        if margin_data is not None:
+            for a in margin_data:
+                balances[a['currency']] = Balance.from_bitmex(a)
+
+        return balances
+
+    async def _reconcile_balances(self):
+        self._balances.replace(await self.get_balances())
+        self._startup.mark("balances")
+
+        while True:
+            await asyncio.sleep(self._balance_reconcile_interval)
+            self._balances.replace(await self.get_balances())
+
+    async def get_candles_page(self, contract: Contract, timeframe: str, start_time: typing.Optional[int] = None,
+                               end_time: typing.Optional[int] = None) -> typing.Optional[typing.List[Candle]]:
+        if timeframe not in BITMEX_TF_MINUTES:
+            logger.error("Bitmex doesn't provide %s candles", timeframe)
+            return None
+
+        data = dict()
+
+        data['symbol'] = contract.symbol
+        data['partial'] = True
+        data['binSize'] = timeframe
+        data['count'] = HISTORY_PAGE_SIZE
+
+        if start_time is None and end_time is None:
+            data['reverse'] = True
+        if start_time is not None:
+            data['startTime'] = ms_to_iso(start_time + BITMEX_TF_MINUTES[timeframe] * 60000)
+        if end_time is not None:
+            data['endTime'] = ms_to_iso(end_time + BITMEX_TF_MINUTES[timeframe] * 60000)
+
+        raw_candles = await self._make_request("GET", "/api/v1/trade/bucketed", data)
+
+        if raw_candles is None:
+            return None
+
+        if data.get('reverse'):
+            raw_candles = reversed(raw_candles)
+
+        return [Candle.from_bitmex(c, timeframe) for c in raw_candles]
+
+    async def get_historical_candles(self, contract: Contract, timeframe: str,
+                                     depth: int = HISTORY_PAGE_SIZE) -> CandleStore:
+        return await self.history.get_candles_async(contract, timeframe, depth)
+
+    # candles of a new strategy: the ones already built for another strategy of the symbol and timeframe, shared
+    # with it, else the history
+    async def get_strategy_candles(self, contract: Contract, timeframe: str) -> CandleStore:
+        candles = self._router.candles(contract.symbol, timeframe)
+        if candles is None:
+            candles = await self.get_historical_candles(contract, timeframe)
+        return candles
+
+    async def place_order(self, contract: Contract, order_type: str, quantity: float, side: str, price=None,
+                          tif=None) -> OrderStatus:
+        data = dict()
+
+        data['symbol'] = contract.symbol
+        data['side'] = side.capitalize()
+        data['orderQty'] = round(quantity / contract.lot_size) * contract.lot_size
+        data['ordType'] = order_type.capitalize()
+
+        if price is not None:
+            data['price'] = round(round(price / contract.tick_size) * contract.tick_size, 8)
+
+        if tif is not None:
+            data['timeInForce'] = tif
+
+        order_status = await self._make_request("POST", "/api/v1/order", data)
+
+        if order_status is not None:
+            order_status = OrderStatus.from_bitmex(order_status)
+            self._order_cache.update(order_status)
+
+        return order_status
+
+    async def cancel_order(self, order_id: str) -> OrderStatus:
+        data = dict()
+        data['orderID'] = order_id
+
+        order_status = await self._make_request("DELETE", "/api/v1/order", data)
+
+        if order_status is not None:
+            order_status = OrderStatus.from_bitmex(order_status[0])
+            self._order_cache.update(order_status)
+
+        return order_status
+
+    async def get_order_status(self, contract: Contract, order_id: str) -> OrderStatus:
+
+        order_status = self._order_cache.get(order_id)
+        if order_status is not None:
+            return order_status
+
+        data = dict()
+        data['symbol'] = contract.symbol
+        data['filter'] = json.dumps({"orderID": order_id})
+        data['count'] = 1
+
+        orders = await self._make_request("GET", "/api/v1/order", data)
+
+        if orders is not None and len(orders) > 0:
+            order_status = OrderStatus.from_bitmex(orders[0])
+            self._order_cache.update(order_status)
+            return order_status
+
+    async def _on_open(self, ws: aiohttp.ClientWebSocketResponse):
+        self._ws = ws
+        self._startup.mark("websocket")
+
+        await self._authenticate()
+
+        # a new connection starts without any subscription
+        self._subscribed = set()
+        await self._send_topics("subscribe", ["execution", "order", "margin"])
+        await self._update_subscriptions()
+
+        # the updates of the orders placed while disconnected may have been missed
+        self._order_cache.invalidate_open()
+        self._start_task(self._resync_orders())
+
+    # not awaited by _on_open(): the frames of the connection are read meanwhile
+    async def _resync_orders(self):
+        for contract, order_id in self._orders.pending_orders():
+            order_status = await self.get_order_status(contract, order_id)
+            if order_status is not None:
+                self._orders.on_polled(order_status)
+
+    def _on_close(self):
+        self._order_cache.invalidate_open()
+        self._balances.set_stream_up(False)
+
+    def _on_message(self, ws: aiohttp.ClientWebSocketResponse, msg: str):
+
+        recorder = self._recorder
+        if recorder is not None:
+            recorder.record(msg)
+
+        data = self._decoder.decode(msg)
+        if data is None:
+            return
+
+        if "table" in data:
+            if data['table'] == "quote":
+
+                for d in data['data']:
+                    self.prices[d['symbol']] = {'bid': d.get('bidPrice'), 'ask': d.get('askPrice')}
+
+            # the "partial" answering a subscription repeats trades already in the candles
+            elif data['table'] == "trade" and data.get('action') != "partial":
+
+                batches = dict()
+
+                for d in data['data']:
+
+                    if len(self._router.get(d['symbol'])) == 0:
+                        continue
+
+                    trade = (float(d['price']), float(d['size']), iso_to_ms(d['timestamp']))
+
+                    if d['symbol'] in batches:
+                        batches[d['symbol']].append(trade)
+                    else:
+                        batches[d['symbol']] = [trade]
+
+                for symbol, trades in batches.items():
+                    self._dispatcher.submit_batch(symbol, trades)
+
+            # buckets closed, the "partial" answering a subscription repeats the last one
+            elif data['table'].startswith("tradeBin"):
+
+                timeframe = data['table'][len("tradeBin"):]
+                callback = self._candle_callbacks.get(timeframe)
+                if callback is not None:
+                    for d in data['data']:
+                        callback(d['symbol'], Candle.from_bitmex(d, timeframe))
+
+            elif data['table'] in ("execution", "order"):
+
+                for d in data['data']:
+                    if 'ordStatus' in d:
+                        self._orders.on_update(self._order_cache.update(OrderStatus.from_bitmex(d)))
+
+            elif data['table'] == "margin":
+
+                for d in data['data']:
+                    self._balances.on_update(d['currency'], lambda balance, info=d: balance.update_from_bitmex(info))
+
+        # answer of the authentication: the balances missed while disconnected are requested once
+        elif data.get('request', {}).get('op') == "authKeyExpires":
+            if data.get('success'):
+                self._startup.mark("authenticated")
+                self._balances.set_stream_up(True)
+                self._start_task(self._reload_balances())
+            else:
+                logger.error("Bitmex websocket authentication failed: %s", data.get('error'))
+
+    async def _reload_balances(self):
+        self._balances.replace(await self.get_balances())
+
+    async def _authenticate(self):
+        expires = int(time.time()) + 5
+
+        data = dict()
+        data['op'] = "authKeyExpires"
+        data['args'] = [self._public_key, expires, self._generate_signature("GET", "/realtime", str(expires), dict())]
+
+        try:
+            await self._ws.send_str(json.dumps(data))
+        except Exception as e:
+            logger.error("Websocket error while authenticating: %s", e)
+
+    # a table ("trade") or a table scoped to a symbol ("trade:XBTUSD"), see BitmexClient.subscribe_channel()
+    async def subscribe_channel(self, topic: str):
+        self._acquire_topic(topic)
+
+    async def unsubscribe_channel(self, topic: str):
+        self._release_topic(topic)
+
+    # sends the difference between the topics with users and the topics subscribed
+    async def _update_subscriptions(self):
+        if self._ws is None or self._ws.closed:
+            return
+
+        with self._topics_lock:
+            wanted = set(self._topic_users.keys())
+        added = sorted(wanted - self._subscribed)
+        removed = sorted(self._subscribed - wanted)
+        self._subscribed = wanted
+
+        if len(added) > 0:
+            await self._send_topics("subscribe", added)
+        if len(removed) > 0:
+            await self._send_topics("unsubscribe", removed)
+
+    async def _send_topics(self, op: str, topics: typing.List[str]):
+        data = dict()
+        data['op'] = op
+        data['args'] = topics
+
+        try:
+            await self._ws.send_str(json.dumps(data))
+        except Exception as e:
+            logger.error("Websocket error while sending %s of %s: %s", op, topics, e)
+
+    async def get_trade_size(self, contract: Contract, price: float, balance_pct: float):
+
+        # cached balance, only requested over REST when too old
+        if self._balances.stale() and not self._balances.replace(await self.get_balances()):
+            self._balances.refresh_failed()
+            return None
+
+        balance = self._balances.balances.get('XBt')
+        if balance is None:
+            return None
+        balance = balance.wallet_balance
+
+        xbt_size = balance * balance_pct / 100
+
+        # value of a contract in XBT, see BitmexClient.get_trade_size()
+        if contract.inverse:
+            contracts_number = xbt_size / (contract.multiplier / price)
+        else:
+            contracts_number = xbt_size / (contract.multiplier * price)
+
+        logger.info("Bitmex current XBT balance = %s, contracts number = %s", balance, contracts_number)
+
+        return int(contracts_number)
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import typing
+
+from urllib.parse import urlencode
+
+import aiohttp
+import yarl
+
+from connectors.http_session import DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT
+
+logger = logging.getLogger()
+
+# seconds between two pings of the websocket connections, a connection without answer is closed and opened again
+WS_HEARTBEAT = 30
+WS_RECONNECT_DELAY = 2
+# seconds between two checks of a full consumer before the next frame is read
+WS_BACKPRESSURE_DELAY = 0.01
+
+# REST and websocket I/O of the asyncio connectors (connectors/aio_binance_futures.py, connectors/aio_bitmex.py):
+# one aiohttp session per connector, its keep-alive connections are shared by every request and websocket.
+
+
+# to be called from the event loop, the session is bound to it
+def create_async_session(pool_size: int = DEFAULT_POOL_SIZE, timeout: typing.Tuple[float, float] = DEFAULT_TIMEOUT,
+                         headers: typing.Optional[typing.Dict[str, str]] = None) -> aiohttp.ClientSession:
+
+    connector = aiohttp.TCPConnector(limit=pool_size)
+    client_timeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+
+    return aiohttp.ClientSession(connector=connector, timeout=client_timeout, headers=headers)
+
+
+# JSON answer of the request, None when it failed (logged).
+# The query string is encoded with urlencode() like the signatures are, aiohttp must not quote it again.
+async def request_json(session: aiohttp.ClientSession, method: str, base_url: str, endpoint: str, data: typing.Dict,
+                       headers: typing.Optional[typing.Dict[str, str]] = None) -> typing.Any:
+    url = base_url + endpoint
+    if len(data) > 0:
+        url += "?" + urlencode(data)
+
+    try:
+        async with session.request(method, yarl.URL(url, encoded=True), headers=headers) as response:
+            status = response.status
+            body = await response.json(content_type=None)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error("Connection error while making %s request to %s: %s", method, endpoint, e)
+        return None
+
+    if status == 200:
+        return body
+    else:
+        logger.error("Error while making %s request to %s: %s (error code %s)", method, endpoint, body, status)
+        return None
+
+
+# keeps a websocket connection open until the task is cancelled: on_open() is awaited after every (re)connection,
+# on_message() is called with the text frames and on_close() once the connection is lost.
+# url is a coroutine function when the address changes between connections (Binance listen keys), None skips a try.
+# While ready() is False the next frame isn't read: the frames wait in the socket buffers, the event loop doesn't.
+async def run_websocket(session: aiohttp.ClientSession, name: str,
+                        url: typing.Union[str, typing.Callable[[], typing.Awaitable[typing.Optional[str]]]],
+                        on_open: typing.Callable[[aiohttp.ClientWebSocketResponse], typing.Awaitable[None]],
+                        on_message: typing.Callable[[aiohttp.ClientWebSocketResponse, str], None],
+                        on_close: typing.Optional[typing.Callable[[], None]] = None,
+                        ready: typing.Optional[typing.Callable[[], bool]] = None):
+    while True:
+        address = url if isinstance(url, str) else await url()
+
+        if address is not None:
+            try:
+                async with session.ws_connect(address, heartbeat=WS_HEARTBEAT, max_msg_size=0) as ws:
+                    logger.info("%s connection opened", name)
+                    await on_open(ws)
+
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            on_message(ws, msg.data)
+                            if ready is not None:
+                                while not ready():
+                                    await asyncio.sleep(WS_BACKPRESSURE_DELAY)
+                        elif msg.type == aiohttp.WSMsgType.ERROR:
+                            logger.error("%s connection error: %s", name, ws.exception())
+                            break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("%s connection error: %s", name, e)
+
+            logger.warning("%s connection closed", name)
+            if on_close is not None:
+                on_close()
+
+        await asyncio.sleep(WS_RECONNECT_DELAY)
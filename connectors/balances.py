@@ -0,0 +1,132 @@
+import logging
+import math
+import threading
+import time
+import typing
+
+from models import Balance
+
+logger = logging.getLogger()
+
+# seconds a balance can be used without confirmation, once the account stream is disconnected
+DEFAULT_MAX_STALENESS = 30.0
+# seconds between two REST requests of the balances, correcting anything the stream missed
+DEFAULT_RECONCILE_INTERVAL = 300.0
+
+
+# Balances of a connector kept current from the account updates pushed by the exchange, so that get_trade_size()
+# doesn't need a REST request when a signal fires.
+# While the account stream is connected the balances are up to date by definition. Once it is disconnected, they age
+# from the time of the disconnection (or of the last update since) and a REST request refreshes them when they are
+# older than max_staleness. A background thread also refreshes them over REST every reconcile_interval seconds.
+class BalanceCache:
+    # fetch is None for the asyncio connectors, they request the balances themselves when stale() and pass them
+    # to replace()
+    def __init__(self, name: str, fetch: typing.Optional[typing.Callable[[], typing.Dict[str, Balance]]],
+                 max_staleness: float = DEFAULT_MAX_STALENESS,
+                 reconcile_interval: float = DEFAULT_RECONCILE_INTERVAL):
+        self._name = name
+        self._fetch = fetch
+        self.max_staleness = max_staleness
+        self._reconcile_interval = reconcile_interval
+
+        self._lock = threading.Lock()
+        # asset -> balance, the connector exposes this dictionary as its balances attribute
+        self.balances: typing.Dict[str, Balance] = dict()
+
+        self._confirmed: typing.Optional[float] = None
+        self._stream_up = False
+        self._stream_down_since: typing.Optional[float] = None
+
+        self.stream_updates = 0
+        self.refreshes = 0
+        self.stale_reads = 0
+
+    def start(self):
+        t = threading.Thread(target=self._reconcile, name=f"{self._name} balances", daemon=True)
+        t.start()
+
+    def _reconcile(self):
+        while True:
+            time.sleep(self._reconcile_interval)
+            self.refresh()
+
+    # REST request of the balances, False when it failed
+    def refresh(self) -> bool:
+        return self.replace(self._fetch())
+
+    # refresh() in a thread of its own, for the websocket callbacks: the frames received meanwhile don't wait for the
+    # REST request
+    def refresh_in_background(self):
+        t = threading.Thread(target=self.refresh, name=f"{self._name} balances refresh", daemon=True)
+        t.start()
+
+    # balances returned by a REST request, False when it failed
+    def replace(self, balances: typing.Dict[str, Balance]) -> bool:
+        # get_balances() returns an empty dictionary when the request failed
+        if len(balances) == 0:
+            return False
+
+        with self._lock:
+            self.balances.update(balances)
+            for asset in [a for a in self.balances if a not in balances]:
+                del self.balances[asset]
+            self._confirmed = time.monotonic()
+
+        self.refreshes += 1
+
+        return True
+
+    # balance of an asset pushed by the account stream: apply() updates it in place, a balance at 0 is created
+    # for an asset not known yet
+    def on_update(self, asset: str, apply: typing.Callable[[Balance], None]):
+        with self._lock:
+            balance = self.balances.get(asset)
+            if balance is None:
+                balance = Balance(0.0, 0.0, 0.0, 0.0, 0.0)
+                self.balances[asset] = balance
+
+            apply(balance)
+            self._confirmed = time.monotonic()
+
+        self.stream_updates += 1
+
+    def set_stream_up(self, up: bool):
+        if self._stream_up and not up:
+            self._stream_down_since = time.monotonic()
+        self._stream_up = up
+
+    # seconds since the balances were last known to be right
+    def age(self) -> float:
+        if self._confirmed is None:
+            return math.inf
+        if self._stream_up:
+            return 0.0
+
+        confirmed = self._confirmed
+        if self._stream_down_since is not None:
+            confirmed = max(confirmed, self._stream_down_since)
+
+        return time.monotonic() - confirmed
+
+    # None when the balance is unknown, or too old and the REST refresh failed
+    def get(self, asset: str) -> typing.Optional[Balance]:
+        if self.stale() and not self.refresh():
+            self.refresh_failed()
+            return None
+
+        return self.balances.get(asset)
+
+    # True when the balances must be refreshed before being used, counted in the stale reads
+    def stale(self) -> bool:
+        if self.age() > self.max_staleness:
+            self.stale_reads += 1
+            return True
+        return False
+
+    def refresh_failed(self):
+        logger.warning("%s balances are %.0f seconds old and couldn't be refreshed", self._name, self.age())
+
+    def stats(self) -> typing.Dict[str, typing.Union[int, float, bool]]:
+        return {"stream_up": self._stream_up, "age": round(self.age(), 3), "stream_updates": self.stream_updates,
+                "refreshes": self.refreshes, "stale_reads": self.stale_reads}
@@ -1,5 +1,4 @@
 import logging
-import requests
 import time
 import typing
 
@@ -15,13 +14,44 @@ import threading
 
 from models import *
 
+from candle_store import CandleStore
+
 from strategies import TechnicalStrategy, BreakoutStrategy
 
+from connectors.decoding import FrameDecoder
+from connectors.history import HistoryService
+from connectors.recorder import FrameRecorder
+from connectors.contracts import ContractCache, DEFAULT_TTL
+from connectors.balances import BalanceCache, DEFAULT_MAX_STALENESS, DEFAULT_RECONCILE_INTERVAL
+from connectors.orders import OrderTracker
+from connectors.dispatch import TradeDispatcher, DEFAULT_WORKERS, DEFAULT_QUEUE_SIZE
+from connectors.http_session import create_session, session_stats, DEFAULT_POOL_SIZE, DEFAULT_RETRIES, \
+    DEFAULT_TIMEOUT
+from connectors.routing import StrategyRouter
+from connectors.subscriptions import SubscriptionManager, DEFAULT_MAX_STREAMS
+from connectors.startup import StartupTimer
+
 logger = logging.getLogger()
 
+HISTORY_PAGE_SIZE = 1000
+# klines requests of 1000 candles weigh 5 out of the 2400 request weight allowed per minute: 4 requests per second
+# use 1200 and keep the other half of the limit for the orders and other requests
+HISTORY_REQUESTS_PER_SECOND = 4
+
+# a listen key expires 60 minutes after its creation or last keepalive
+LISTEN_KEY_KEEPALIVE = 30 * 60
+
 
 class BinanceFuturesClient:
-    def __init__(self, public_key: str, secret_key: str, testnet: bool):
+    def __init__(self, public_key: str, secret_key: str, testnet: bool, pool_size: int = DEFAULT_POOL_SIZE,
+                 timeout: typing.Tuple[float, float] = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES,
+                 dispatch_workers: int = DEFAULT_WORKERS, dispatch_queue_size: int = DEFAULT_QUEUE_SIZE,
+                 dispatch_overflow: str = "block", connect: bool = True, base_url: typing.Optional[str] = None,
+                 wss_url: typing.Optional[str] = None, balance_max_staleness: float = DEFAULT_MAX_STALENESS,
+                 balance_reconcile_interval: float = DEFAULT_RECONCILE_INTERVAL, contracts_ttl: float = DEFAULT_TTL,
+                 max_streams_per_connection: int = DEFAULT_MAX_STREAMS):
+        # the constructor doesn't wait for the network, the contracts, balances and connections load in the background
+        self._startup = StartupTimer("Binance")
         if testnet:
             self._base_url = "https://testnet.binancefuture.com"
             self._wss_url = "wss://stream.binancefuture.com/ws"
@@ -29,24 +59,78 @@ class BinanceFuturesClient:
             self._base_url = "https://fapi.binance.com"
             self._wss_url = "wss://fstream.binance.com/ws"
 
+        # e.g. a local stand-in of the exchange (python -m mock_exchange)
+        if base_url is not None:
+            self._base_url = base_url
+        if wss_url is not None:
+            self._wss_url = wss_url
+
         self._public_key = public_key
         self._secret_key = secret_key
 
         self._headers = {'X-MBX-APIKEY': self._public_key}
 
-        self.contracts = self.get_contracts()
-        self.balances = self.get_balances()
+        # pooled keep-alive connections for the REST requests
+        self._session = create_session(pool_size, retries, self._headers)
+        self._timeout = timeout
+
+        self.history = HistoryService(self, "binance", HISTORY_PAGE_SIZE, HISTORY_REQUESTS_PER_SECOND)
+
+        # connect=False builds the client without any network I/O (no REST request, no websocket),
+        # e.g. to replay recorded websocket frames offline
+        self._connect = connect
+
+        # contract metadata read from the local cache when there is one, refreshed over REST in the background
+        self._contracts = ContractCache("binance", self.get_contracts, ttl=contracts_ttl)
+        if connect:
+            self._startup.background("contracts", self._contracts.get)
+
+        # kept current by the account updates of the websocket, get_trade_size() reads them without a REST request
+        self._balances = BalanceCache("Binance", self.get_balances, balance_max_staleness, balance_reconcile_interval)
+        self.balances = self._balances.balances
+        if connect:
+            self._startup.background("balances", self._balances.refresh)
+            self._balances.start()
 
         self.prices = dict()
-        self.strategies: typing.Dict[int, typing.Union[TechnicalStrategy, BreakoutStrategy]] = dict()
+        # strategies are added and removed through add_strategy() / remove_strategy() to keep the symbol index
+        self._router = StrategyRouter()
+        self.strategies: typing.Dict[int, typing.Union[TechnicalStrategy, BreakoutStrategy]] = self._router.strategies
 
         self.logs = []
 
-        self._ws_id = 1
-        self._ws = None
+        # market streams of the symbols traded by a strategy (aggTrade) or shown in the watchlist (bookTicker) only,
+        # spread over as many connections as needed
+        self._subscriptions = SubscriptionManager("Binance", self._wss_url, self._on_message, self._on_open,
+                                                  max_streams_per_connection, connect)
+
+        # frames of other event types are dropped before being decoded
+        self._decoder = FrameDecoder("e", ["aggTrade", "bookTicker", "kline"])
+
+        # interval -> callback of the candles closed on the kline streams, see watch_candles()
+        self._candle_callbacks: typing.Dict[str, typing.Callable[[str, Candle], None]] = dict()
 
-        t = threading.Thread(target=self._start_ws)
-        t.start()
+        # the websocket thread only decodes the frames, the strategies run on the dispatcher worker threads
+        self._dispatcher = TradeDispatcher(self._router, "Binance", dispatch_workers, dispatch_queue_size,
+                                           dispatch_overflow)
+        self._dispatcher.start()
+
+        self._recorder: typing.Optional[FrameRecorder] = None
+
+        # order updates are pushed by the user data stream, on its own websocket connection
+        self._orders = OrderTracker("Binance", self.get_order_status)
+        self._user_decoder = FrameDecoder("e", ["ORDER_TRADE_UPDATE", "ACCOUNT_UPDATE", "listenKeyExpired"])
+        self._listen_key: typing.Optional[str] = None
+        self._user_ws = None
+
+        if connect:
+            t = threading.Thread(target=self._start_user_ws, name="Binance user data stream", daemon=True)
+            t.start()
+
+            t = threading.Thread(target=self._keep_alive_listen_key, name="Binance listen key", daemon=True)
+            t.start()
+
+        self._startup.mark("init")
 
         logger.info("Binance Futures Client successfully initialized")
 
@@ -54,27 +138,126 @@ class BinanceFuturesClient:
         logger.info("%s", msg)
         self.logs.append({"log": msg, "displayed": False})
 
+    # waits for the first load of the contracts (from the local cache when there is one)
+    @property
+    def contracts(self) -> typing.Dict[str, Contract]:
+        return self._contracts.get() if self._connect else self._contracts.contracts
+
+    # seconds since the creation of the client at which each startup phase completed
+    def startup_stats(self) -> typing.Dict[str, float]:
+        return self._startup.stats()
+
+    # number of contracts, where they were loaded from, age of the local cache and number of REST refreshes
+    def contract_stats(self) -> typing.Dict[str, typing.Union[int, float, str, None]]:
+        return self._contracts.stats()
+
+    # requests sent / connections opened / connections reused by the REST session
+    def http_stats(self) -> typing.Dict[str, int]:
+        return session_stats(self._session)
+
+    # per event type: frames received, decoded, dropped before decoding, and decoding time
+    def decoder_stats(self) -> typing.Dict[str, typing.Dict[str, float]]:
+        return self._decoder.stats()
+
+    # frames received and decoded per second, in total and by event type, since the previous call
+    def frame_rates(self) -> typing.Dict[str, float]:
+        return self._decoder.frame_rates()
+
+    # trades submitted / processed / dropped and current and maximum depth of the strategy work queues
+    def dispatch_stats(self) -> typing.Dict[str, typing.Union[int, typing.List[int]]]:
+        return self._dispatcher.stats()
+
+    # symbols and timeframes whose candles are built for the strategies
+    def candle_stats(self) -> typing.Dict[str, typing.Union[int, typing.Dict[str, typing.List[str]]]]:
+        return self._router.stats()
+
+    # blocks until the strategies processed every trade received so far
+    def wait_idle(self):
+        self._dispatcher.wait_idle()
+
+    # records the raw websocket frames to compressed segment files, see connectors/recorder.py
+    def start_recording(self, directory: str):
+        self._recorder = FrameRecorder(directory, "binance")
+
+    def stop_recording(self):
+        recorder = self._recorder
+        self._recorder = None
+        if recorder is not None:
+            recorder.close()
+
+    # the callback is called with the updates of the order until it is filled, canceled, expired or rejected
+    def track_order(self, contract: Contract, order_id: int, callback: typing.Callable[[OrderStatus], None]):
+        self._orders.track(contract, order_id, callback)
+
+    # pending tracked orders and updates received from the user data stream / from REST after a reconnection
+    def order_stats(self) -> typing.Dict[str, int]:
+        return {"pending": self._orders.pending(), "pushed": self._orders.pushed, "polled": self._orders.polled}
+
+    # account stream state, age of the balances and number of pushed updates / REST refreshes / stale reads
+    def balance_stats(self) -> typing.Dict[str, typing.Union[int, float, bool]]:
+        return self._balances.stats()
+
+    # streams subscribed, connections used and subscription messages sent
+    def subscription_stats(self) -> typing.Dict[str, typing.Union[int, typing.List[int]]]:
+        return self._subscriptions.stats()
+
+    def add_strategy(self, b_index: int, strategy: typing.Union[TechnicalStrategy, BreakoutStrategy]):
+        self._router.add(b_index, strategy)
+        self.subscribe_channel([strategy.contract], "aggTrade")
+
+    def remove_strategy(self, b_index: int):
+        strategy = self._router.remove(b_index)
+        if strategy is not None:
+            self.unsubscribe_channel([strategy.contract], "aggTrade")
+
+    # bid / ask updates of a watchlist row, until unwatch()
+    def watch(self, contract: Contract):
+        self.subscribe_channel([contract], "bookTicker")
+
+    def unwatch(self, contract: Contract):
+        self.unsubscribe_channel([contract], "bookTicker")
+
+    # callback(symbol, candle) with each candle of the interval closed on the exchange, from the websocket threads,
+    # until unwatch_candles(). A single callback per interval: the candles of every contract of the scanner
+    def watch_candles(self, contracts: typing.List[Contract], interval: str,
+                      callback: typing.Callable[[str, Candle], None]):
+        self._candle_callbacks[interval] = callback
+        self.subscribe_channel(contracts, "kline_" + interval)
+
+    def unwatch_candles(self, contracts: typing.List[Contract], interval: str):
+        self.unsubscribe_channel(contracts, "kline_" + interval)
+
     def _generate_signature(self, data: typing.Dict) -> str:
         return hmac.new(self._secret_key.encode(), urlencode(data).encode(), hashlib.sha256).hexdigest()
 
     def _make_request(self, method: str, endpoint: str, data: typing.Dict):
+        if not self._connect:
+            return None
+
         if method == "GET":
             try:
-                response = requests.get(self._base_url + endpoint, params=data, headers=self._headers)
+                response = self._session.get(self._base_url + endpoint, params=data, timeout=self._timeout)
             except Exception as e:
                 logger.error("Connection error while making %s request to %s: %s", method, endpoint, e)
                 return None
 
         elif method == "POST":
             try:
-                response = requests.post(self._base_url + endpoint, params=data, headers=self._headers)
+                response = self._session.post(self._base_url + endpoint, params=data, timeout=self._timeout)
             except Exception as e:
                 logger.error("Connection error while making %s request to %s: %s", method, endpoint, e)
                 return None
 
         elif method == "DELETE":
             try:
-                response = requests.delete(self._base_url + endpoint, params=data, headers=self._headers)
+                response = self._session.delete(self._base_url + endpoint, params=data, timeout=self._timeout)
+            except Exception as e:
+                logger.error("Connection error while making %s request to %s: %s", method, endpoint, e)
+                return None
+
+        elif method == "PUT":
+            try:
+                response = self._session.put(self._base_url + endpoint, params=data, timeout=self._timeout)
             except Exception as e:
                 logger.error("Connection error while making %s request to %s: %s", method, endpoint, e)
                 return None
@@ -96,25 +279,47 @@ class BinanceFuturesClient:
         if exchange_info is not None:
             for contract_data in exchange_info['symbols']:
                 if contract_data['marginAsset'] != "BUSD":
-                    contracts[contract_data['symbol']] = Contract(contract_data, "binance")
+                    contracts[contract_data['symbol']] = Contract.from_binance(contract_data)
 
         return contracts
 
-    def get_historical_candles(self, contract: Contract, interval: str) -> typing.List[Candle]:
+    # one page of klines, start_time and end_time are candle open times in milliseconds
+    def get_candles_page(self, contract: Contract, interval: str, start_time: typing.Optional[int] = None,
+                         end_time: typing.Optional[int] = None) -> typing.Optional[typing.List[Candle]]:
         data = dict()
         data['symbol'] = contract.symbol
         data['interval'] = interval
-        data['limit'] = 1000
+        data['limit'] = HISTORY_PAGE_SIZE
+
+        if start_time is not None:
+            data['startTime'] = start_time
+        if end_time is not None:
+            data['endTime'] = end_time
 
         raw_candles = self._make_request("GET", "/fapi/v1/klines", data)
 
+        if raw_candles is None:
+            return None
+
         candles = []
 
-        if raw_candles is not None:
-            for c in raw_candles:
-                candles.append(Candle(c, interval, "binance"))
-                # print(c)
+        for c in raw_candles:
+            candles.append(Candle.from_binance(c))
+            # print(c)
+
+        return candles
 
+    # the last `depth` candles, the current one included, served from the local history cache when possible
+    def get_historical_candles(self, contract: Contract, interval: str,
+                               depth: int = HISTORY_PAGE_SIZE) -> CandleStore:
+        return self.history.get_candles(contract, interval, depth)
+
+    # candles of a new strategy: the ones already built for another strategy of the symbol and timeframe, shared
+    # with it, else the history
+    def get_strategy_candles(self, contract: Contract, interval: str) -> CandleStore:
+        candles = self._router.candles(contract.symbol, interval)
+        if candles is None:
+            candles = self.get_historical_candles(contract, interval)
         return candles
 
     def get_bid_ask(self, contract: Contract) -> typing.Dict[str, float]:
@@ -142,7 +347,7 @@ class BinanceFuturesClient:
 
         if account_data is not None:
             for a in account_data['assets']:
-                balances[a['asset']] = Balance(a, "binance")
+                balances[a['asset']] = Balance.from_binance(a)
 
         return balances
 
@@ -166,7 +371,7 @@ class BinanceFuturesClient:
         order_status = self._make_request("POST", "/fapi/v1/order", data)
 
         if order_status is not None:
-            order_status = OrderStatus(order_status, "binance")
+            order_status = OrderStatus.from_binance(order_status)
 
         return order_status
 
@@ -182,7 +387,7 @@ class BinanceFuturesClient:
         order_status = self._make_request("DELETE", "/fapi/v1/order", data)
 
         if order_status is not None:
-            order_status = OrderStatus(order_status, "binance")
+            order_status = OrderStatus.from_binance(order_status)
 
         return order_status
 
@@ -197,39 +402,23 @@ class BinanceFuturesClient:
         order_status = self._make_request("GET", "/fapi/v1/order", data)
 
         if order_status is not None:
-            order_status = OrderStatus(order_status, "binance")
+            order_status = OrderStatus.from_binance(order_status)
 
         return order_status
 
-    def _start_ws(self):
-        self._ws = websocket.WebSocketApp(self._wss_url, on_open=self._on_open, on_close=self._on_close,
-                                        on_error=self._on_error, on_message=self._on_message)
-
-        while True:
-            try:
-                self._ws.run_forever()
-            except Exception as e:
-                logger.error("Binance error in run_forever() method: %s", e)
-            time.sleep(2)
-
-    def _on_open(self, ws):
-        logger.info("Binance connection opened")
-
-        # self.subscribe_channel(list(self.contracts.values()), "bookTicker")
-        self.subscribe_channel(list(self.contracts.values()), "aggTrade")
-
-        # maximum stream of channels is 200 with a single connection to aggTrade channel else gives "invalid close opcode" error
-        # suscribe to aggTrade channel only for the symbol need when activating a strategy
-
-    def _on_close(self, ws):
-        logger.warning("Binance Websocket connection closed")
-
-    def _on_error(self, ws, msg: str):
-        logger.error("Binance connection error: %s", msg)
+    # first connection of the market streams, or a new shard / reconnection
+    def _on_open(self, index: int):
+        self._startup.mark("websocket")
 
     def _on_message(self, ws, msg: str):
 
-        data = json.loads(msg)
+        recorder = self._recorder
+        if recorder is not None:
+            recorder.record(msg)
+
+        data = self._decoder.decode(msg)
+        if data is None:
+            return
 
         if "e" in data:
             if data['e'] == "bookTicker":
@@ -244,41 +433,96 @@ class BinanceFuturesClient:
 
             if data['e'] == "aggTrade":
 
-                symbol = data['s']
+                self._dispatcher.submit(data['s'], float(data['p']), float(data['q']), data['T'])
 
-                for key, strat in self.strategies.items():
-                    if strat.contract.symbol == symbol:
-                        res = strat.parse_trades(float(data['p']), float(data['q']), data['T'])
-                        strat.check_trade(res)
+            if data['e'] == "kline":
 
-    def subscribe_channel(self, contracts: typing.List[Contract], channel: str):
-        data = dict()
-        data['method'] = "SUBSCRIBE"
-        data['params'] = []
-        for contract in contracts:
-            data['params'].append(contract.symbol.lower() + "@" + channel)
-        data['id'] = self._ws_id
+                kline = data['k']
+                callback = self._candle_callbacks.get(kline['i'])
+                if kline['x'] and callback is not None:
+                    callback(data['s'], Candle.from_binance_stream(kline))
 
-        try:
-            self._ws.send(json.dumps(data))
-        except Exception as e:
-            logger.error("Websocket error while subscribing to %s %s updates: %s", len(contracts), channel, e)
+    # user data stream: order updates pushed on a dedicated connection identified by a listen key
+    def _get_listen_key(self) -> typing.Optional[str]:
+        data = self._make_request("POST", "/fapi/v1/listenKey", dict())
 
-        self._ws_id += 1
+        if data is not None:
+            return data['listenKey']
+
+    def _keep_alive_listen_key(self):
+        while True:
+            time.sleep(LISTEN_KEY_KEEPALIVE)
+
+            if self._listen_key is not None:
+                self._make_request("PUT", "/fapi/v1/listenKey", dict())
+
+    def _start_user_ws(self):
+        while True:
+            self._listen_key = self._get_listen_key()
+
+            if self._listen_key is not None:
+                self._user_ws = websocket.WebSocketApp(self._wss_url + "/" + self._listen_key,
+                                                       on_open=self._on_user_open, on_close=self._on_user_close,
+                                                       on_error=self._on_user_error,
+                                                       on_message=self._on_user_message)
+                try:
+                    self._user_ws.run_forever()
+                except Exception as e:
+                    logger.error("Binance user data stream error in run_forever() method: %s", e)
+
+            time.sleep(2)
+
+    def _on_user_open(self, ws):
+        logger.info("Binance user data stream opened")
+        self._startup.mark("user_stream")
+
+        # the updates of the orders placed and of the balances while disconnected may have been missed
+        self._balances.set_stream_up(True)
+        self._balances.refresh_in_background()
+        self._orders.resync_in_background()
+
+    def _on_user_close(self, ws, close_status_code=None, close_msg=None):
+        logger.warning("Binance user data stream closed")
+
+        self._balances.set_stream_up(False)
+
+    def _on_user_error(self, ws, msg: str):
+        logger.error("Binance user data stream error: %s", msg)
+
+    def _on_user_message(self, ws, msg: str):
+
+        data = self._user_decoder.decode(msg)
+        if data is None:
+            return
+
+        if data.get('e') == "ORDER_TRADE_UPDATE":
+            self._orders.on_update(OrderStatus.from_binance_stream(data['o']))
+
+        elif data.get('e') == "ACCOUNT_UPDATE":
+            for b in data['a']['B']:
+                self._balances.on_update(b['a'], lambda balance, info=b: balance.update_from_binance_stream(info))
+
+        # the connection is closed and opened again with a new listen key
+        elif data.get('e') == "listenKeyExpired":
+            logger.warning("Binance listen key expired")
+            ws.close()
+
+    # each call must be balanced by an unsubscribe_channel() call with the same contracts and channel, the stream
+    # stays subscribed as long as another user needs it
+    def subscribe_channel(self, contracts: typing.List[Contract], channel: str):
+        self._subscriptions.acquire([contract.symbol.lower() + "@" + channel for contract in contracts])
+
+    def unsubscribe_channel(self, contracts: typing.List[Contract], channel: str):
+        self._subscriptions.release([contract.symbol.lower() + "@" + channel for contract in contracts])
 
     def get_trade_size(self, contract: Contract, price: float, balance_pct: float):
         # the contract need to be able to round the quantity to the right lot size.
 
-        # check balance is updated and have USDT key in the balance dictionary we obtained
-        balance = self.get_balances()
-        if balance is not None:
-            if 'USDT' in balance:
-                # we replace what we got here by the value of the USDT wallet balance
-                balance = balance['USDT'].wallet_balance
-            else:
-                return None
-        else:
+        # cached balance, only requested over REST when too old
+        balance = self._balances.get('USDT')
+        if balance is None:
             return None
+        balance = balance.wallet_balance
 
         trade_size = (balance * balance_pct / 100) / price
 
@@ -1,5 +1,4 @@
 import logging
-import requests
 import time
 import typing
 
@@ -11,22 +10,45 @@ import hashlib
 import websocket
 import json
 
-import dateutil.parser
-
 import threading
 
 from models import *
 
+from candle_store import CandleStore
+
 from strategies import TechnicalStrategy, BreakoutStrategy
 
+from connectors.decoding import FrameDecoder
+from connectors.history import HistoryService
+from connectors.recorder import FrameRecorder
+from connectors.contracts import ContractCache, DEFAULT_TTL
+from connectors.balances import BalanceCache, DEFAULT_MAX_STALENESS, DEFAULT_RECONCILE_INTERVAL
+from connectors.orders import OrderTracker, OrderCache
+from connectors.dispatch import TradeDispatcher, DEFAULT_WORKERS, DEFAULT_QUEUE_SIZE
+from connectors.http_session import create_session, session_stats, DEFAULT_POOL_SIZE, DEFAULT_RETRIES, \
+    DEFAULT_TIMEOUT
+from connectors.routing import StrategyRouter
+from connectors.startup import StartupTimer
+
 # bitmex indicate the time of candle with ISO 8601 2021-01-24T10:00:.000Z format. Date and time separated
 # by T and Z or UTC format. we want to convert both exchanges format to Unix timestamp,
 
 logger = logging.getLogger()
 
+HISTORY_PAGE_SIZE = 500
+# the REST API allows 60 requests per minute, the history downloads take at most half of them
+HISTORY_REQUESTS_PER_SECOND = 0.5
+
 
 class BitmexClient:
-    def __init__(self, public_key: str, secret_key: str, testnet: bool):
+    def __init__(self, public_key: str, secret_key: str, testnet: bool, pool_size: int = DEFAULT_POOL_SIZE,
+                 timeout: typing.Tuple[float, float] = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES,
+                 dispatch_workers: int = DEFAULT_WORKERS, dispatch_queue_size: int = DEFAULT_QUEUE_SIZE,
+                 dispatch_overflow: str = "block", connect: bool = True, base_url: typing.Optional[str] = None,
+                 wss_url: typing.Optional[str] = None, balance_max_staleness: float = DEFAULT_MAX_STALENESS,
+                 balance_reconcile_interval: float = DEFAULT_RECONCILE_INTERVAL, contracts_ttl: float = DEFAULT_TTL):
+        # the constructor doesn't wait for the network, the contracts, balances and connections load in the background
+        self._startup = StartupTimer("Bitmex")
 
         if testnet:
             self._base_url = "https://testnet.bitmex.com"
@@ -35,22 +57,78 @@ class BitmexClient:
             self._base_url = "https://www.bitmex.com"
             self._wss_url = "wss://www.bitmex.com/realtime"
 
+        # e.g. a local stand-in of the exchange (python -m mock_exchange)
+        if base_url is not None:
+            self._base_url = base_url
+        if wss_url is not None:
+            self._wss_url = wss_url
+
         self._public_key = public_key
         self._secret_key = secret_key
 
+        # pooled keep-alive connections for the REST requests
+        self._session = create_session(pool_size, retries)
+        self._timeout = timeout
+
+        self.history = HistoryService(self, "bitmex", HISTORY_PAGE_SIZE, HISTORY_REQUESTS_PER_SECOND)
+
         self._ws = None
+        self._ws_connected = False
+
+        # frames of other tables are dropped before being decoded
+        self._decoder = FrameDecoder("table", ["quote", "trade", "execution", "order", "margin"] +
+                                     ["tradeBin" + timeframe for timeframe in BITMEX_TF_MINUTES])
+
+        # timeframe -> callback of the buckets closed on the tradeBin tables, see watch_candles()
+        self._candle_callbacks: typing.Dict[str, typing.Callable[[str, Candle], None]] = dict()
+
+        # public topics with users: trade:<symbol> for the strategies, quote:<symbol> for the watchlist rows,
+        # tradeBin<timeframe>:<symbol> for the scanner.
+        # topic -> number of users, the topics are subscribed again on every connection
+        self._topic_users: typing.Dict[str, int] = dict()
+        self._topics_lock = threading.Lock()
 
-        self.contracts = self.get_contracts()
-        self.balances = self.get_balances()
+        # connect=False builds the client without any network I/O (no REST request, no websocket),
+        # e.g. to replay recorded websocket frames offline
+        self._connect = connect
+
+        # contract metadata read from the local cache when there is one, refreshed over REST in the background
+        self._contracts = ContractCache("bitmex", self.get_contracts, ttl=contracts_ttl)
+        if connect:
+            self._startup.background("contracts", self._contracts.get)
+
+        # kept current by the account updates of the websocket, get_trade_size() reads them without a REST request
+        self._balances = BalanceCache("Bitmex", self.get_balances, balance_max_staleness, balance_reconcile_interval)
+        self.balances = self._balances.balances
+        if connect:
+            self._startup.background("balances", self._balances.refresh)
+            self._balances.start()
 
         self.prices = dict()
-        self.strategies: typing.Dict[int, typing.Union[TechnicalStrategy, BreakoutStrategy]] = dict()
+        # strategies are added and removed through add_strategy() / remove_strategy() to keep the symbol index
+        self._router = StrategyRouter()
+        self.strategies: typing.Dict[int, typing.Union[TechnicalStrategy, BreakoutStrategy]] = self._router.strategies
 
         # we add logs here, root take this list, loop through it and display the new items
         self.logs = []
 
-        t = threading.Thread(target=self._start_ws)
-        t.start()
+        # the websocket thread only decodes the frames, the strategies run on the dispatcher worker threads
+        self._dispatcher = TradeDispatcher(self._router, "Bitmex", dispatch_workers, dispatch_queue_size,
+                                           dispatch_overflow)
+        self._dispatcher.start()
+
+        self._recorder: typing.Optional[FrameRecorder] = None
+
+        # order updates are pushed by the execution and order tables of the authenticated websocket
+        self._orders = OrderTracker("Bitmex", self.get_order_status)
+        # get_order_status() answers from the last known state of the order, REST is only requested on a miss
+        self._order_cache = OrderCache()
+
+        if connect:
+            t = threading.Thread(target=self._start_ws, name="Bitmex websocket", daemon=True)
+            t.start()
+
+        self._startup.mark("init")
 
         logger.info("Bitmex Client successfully initialized")
 
@@ -58,12 +136,112 @@ class BitmexClient:
         logger.info("%s", msg)
         self.logs.append({"log": msg, "displayed": False})
 
+    # waits for the first load of the contracts (from the local cache when there is one)
+    @property
+    def contracts(self) -> typing.Dict[str, Contract]:
+        return self._contracts.get() if self._connect else self._contracts.contracts
+
+    # seconds since the creation of the client at which each startup phase completed
+    def startup_stats(self) -> typing.Dict[str, float]:
+        return self._startup.stats()
+
+    # number of contracts, where they were loaded from, age of the local cache and number of REST refreshes
+    def contract_stats(self) -> typing.Dict[str, typing.Union[int, float, str, None]]:
+        return self._contracts.stats()
+
+    # requests sent / connections opened / connections reused by the REST session
+    def http_stats(self) -> typing.Dict[str, int]:
+        return session_stats(self._session)
+
+    # per event type: frames received, decoded, dropped before decoding, and decoding time
+    def decoder_stats(self) -> typing.Dict[str, typing.Dict[str, float]]:
+        return self._decoder.stats()
+
+    # trades submitted / processed / dropped and current and maximum depth of the strategy work queues
+    def dispatch_stats(self) -> typing.Dict[str, typing.Union[int, typing.List[int]]]:
+        return self._dispatcher.stats()
+
+    # symbols and timeframes whose candles are built for the strategies
+    def candle_stats(self) -> typing.Dict[str, typing.Union[int, typing.Dict[str, typing.List[str]]]]:
+        return self._router.stats()
+
+    # blocks until the strategies processed every trade received so far
+    def wait_idle(self):
+        self._dispatcher.wait_idle()
+
+    # records the raw websocket frames to compressed segment files, see connectors/recorder.py
+    def start_recording(self, directory: str):
+        self._recorder = FrameRecorder(directory, "bitmex")
+
+    def stop_recording(self):
+        recorder = self._recorder
+        self._recorder = None
+        if recorder is not None:
+            recorder.close()
+
+    # the callback is called with the updates of the order until it is filled, canceled or rejected
+    def track_order(self, contract: Contract, order_id: str, callback: typing.Callable[[OrderStatus], None]):
+        self._orders.track(contract, order_id, callback)
+
+    # pending tracked orders and updates received from the websocket / from REST after a reconnection
+    def order_stats(self) -> typing.Dict[str, int]:
+        return {"pending": self._orders.pending(), "pushed": self._orders.pushed, "polled": self._orders.polled}
+
+    # size, hits, misses and hit rate of the get_order_status() cache
+    def order_cache_stats(self) -> typing.Dict[str, typing.Union[int, float]]:
+        return self._order_cache.stats()
+
+    # account stream state, age of the balances and number of pushed updates / REST refreshes / stale reads
+    def balance_stats(self) -> typing.Dict[str, typing.Union[int, float, bool]]:
+        return self._balances.stats()
+
+    # frames received and decoded per second, in total and by table, since the previous call
+    def frame_rates(self) -> typing.Dict[str, float]:
+        return self._decoder.frame_rates()
+
+    def subscription_stats(self) -> typing.Dict[str, typing.Union[int, typing.List[str]]]:
+        with self._topics_lock:
+            return {"topics": len(self._topic_users), "subscribed": sorted(self._topic_users.keys())}
+
+    def add_strategy(self, b_index: int, strategy: typing.Union[TechnicalStrategy, BreakoutStrategy]):
+        self._router.add(b_index, strategy)
+        self.subscribe_channel("trade:" + strategy.contract.symbol)
+
+    def remove_strategy(self, b_index: int):
+        strategy = self._router.remove(b_index)
+        if strategy is not None:
+            self.unsubscribe_channel("trade:" + strategy.contract.symbol)
+
+    # bid / ask updates of a watchlist row, until unwatch()
+    def watch(self, contract: Contract):
+        self.subscribe_channel("quote:" + contract.symbol)
+
+    def unwatch(self, contract: Contract):
+        self.unsubscribe_channel("quote:" + contract.symbol)
+
+    # callback(symbol, candle) with each bucket of the timeframe closed on the exchange, from the websocket thread,
+    # until unwatch_candles(). A single callback per timeframe: the candles of every contract of the scanner
+    def watch_candles(self, contracts: typing.List[Contract], timeframe: str,
+                      callback: typing.Callable[[str, Candle], None]):
+        if timeframe not in BITMEX_TF_MINUTES:
+            raise ValueError(f"Bitmex doesn't provide {timeframe} candles")
+
+        self._candle_callbacks[timeframe] = callback
+        for contract in contracts:
+            self.subscribe_channel("tradeBin" + timeframe + ":" + contract.symbol)
+
+    def unwatch_candles(self, contracts: typing.List[Contract], timeframe: str):
+        for contract in contracts:
+            self.unsubscribe_channel("tradeBin" + timeframe + ":" + contract.symbol)
+
     def _generate_signature(self, method: str, endpoint: str, expires: str, data: typing.Dict) -> str:
 
         message = method + endpoint + "?" + urlencode(data) + expires if len(data) > 0 else method + endpoint + expires
         return hmac.new(self._secret_key.encode(), message.encode(), hashlib.sha256).hexdigest()
 
     def _make_request(self, method: str, endpoint: str, data: typing.Dict):
+        if not self._connect:
+            return None
 
         headers = dict()
         expires = str(int(time.time()) + 5)
@@ -73,21 +251,24 @@ class BitmexClient:
 
         if method == "GET":
             try:
-                response = requests.get(self._base_url + endpoint, params=data, headers=headers)
+                response = self._session.get(self._base_url + endpoint, params=data, headers=headers,
+                                             timeout=self._timeout)
             except Exception as e:
                 logger.error("Connection error while making %s request to %s: %s", method, endpoint, e)
                 return None
 
         elif method == "POST":
             try:
-                response = requests.post(self._base_url + endpoint, params=data, headers=headers)
+                response = self._session.post(self._base_url + endpoint, params=data, headers=headers,
+                                              timeout=self._timeout)
             except Exception as e:
                 logger.error("Connection error while making %s request to %s: %s", method, endpoint, e)
                 return None
 
         elif method == "DELETE":
             try:
-                response = requests.delete(self._base_url + endpoint, params=data, headers=headers)
+                response = self._session.delete(self._base_url + endpoint, params=data, headers=headers,
+                                                timeout=self._timeout)
             except Exception as e:
                 logger.error("Connection error while making %s request to %s: %s", method, endpoint, e)
                 return None
@@ -109,7 +290,7 @@ class BitmexClient:
 
         if instruments is not None:
             for s in instruments:
-                contracts[s['symbol']] = Contract(s, "bitmex")
+                contracts[s['symbol']] = Contract.from_bitmex(s)
 
         return contracts
 
@@ -123,29 +304,60 @@ class BitmexClient:
 
         if margin_data is not None:
             for a in margin_data:
-                balances[a['currency']] = Balance(a, "bitmex")
+                balances[a['currency']] = Balance.from_bitmex(a)
 
         return balances
 
-    def get_historical_candles(self, contract: Contract, timeframe: str) -> typing.List[Candle]:
+    # one page of buckets, start_time and end_time are candle open times in milliseconds.
+    # Bitmex timestamps the buckets with their close time, hence the timeframe added to the filters
+    def get_candles_page(self, contract: Contract, timeframe: str, start_time: typing.Optional[int] = None,
+                         end_time: typing.Optional[int] = None) -> typing.Optional[typing.List[Candle]]:
+        if timeframe not in BITMEX_TF_MINUTES:
+            logger.error("Bitmex doesn't provide %s candles", timeframe)
+            return None
+
         data = dict()
 
         data['symbol'] = contract.symbol
         data['partial'] = True
         data['binSize'] = timeframe
-        data['count'] = 500
-        data['reverse'] = True
+        data['count'] = HISTORY_PAGE_SIZE
+
+        if start_time is None and end_time is None:
+            data['reverse'] = True
+        if start_time is not None:
+            data['startTime'] = ms_to_iso(start_time + BITMEX_TF_MINUTES[timeframe] * 60000)
+        if end_time is not None:
+            data['endTime'] = ms_to_iso(end_time + BITMEX_TF_MINUTES[timeframe] * 60000)
 
         raw_candles = self._make_request("GET", "/api/v1/trade/bucketed", data)
 
+        if raw_candles is None:
+            return None
+
+        if data.get('reverse'):
+            raw_candles = reversed(raw_candles)
+
         candles = []
 
-        if raw_candles is not None:
-            for c in reversed(raw_candles):
-                candles.append(Candle(c, timeframe, "bitmex"))
+        for c in raw_candles:
+            candles.append(Candle.from_bitmex(c, timeframe))
 
         return candles
 
+    # the last `depth` candles, the current one included, served from the local history cache when possible
+    def get_historical_candles(self, contract: Contract, timeframe: str,
+                               depth: int = HISTORY_PAGE_SIZE) -> CandleStore:
+        return self.history.get_candles(contract, timeframe, depth)
+
+    # candles of a new strategy: the ones already built for another strategy of the symbol and timeframe, shared
+    # with it, else the history
+    def get_strategy_candles(self, contract: Contract, timeframe: str) -> CandleStore:
+        candles = self._router.candles(contract.symbol, timeframe)
+        if candles is None:
+            candles = self.get_historical_candles(contract, timeframe)
+        return candles
+
     def place_order(self, contract: Contract, order_type: str, quantity: float, side: str, price=None,
                     tif=None) -> OrderStatus:
         data = dict()
@@ -164,7 +376,8 @@ class BitmexClient:
         order_status = self._make_request("POST", "/api/v1/order", data)
 
         if order_status is not None:
-            order_status = OrderStatus(order_status, "bitmex")
+            order_status = OrderStatus.from_bitmex(order_status)
+            self._order_cache.update(order_status)
 
         return order_status
 
@@ -175,22 +388,29 @@ class BitmexClient:
         order_status = self._make_request("DELETE", "/api/v1/order", data)
 
         if order_status is not None:
-            order_status = OrderStatus(order_status[0], "bitmex")
+            order_status = OrderStatus.from_bitmex(order_status[0])
+            self._order_cache.update(order_status)
 
         return order_status
 
-    def get_order_status(self, contract: Contract, order_id: int) -> OrderStatus:
+    def get_order_status(self, contract: Contract, order_id: str) -> OrderStatus:
+
+        order_status = self._order_cache.get(order_id)
+        if order_status is not None:
+            return order_status
 
+        # only this order, filtered by the exchange
         data = dict()
         data['symbol'] = contract.symbol
-        data['reverse'] = True
+        data['filter'] = json.dumps({"orderID": order_id})
+        data['count'] = 1
 
-        order_status = self._make_request("GET", "/api/v1/order", data)
+        orders = self._make_request("GET", "/api/v1/order", data)
 
-        if order_status is not None:
-            for order in order_status:
-                if order['orderID'] == order_id:
-                    return OrderStatus(order, "bitmex")
+        if orders is not None and len(orders) > 0:
+            order_status = OrderStatus.from_bitmex(orders[0])
+            self._order_cache.update(order_status)
+            return order_status
 
     def _start_ws(self):
         self._ws = websocket.WebSocketApp(self._wss_url, on_open=self._on_open, on_close=self._on_close,
@@ -205,80 +425,159 @@ class BitmexClient:
 
     def _on_open(self, ws):
         logger.info("Bitmex connection opened")
+        self._startup.mark("websocket")
+
+        self._authenticate()
 
-        self.subscribe_channel("instrument")
-        self.subscribe_channel("trade")
+        # the private tables only carry our own orders and balances, the public topics are scoped to the symbols
+        # of the strategies and of the watchlist
+        with self._topics_lock:
+            self._ws_connected = True
+            self._send_topics("subscribe", ["execution", "order", "margin"] + sorted(self._topic_users.keys()))
 
-    def _on_close(self, ws):
+        # the updates of the orders placed while disconnected may have been missed: the open orders of the cache
+        # may be stale and the pending orders are requested again
+        self._order_cache.invalidate_open()
+        self._orders.resync_in_background()
+
+    def _on_close(self, ws, close_status_code=None, close_msg=None):
         logger.warning("Bitmex Websocket connection closed")
 
+        with self._topics_lock:
+            self._ws_connected = False
+
+        # no order or margin update is received until the connection is opened again
+        self._order_cache.invalidate_open()
+        self._balances.set_stream_up(False)
+
     def _on_error(self, ws, msg: str):
         logger.error("Bitmex connection error: %s", msg)
 
     def _on_message(self, ws, msg: str):
 
-        data = json.loads(msg)
+        recorder = self._recorder
+        if recorder is not None:
+            recorder.record(msg)
+
+        data = self._decoder.decode(msg)
+        if data is None:
+            return
 
         if "table" in data:
-            if data['table'] == "instrument":
+            # best bid / ask of the watchlist symbols
+            if data['table'] == "quote":
 
                 for d in data['data']:
+                    self.prices[d['symbol']] = {'bid': d.get('bidPrice'), 'ask': d.get('askPrice')}
 
-                    symbol = d['symbol']
+            # timestamp represents the time of the trade. The "partial" answering a subscription repeats trades
+            # already in the candles
+            if data['table'] == "trade" and data.get('action') != "partial":
 
-                    if symbol not in self.prices:
-                        self.prices[symbol] = {'bid': None, 'ask': None}
+                # a frame often carries many prints: they are grouped by symbol and each group is handled
+                # by the strategies as a single candle update
+                batches = dict()
 
-                    if 'bidPrice' in d:
-                        self.prices[symbol]['bid'] = d['bidPrice']
-                    if 'askPrice' in d:
-                        self.prices[symbol]['ask'] = d['askPrice']
+                for d in data['data']:
+
+                    if len(self._router.get(d['symbol'])) == 0:
+                        continue
+
+                    trade = (float(d['price']), float(d['size']), iso_to_ms(d['timestamp']))
+
+                    if d['symbol'] in batches:
+                        batches[d['symbol']].append(trade)
+                    else:
+                        batches[d['symbol']] = [trade]
+
+                for symbol, trades in batches.items():
+                    self._dispatcher.submit_batch(symbol, trades)
 
-                    # print(symbol, self.prices[symbol])
+            # buckets closed, timestamped with their close time. The "partial" answering a subscription repeats
+            # the last one
+            if data['table'].startswith("tradeBin"):
 
-                    # if symbol == "XBTUSD":
-                    #    self._add_log(symbol + " " + str(self.prices[symbol]['bid']) + " / " +
-                    #                  str(self.prices[symbol]['ask']))
+                timeframe = data['table'][len("tradeBin"):]
+                callback = self._candle_callbacks.get(timeframe)
+                if callback is not None:
+                    for d in data['data']:
+                        callback(d['symbol'], Candle.from_bitmex(d, timeframe))
 
-                    # timestamp represents the time of the trade
-                    if data['table'] == "trade":
+            # updates of our orders, the update rows only carry the changed fields
+            if data['table'] in ("execution", "order"):
 
-                        for d in data['data']:
+                for d in data['data']:
+                    if 'ordStatus' in d:
+                        self._orders.on_update(self._order_cache.update(OrderStatus.from_bitmex(d)))
+
+            if data['table'] == "margin":
+
+                for d in data['data']:
+                    self._balances.on_update(d['currency'], lambda balance, info=d: balance.update_from_bitmex(info))
+
+        # answer of the authentication: the margin table keeps the balances current from now on, the updates
+        # missed while disconnected are requested once
+        elif data.get('request', {}).get('op') == "authKeyExpires":
+            if data.get('success'):
+                self._startup.mark("authenticated")
+                self._balances.set_stream_up(True)
+                self._balances.refresh_in_background()
+            else:
+                logger.error("Bitmex websocket authentication failed: %s", data.get('error'))
 
-                            symbol = d['symbol']
+    # the execution and order tables are private
+    def _authenticate(self):
+        expires = int(time.time()) + 5
 
-                            ts = int(dateutil.parser.isoparse(d['timestamp']).timestamp() * 1000)
+        data = dict()
+        data['op'] = "authKeyExpires"
+        data['args'] = [self._public_key, expires, self._generate_signature("GET", "/realtime", str(expires), dict())]
 
-                            for key, strat in self.strategies.items():
-                                if strat.contract.symbol == symbol:
-                                    res = strat.parse_trades(float(d['price']), float(d['size']), ts)
-                                    strat.check_trade(res)
-                                    # example to pass bid or ask price to open_position
-                                    # strat.check_trade(res, self.prices[symbol]['bid'])
+        try:
+            self._ws.send(json.dumps(data))
+        except Exception as e:
+            logger.error("Websocket error while authenticating: %s", e)
 
+    # a table ("trade") or a table scoped to a symbol ("trade:XBTUSD"). Each call must be balanced by an
+    # unsubscribe_channel() call with the same topic, the topic stays subscribed as long as another user needs it
     def subscribe_channel(self, topic: str):
+        with self._topics_lock:
+            self._topic_users[topic] = self._topic_users.get(topic, 0) + 1
+            if self._topic_users[topic] == 1:
+                self._send_topics("subscribe", [topic])
+
+    def unsubscribe_channel(self, topic: str):
+        with self._topics_lock:
+            users = self._topic_users.get(topic, 0)
+            if users > 1:
+                self._topic_users[topic] = users - 1
+            elif users == 1:
+                del self._topic_users[topic]
+                self._send_topics("unsubscribe", [topic])
+
+    # the topics subscribed while disconnected are sent by _on_open()
+    def _send_topics(self, op: str, topics: typing.List[str]):
+        if not self._ws_connected:
+            return
+
         data = dict()
-        data['op'] = "subscribe"
-        data['args'] = []
-        data['args'].append(topic)
+        data['op'] = op
+        data['args'] = topics
 
         try:
             self._ws.send(json.dumps(data))
         except Exception as e:
-            logger.error("Websocket error while subscribing to %s: %s", topic, e)
+            logger.error("Websocket error while sending %s of %s: %s", op, topics, e)
 
     # balance is in bitcoin
     # noinspection SpellCheckingInspection
     def get_trade_size(self, contract: Contract, price: float, balance_pct: float):
 
-        balance = self.get_balances()
-        if balance is not None:
-            if 'XBt' in balance:
-                balance = balance['XBt'].wallet_balance
-            else:
-                return None
-        else:
+        # cached balance, only requested over REST when too old
+        balance = self._balances.get('XBt')
+        if balance is None:
             return None
+        balance = balance.wallet_balance
 
         # with the XBT amount of order we want to place, we need to convert it to a number of contracts to buy or sell
         # this calculation will depend on the type of contract
@@ -0,0 +1,166 @@
+import json
+import logging
+import os
+import threading
+import time
+import typing
+
+from models import Contract
+
+logger = logging.getLogger()
+
+DEFAULT_CACHE_DIR = os.path.join("cache", "contracts")
+# the contract specifications rarely change, a day old copy is good enough to start with
+DEFAULT_TTL = 24 * 3600
+# seconds before trying again when the REST request of the contracts failed
+RETRY_INTERVAL = 60
+
+
+# Contract metadata of a connector, persisted per exchange in a local JSON file so that a launch doesn't wait for the
+# exchangeInfo / instrument request.
+# start() loads the contracts in a background thread: from the file when there is one (even expired), from REST
+# otherwise. The contracts are then refreshed over REST in the background when the file is older than ttl, and every
+# ttl seconds after that (every RETRY_INTERVAL seconds while the requests fail).
+# get() only blocks until the first load is done.
+# A refresh replaces the dictionary instead of modifying it, the readers iterating the previous one aren't disturbed.
+class ContractCache:
+    # fetch is None for the asyncio connectors, they drive the loading and the refreshes from their event loop
+    def __init__(self, exchange: str, fetch: typing.Optional[typing.Callable[[], typing.Dict[str, Contract]]],
+                 cache_dir: str = DEFAULT_CACHE_DIR, ttl: float = DEFAULT_TTL):
+        self._exchange = exchange
+        self._fetch = fetch
+        self._path = os.path.join(cache_dir, exchange + ".json")
+        self.ttl = ttl
+
+        self.contracts: typing.Dict[str, Contract] = dict()
+        # "disk", "disk (expired)" or "rest", None until the first load
+        self.source: typing.Optional[str] = None
+        self.load_time: typing.Optional[float] = None
+
+        self._saved: typing.Optional[float] = None
+        self._started = False
+        self._loaded = threading.Event()
+        self._lock = threading.Lock()
+
+        self.refreshes = 0
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        t = threading.Thread(target=self._run, name=f"{self._exchange} contracts", daemon=True)
+        t.start()
+
+    # the contracts, after waiting for the first load (started here if start() wasn't called)
+    def get(self) -> typing.Dict[str, Contract]:
+        if not self._loaded.is_set():
+            self.start()
+            self._loaded.wait()
+        return self.contracts
+
+    def _run(self):
+        start = time.monotonic()
+
+        loaded = self.load_file()
+        if not loaded:
+            # without a cache file the contracts stay empty until the request succeeds, as before
+            self.refresh()
+
+        self.loaded(time.monotonic() - start)
+
+        if loaded and self.expired():
+            self.refresh()
+
+        while True:
+            time.sleep(self.next_refresh())
+            self.refresh()
+
+    # contracts of the cache file (even expired), False when there isn't any
+    def load_file(self) -> bool:
+        contracts = self._load()
+        if contracts is None:
+            self.source = "rest"
+            return False
+
+        self.contracts = contracts
+        self.source = "disk (expired)" if self.expired() else "disk"
+        return True
+
+    # end of the first load, get() doesn't wait anymore
+    def loaded(self, load_time: float):
+        self.load_time = load_time
+        self._loaded.set()
+
+        logger.info("%s: %s contracts loaded from %s in %.3f seconds", self._exchange, len(self.contracts),
+                    self.source, self.load_time)
+
+    def expired(self) -> bool:
+        return self._saved is None or time.time() - self._saved > self.ttl
+
+    # seconds before the next REST refresh
+    def next_refresh(self) -> float:
+        if self._saved is None:
+            return RETRY_INTERVAL
+        return max(self._saved + self.ttl - time.time(), RETRY_INTERVAL)
+
+    # REST request of the contracts, False when it failed
+    def refresh(self) -> bool:
+        return self.replace(self._fetch())
+
+    # contracts returned by a REST request, False when it failed
+    def replace(self, contracts: typing.Dict[str, Contract]) -> bool:
+        # get_contracts() returns an empty dictionary when the request failed
+        if len(contracts) == 0:
+            logger.warning("%s contracts couldn't be refreshed", self._exchange)
+            return False
+
+        self.contracts = contracts
+        self.refreshes += 1
+        self._save(contracts)
+
+        return True
+
+    def _load(self) -> typing.Optional[typing.Dict[str, Contract]]:
+        if not os.path.exists(self._path):
+            return None
+
+        try:
+            with open(self._path) as f:
+                data = json.load(f)
+            contracts = {c['symbol']: Contract(**c) for c in data['contracts']}
+            self._saved = data['saved']
+        except Exception as e:
+            logger.error("Error while reading the %s contract cache: %s", self._exchange, e)
+            return None
+
+        if len(contracts) == 0:
+            return None
+
+        return contracts
+
+    def _save(self, contracts: typing.Dict[str, Contract]):
+        saved = time.time()
+        data = {"saved": saved,
+                "contracts": [{name: getattr(c, name) for name in Contract.__slots__} for c in contracts.values()]}
+
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+
+        # written to a temporary file first so a crash never leaves a truncated cache behind
+        tmp_path = self._path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self._path)
+        except OSError as e:
+            logger.error("Error while writing the %s contract cache: %s", self._exchange, e)
+            return
+
+        self._saved = saved
+
+    def stats(self) -> typing.Dict[str, typing.Union[int, float, str, None]]:
+        age = round(time.time() - self._saved, 1) if self._saved is not None else None
+        return {"contracts": len(self.contracts), "source": self.source,
+                "load_time": round(self.load_time, 4) if self.load_time is not None else None,
+                "age": age, "refreshes": self.refreshes}
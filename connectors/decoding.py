@@ -0,0 +1,123 @@
+import json
+import logging
+import threading
+import time
+import typing
+
+# Websocket frame decoding for the connectors.
+# The JSON backend is the fastest one installed (orjson, then ujson, then the standard library json module).
+# Before decoding, the event type (Binance "e" key) or table name (Bitmex "table" key) is sniffed from the raw text:
+# both exchanges send it at the start of the frame, so frames nobody consumes are dropped without being parsed.
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    try:
+        import ujson
+
+        _loads = ujson.loads
+        JSON_BACKEND = "ujson"
+    except ImportError:
+        _loads = json.loads
+        JSON_BACKEND = "json"
+
+logger = logging.getLogger()
+
+# the key is searched only at the beginning of the frame, so a value nested in the payload is never mistaken for it
+SNIFF_WINDOW = 64
+
+# name under which the frames without the key (subscription answers, errors...) are counted
+OTHER_EVENTS = "other"
+
+
+# decode() is called by every connection of a connector (the stream shards of connectors/subscriptions.py): the
+# counters are updated under a lock, the frames are sniffed and parsed outside of it
+class FrameDecoder:
+    def __init__(self, key: str, accepted: typing.Iterable[str]):
+        self._marker = '"' + key + '":"'
+        self.accepted = set(accepted)
+
+        self._lock = threading.Lock()
+        # event -> {"frames": received, "decoded": parsed, "dropped": discarded before parsing, "seconds": parsing}
+        self._stats: typing.Dict[str, typing.Dict[str, float]] = dict()
+
+        self._rates_since = time.monotonic()
+        # event -> (frames, decoded) at the previous frame_rates() call
+        self._rates_counts: typing.Dict[str, typing.Tuple[int, int]] = dict()
+
+    def sniff(self, msg: str) -> typing.Optional[str]:
+        start = msg.find(self._marker, 0, SNIFF_WINDOW)
+        if start == -1:
+            return None
+
+        start += len(self._marker)
+        end = msg.find('"', start)
+        if end == -1:
+            return None
+
+        return msg[start:end]
+
+    def _count(self, event: str, decoded: int, dropped: int, seconds: float):
+        with self._lock:
+            stats = self._stats.get(event)
+            if stats is None:
+                stats = {"frames": 0, "decoded": 0, "dropped": 0, "seconds": 0.0}
+                self._stats[event] = stats
+
+            stats['frames'] += 1
+            stats['decoded'] += decoded
+            stats['dropped'] += dropped
+            stats['seconds'] += seconds
+
+    # returns the decoded frame, or None when the frame is dropped or isn't valid JSON
+    def decode(self, msg: str) -> typing.Optional[typing.Dict]:
+        event = self.sniff(msg)
+        name = event if event is not None else OTHER_EVENTS
+
+        # frames without the key are always decoded: they are rare and may be an error message to log
+        if event is not None and event not in self.accepted:
+            self._count(name, 0, 1, 0.0)
+            return None
+
+        start = time.perf_counter()
+        try:
+            data = _loads(msg)
+        except ValueError as e:
+            self._count(name, 0, 0, time.perf_counter() - start)
+            logger.error("Invalid websocket frame %s: %s", msg[:SNIFF_WINDOW], e)
+            return None
+
+        self._count(name, 1, 0, time.perf_counter() - start)
+
+        return data
+
+    # event -> {"frames", "decoded", "dropped", "seconds"}, a copy
+    def stats(self) -> typing.Dict[str, typing.Dict[str, float]]:
+        with self._lock:
+            return {event: dict(stats) for event, stats in self._stats.items()}
+
+    # frames received and decoded per second, in total and by event, since the previous call
+    def frame_rates(self) -> typing.Dict[str, float]:
+        now = time.monotonic()
+        elapsed = max(now - self._rates_since, 1e-9)
+
+        counts = {event: (stats['frames'], stats['decoded']) for event, stats in self.stats().items()}
+
+        rates = dict()
+        received = decoded = 0
+        for event, (frames, event_decoded) in counts.items():
+            previous = self._rates_counts.get(event, (0, 0))
+            rates[event] = round((frames - previous[0]) / elapsed, 1)
+            received += frames - previous[0]
+            decoded += event_decoded - previous[1]
+
+        rates['received'] = round(received / elapsed, 1)
+        rates['decoded'] = round(decoded / elapsed, 1)
+
+        self._rates_since = now
+        self._rates_counts = counts
+
+        return rates
@@ -0,0 +1,153 @@
+import logging
+import queue
+import threading
+import typing
+import zlib
+
+from connectors.routing import StrategyRouter
+
+logger = logging.getLogger()
+
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_SIZE = 10000
+
+# what submit() does when the queue of a worker is full:
+# "block" waits for room (backpressure: the websocket thread stops reading and frames wait in the socket buffer)
+# "drop_oldest" discards the oldest queued trade to make room, the websocket thread never waits
+# The asyncio connectors mustn't block their event loop in submit(): with "block" they stop reading the market
+# websocket until has_room(), the other connections and the REST requests of the strategies keep running.
+OVERFLOW_POLICIES = ("block", "drop_oldest")
+
+
+# Decouples the websocket thread from the strategies: the websocket callback only decodes the frame and submits the
+# trades, worker threads update the candles of the symbol and run check_trade() (including the REST calls of
+# _open_position).
+# A symbol is always handled by the same worker, so the trades of a symbol keep their order and a strategy is only
+# ever called from one thread.
+class TradeDispatcher:
+    def __init__(self, router: StrategyRouter, name: str, workers: int = DEFAULT_WORKERS,
+                 queue_size: int = DEFAULT_QUEUE_SIZE, overflow: str = "block"):
+
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown queue overflow policy {overflow}, expected one of {OVERFLOW_POLICIES}")
+
+        self._router = router
+        self._name = name
+        self._overflow = overflow
+
+        self._queues: typing.List[queue.Queue] = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+
+        # the submit counters are updated by every thread submitting trades (the websocket threads of the
+        # connections, the replays), the processed ones by their worker only
+        self._counters_lock = threading.Lock()
+        self._submitted = 0
+        self._dropped = 0
+        self._max_depth = 0
+        self._processed = [0] * workers
+
+        self._threads: typing.List[threading.Thread] = []
+
+    def start(self):
+        for idx, q in enumerate(self._queues):
+            t = threading.Thread(target=self._run, args=(idx, q), name=f"{self._name} dispatch {idx}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _queue_for(self, symbol: str) -> queue.Queue:
+        return self._queues[zlib.crc32(symbol.encode()) % len(self._queues)]
+
+    def _put(self, q: queue.Queue, item: typing.Tuple):
+        dropped = 0
+
+        if self._overflow == "block":
+            q.put(item)
+        else:
+            while True:
+                try:
+                    q.put_nowait(item)
+                    break
+                except queue.Full:
+                    try:
+                        q.get_nowait()
+                        q.task_done()
+                        dropped += 1
+                    except queue.Empty:
+                        pass
+
+        depth = q.qsize()
+
+        with self._counters_lock:
+            self._submitted += 1
+            self._dropped += dropped
+            if depth > self._max_depth:
+                self._max_depth = depth
+
+    # True when every queue has room for the trades of one more frame (at most one item per symbol traded), so that
+    # submitting them doesn't block
+    def has_room(self) -> bool:
+        if self._overflow != "block":
+            return True
+
+        needed = max(1, len(self._router.symbols()))
+        return all(q.maxsize - q.qsize() >= min(needed, q.maxsize) for q in self._queues)
+
+    # called from the websocket thread: trades of symbols without strategies are not queued
+    def submit(self, symbol: str, price: float, size: float, timestamp: int):
+        if len(self._router.get(symbol)) == 0:
+            return
+
+        self._put(self._queue_for(symbol), (symbol, price, size, timestamp))
+
+    # several trades of a symbol received together: the strategies fold them in one candle update
+    # and evaluate their signal once
+    def submit_batch(self, symbol: str, trades: typing.List[typing.Tuple[float, float, int]]):
+        if len(self._router.get(symbol)) == 0:
+            return
+
+        self._put(self._queue_for(symbol), (symbol, trades))
+
+    def _run(self, idx: int, q: queue.Queue):
+        while True:
+            item = q.get()
+            symbol = item[0]
+
+            # the candles of every timeframe of the symbol are updated once, then each strategy checks its signal
+            aggregator = self._router.aggregator(symbol)
+            ticks = dict()
+            if aggregator is not None:
+                try:
+                    if len(item) == 2:
+                        ticks = aggregator.update_batch(item[1])
+                    else:
+                        ticks = aggregator.update(item[1], item[2], item[3])
+                except Exception as e:
+                    logger.exception("%s error while building the %s candles: %s", self._name, symbol, e)
+
+            for strat in self._router.get(symbol):
+                # a strategy added after the candles update waits for the next trade
+                tick_type = ticks.get(strat.tf)
+                if tick_type is None:
+                    continue
+
+                try:
+                    strat.check_trade(tick_type)
+                except Exception as e:
+                    logger.exception("%s error while processing a %s trade for %s %s: %s", self._name, symbol,
+                                     strat.strat_name, strat.tf, e)
+
+            self._processed[idx] += 1
+            q.task_done()
+
+    # blocks until every submitted trade was processed
+    def wait_idle(self):
+        for q in self._queues:
+            q.join()
+
+    def stats(self) -> typing.Dict[str, typing.Union[int, typing.List[int]]]:
+        depths = [q.qsize() for q in self._queues]
+
+        with self._counters_lock:
+            submitted, dropped, max_depth = self._submitted, self._dropped, self._max_depth
+
+        return {"submitted": submitted, "processed": sum(self._processed), "dropped": dropped,
+                "queue_depth": sum(depths), "queue_depths": depths, "max_queue_depth": max_depth}
@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import os
+import tempfile
+import threading
+import time
+import typing
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from models import Candle, Contract
+from candle_store import CandleStore, DEFAULT_CAPACITY
+from strategies import TF_EQUIV
+
+logger = logging.getLogger()
+
+DEFAULT_CACHE_DIR = os.path.join("cache", "history")
+DEFAULT_WORKERS = 4
+
+COLUMNS = ("timestamp", "open", "high", "low", "close", "volume")
+
+
+# spaces out the requests of several threads to stay under the exchange rate limit
+class RateLimiter:
+    def __init__(self, requests_per_second: float):
+        self._interval = 1 / requests_per_second
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    # seconds to wait before sending the request, for the callers that can't block (asyncio)
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self._interval
+
+        return slot - now
+
+
+# Historical candles of any depth for a connector.
+# The candles are downloaded in pages (the connector get_candles_page() method) fetched concurrently within the
+# connector rate limit, and persisted per exchange / symbol / timeframe in a local .npz file (one array per column).
+# Later requests only download what the cache doesn't have: the tail since the last cached candle (and the head if a
+# deeper history is requested).
+class HistoryService:
+    def __init__(self, client, exchange: str, page_size: int, requests_per_second: float,
+                 cache_dir: str = DEFAULT_CACHE_DIR, workers: int = DEFAULT_WORKERS):
+        self._client = client
+        self._exchange = exchange
+        self._page_size = page_size
+        self._rate_limiter = RateLimiter(requests_per_second)
+        self._cache_dir = cache_dir
+        self._workers = workers
+
+    def _cache_path(self, symbol: str, timeframe: str) -> str:
+        return os.path.join(self._cache_dir, self._exchange, f"{symbol}_{timeframe}.npz")
+
+    def _load(self, symbol: str, timeframe: str) -> typing.Optional[typing.Dict[str, np.ndarray]]:
+        path = self._cache_path(symbol, timeframe)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with np.load(path) as cached:
+                columns = {name: cached[name] for name in COLUMNS}
+        except Exception as e:
+            logger.error("Error while reading the %s %s %s candle cache: %s", self._exchange, symbol, timeframe, e)
+            return None
+
+        if len(columns['timestamp']) == 0:
+            return None
+
+        return columns
+
+    def _save(self, symbol: str, timeframe: str, columns: typing.Dict[str, np.ndarray]):
+        path = self._cache_path(symbol, timeframe)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # written to a temporary file first so a crash never leaves a truncated cache behind. Each save has its own
+        # temporary file: two strategies loading the same contract at once mustn't write into the same one
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".",
+                                             suffix=".tmp", delete=False) as f:
+                tmp_path = f.name
+                np.savez(f, **columns)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error("Error while writing the %s %s %s candle cache: %s", self._exchange, symbol, timeframe, e)
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    # [start, end] range of candle open times split in windows of one page each
+    def _pages(self, start: int, end: int, tf_ms: int) -> typing.List[typing.Tuple[int, int]]:
+        pages = []
+        page_span = self._page_size * tf_ms
+
+        while start <= end:
+            pages.append((start, min(start + page_span - tf_ms, end)))
+            start += page_span
+
+        return pages
+
+    def _fetch_page(self, contract: Contract, timeframe: str,
+                    page: typing.Tuple[int, int]) -> typing.Optional[typing.List[Candle]]:
+        self._rate_limiter.wait()
+        return self._client.get_candles_page(contract, timeframe, page[0], page[1])
+
+    # cached candles and pages to download for the last `depth` candles
+    def _plan(self, contract: Contract, timeframe: str, depth: int) -> \
+            typing.Tuple[typing.Optional[typing.Dict[str, np.ndarray]], typing.List[typing.Tuple[int, int]], int]:
+        tf_ms = TF_EQUIV[timeframe] * 1000
+
+        now = int(time.time() * 1000)
+        current_open = now - now % tf_ms
+        wanted_start = current_open - (depth - 1) * tf_ms
+
+        cached = self._load(contract.symbol, timeframe)
+
+        # a cache ending before the wanted window is started again from the window: bridging the gap would download
+        # days or weeks of candles nobody asked for, at the rate limit of the exchange
+        if cached is not None and int(cached['timestamp'][-1]) < wanted_start:
+            cached = None
+
+        ranges = []
+        if cached is None:
+            ranges.append((wanted_start, current_open))
+        else:
+            first_ts = int(cached['timestamp'][0])
+            last_ts = int(cached['timestamp'][-1])
+
+            if wanted_start < first_ts:
+                ranges.append((wanted_start, first_ts - tf_ms))
+            # the last cached candle may have been saved while still open, it is downloaded again
+            ranges.append((max(last_ts, wanted_start), current_open))
+
+        pages = [page for start, end in ranges for page in self._pages(start, end, tf_ms)]
+
+        return cached, pages, wanted_start
+
+    def _complete(self, contract: Contract, timeframe: str, depth: int,
+                  cached: typing.Optional[typing.Dict[str, np.ndarray]], pages: typing.List[typing.Tuple[int, int]],
+                  wanted_start: int, results: typing.List[typing.Optional[typing.List[Candle]]]) -> CandleStore:
+
+        complete = all(result is not None for result in results)
+        downloaded = [candle for result in results if result is not None for candle in result]
+
+        logger.info("%s %s %s: %s candles downloaded in %s pages, %s cached", self._exchange, contract.symbol,
+                    timeframe, len(downloaded), len(pages), 0 if cached is None else len(cached['timestamp']))
+
+        columns = self._merge(cached, downloaded)
+
+        # a failed page would leave a hole in the cache, it is only saved when every page was downloaded
+        if complete and len(columns['timestamp']) > 0:
+            self._save(contract.symbol, timeframe, columns)
+
+        keep = columns['timestamp'] >= wanted_start
+
+        return CandleStore.from_arrays(*(columns[name][keep] for name in COLUMNS),
+                                       capacity=max(DEFAULT_CAPACITY, depth))
+
+    def get_candles(self, contract: Contract, timeframe: str, depth: int) -> CandleStore:
+        cached, pages, wanted_start = self._plan(contract, timeframe, depth)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self._workers, len(pages)))) as executor:
+            results = list(executor.map(lambda p: self._fetch_page(contract, timeframe, p), pages))
+
+        return self._complete(contract, timeframe, depth, cached, pages, wanted_start, results)
+
+    # same as get_candles() for the asyncio connectors, whose get_candles_page() is a coroutine: the pages are
+    # requested concurrently on the event loop and the cache file is read and written in the default executor
+    async def get_candles_async(self, contract: Contract, timeframe: str, depth: int) -> CandleStore:
+        loop = asyncio.get_running_loop()
+        cached, pages, wanted_start = await loop.run_in_executor(None, self._plan, contract, timeframe, depth)
+
+        semaphore = asyncio.Semaphore(self._workers)
+
+        async def fetch_page(page: typing.Tuple[int, int]) -> typing.Optional[typing.List[Candle]]:
+            async with semaphore:
+                delay = self._rate_limiter.reserve()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                return await self._client.get_candles_page(contract, timeframe, page[0], page[1])
+
+        results = await asyncio.gather(*(fetch_page(page) for page in pages))
+
+        return await loop.run_in_executor(None, self._complete, contract, timeframe, depth, cached, pages,
+                                          wanted_start, list(results))
+
+    # cached and downloaded candles ordered by timestamp, a downloaded candle replaces the cached one
+    @staticmethod
+    def _merge(cached: typing.Optional[typing.Dict[str, np.ndarray]],
+               downloaded: typing.List[Candle]) -> typing.Dict[str, np.ndarray]:
+
+        new = {"timestamp": np.array([c.timestamp for c in downloaded], dtype=np.int64)}
+        for name in COLUMNS[1:]:
+            new[name] = np.array([getattr(c, name) for c in downloaded], dtype=np.float64)
+
+        if cached is None:
+            columns = new
+        else:
+            columns = {name: np.concatenate((cached[name], new[name])) for name in COLUMNS}
+
+        # keep the last occurrence of each timestamp: reversed so np.unique returns the downloaded row
+        reversed_ts = columns['timestamp'][::-1]
+        _, first_idx = np.unique(reversed_ts, return_index=True)
+        order = len(reversed_ts) - 1 - first_idx
+
+        return {name: columns[name][order] for name in COLUMNS}
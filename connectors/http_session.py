@@ -0,0 +1,57 @@
+import typing
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Keep-alive HTTP sessions for the REST calls of the connectors: the TCP + TLS connection to the exchange is opened
+# once and reused by the next requests, instead of a new handshake for every order, balance and status check.
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = (3.05, 10)  # seconds to connect, seconds to read the response
+DEFAULT_RETRIES = 2
+
+
+def create_session(pool_size: int = DEFAULT_POOL_SIZE, retries: int = DEFAULT_RETRIES,
+                   headers: typing.Optional[typing.Dict[str, str]] = None) -> requests.Session:
+
+    # only GET requests are retried on read errors and server errors: a POST or DELETE that reached the exchange
+    # may have been executed, repeating it could place or cancel an order twice
+    retry = Retry(total=retries, backoff_factor=0.2, allowed_methods=frozenset(["GET"]),
+                  status_forcelist=(500, 502, 503, 504), raise_on_status=False)
+
+    # each connector talks to a single host, pool_connections is the number of hosts kept in the pool cache
+    # and pool_maxsize the number of connections kept alive for this host (one per concurrent thread)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    if headers is not None:
+        session.headers.update(headers)
+
+    return session
+
+
+# number of requests sent and connections opened by the session: reused = requests - connections
+def session_stats(session: requests.Session) -> typing.Dict[str, int]:
+    stats = {"requests": 0, "connections": 0, "reused": 0}
+
+    seen = set()
+    for adapter in session.adapters.values():
+        if id(adapter) in seen:
+            continue
+        seen.add(id(adapter))
+
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats['requests'] += pool.num_requests
+            stats['connections'] += pool.num_connections
+
+    stats['reused'] = max(stats['requests'] - stats['connections'], 0)
+
+    return stats
@@ -0,0 +1,181 @@
+import collections
+import logging
+import threading
+import typing
+
+from models import Contract, OrderStatus
+
+logger = logging.getLogger()
+
+# statuses after which an order never changes again (OrderStatus.status is lower case for both exchanges)
+FINAL_STATUSES = ("filled", "canceled", "expired", "rejected")
+
+# updates of orders not tracked yet that are kept: the fill of a market order is often pushed by the exchange
+# before the REST answer of the order placement reaches the strategy
+EARLY_UPDATES_SIZE = 1000
+
+
+# Pending orders of a connector and the callbacks of their owners.
+# The connector feeds the order updates pushed by the exchange user data stream to on_update(), the callback of the
+# order is called with every update until the order reaches a final status. REST is only used by resync(), called
+# when the user data stream (re)connects, for the orders whose updates may have been missed while disconnected.
+class OrderTracker:
+    # get_order_status is None for the asyncio connectors, they request the pending_orders() themselves and feed the
+    # answers to on_polled()
+    def __init__(self, name: str, get_order_status: typing.Optional[typing.Callable[[Contract, typing.Any],
+                                                                                    typing.Optional[OrderStatus]]]):
+        self._name = name
+        self._get_order_status = get_order_status
+
+        self._lock = threading.Lock()
+        # str(order id) -> (contract, order id, callback)
+        self._pending: typing.Dict[str, typing.Tuple[Contract, typing.Any, typing.Callable[[OrderStatus], None]]] = \
+            dict()
+        self._early: typing.OrderedDict[str, OrderStatus] = collections.OrderedDict()
+
+        # a resync is running in the background / another one was asked for while it ran
+        self._resyncing = False
+        self._resync_requested = False
+
+        self.pushed = 0
+        self.polled = 0
+
+    def track(self, contract: Contract, order_id, callback: typing.Callable[[OrderStatus], None]):
+        key = str(order_id)
+
+        with self._lock:
+            early = self._early.pop(key, None)
+            if early is None or early.status not in FINAL_STATUSES:
+                self._pending[key] = (contract, order_id, callback)
+
+        if early is not None:
+            self._notify(callback, early)
+
+    def on_update(self, order_status: OrderStatus):
+        if self._update(order_status):
+            self.pushed += 1
+
+    # REST fallback: status of every pending order, after a (re)connection of the user data stream
+    def resync(self):
+        for contract, order_id in self.pending_orders():
+            order_status = self._get_order_status(contract, order_id)
+            if order_status is not None:
+                self.on_polled(order_status)
+
+    # resync() in a thread of its own, for the websocket callbacks: the frames received meanwhile don't wait for the
+    # REST requests. A resync asked for while one runs is run again after it, the orders placed since are included
+    def resync_in_background(self):
+        with self._lock:
+            self._resync_requested = True
+            if self._resyncing:
+                return
+            self._resyncing = True
+
+        t = threading.Thread(target=self._run_resyncs, name=f"{self._name} orders resync", daemon=True)
+        t.start()
+
+    def _run_resyncs(self):
+        while True:
+            with self._lock:
+                if not self._resync_requested:
+                    self._resyncing = False
+                    return
+                self._resync_requested = False
+
+            try:
+                self.resync()
+            except Exception as e:
+                logger.exception("%s error while requesting the pending orders: %s", self._name, e)
+
+    def pending_orders(self) -> typing.List[typing.Tuple[Contract, typing.Any]]:
+        with self._lock:
+            return [(contract, order_id) for contract, order_id, callback in self._pending.values()]
+
+    # status of a pending order requested over REST
+    def on_polled(self, order_status: OrderStatus):
+        if self._update(order_status):
+            self.polled += 1
+
+    # False when the order isn't tracked (yet)
+    def _update(self, order_status: OrderStatus) -> bool:
+        key = str(order_status.order_id)
+
+        with self._lock:
+            entry = self._pending.get(key)
+
+            if entry is None:
+                self._early[key] = order_status
+                self._early.move_to_end(key)
+                if len(self._early) > EARLY_UPDATES_SIZE:
+                    self._early.popitem(last=False)
+                return False
+
+            if order_status.status in FINAL_STATUSES:
+                del self._pending[key]
+
+        self._notify(entry[2], order_status)
+
+        return True
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def _notify(self, callback: typing.Callable[[OrderStatus], None], order_status: OrderStatus):
+        try:
+            callback(order_status)
+        except Exception as e:
+            logger.exception("%s error in the update callback of order %s: %s", self._name, order_status.order_id, e)
+
+
+ORDER_CACHE_SIZE = 10000
+
+
+# Last known state of the orders of a connector, by order id, fed with the REST answers (place_order, cancel_order)
+# and the pushed order updates. The orders that aren't final may be stale after a disconnection of the stream,
+# invalidate_open() drops them so the next lookup goes to the exchange.
+class OrderCache:
+    def __init__(self, size: int = ORDER_CACHE_SIZE):
+        self._size = size
+        self._lock = threading.Lock()
+        self._orders: typing.OrderedDict[str, OrderStatus] = collections.OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, order_id) -> typing.Optional[OrderStatus]:
+        order_status = self._orders.get(str(order_id))
+
+        if order_status is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return order_status
+
+    # returns the order status completed with the known average price
+    def update(self, order_status: OrderStatus) -> OrderStatus:
+        key = str(order_status.order_id)
+
+        with self._lock:
+            known = self._orders.get(key)
+
+            # the update rows of the order table only carry the changed fields
+            if order_status.avg_price is None and known is not None:
+                order_status = OrderStatus(order_status.order_id, order_status.status, known.avg_price)
+
+            self._orders[key] = order_status
+            self._orders.move_to_end(key)
+            if len(self._orders) > self._size:
+                self._orders.popitem(last=False)
+
+        return order_status
+
+    def invalidate_open(self):
+        with self._lock:
+            for key in [k for k, o in self._orders.items() if o.status not in FINAL_STATUSES]:
+                del self._orders[key]
+
+    def stats(self) -> typing.Dict[str, typing.Union[int, float]]:
+        lookups = self.hits + self.misses
+        return {"size": len(self._orders), "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups > 0 else 0.0}
@@ -0,0 +1,192 @@
+import argparse
+import glob
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+import typing
+
+from models import Contract, iso_to_ms
+
+logger = logging.getLogger()
+
+# Raw websocket frame recording and replay.
+# The recorder writes every frame reaching a connector _on_message() with its receive time to gzip files,
+# one "<receive time ns>\t<frame>" line per frame, starting a new file (segment) every segment_frames frames or
+# segment_seconds seconds. The replayer reads the segments back in order and feeds the frames to a callback,
+# normally the _on_message() of an offline connector (connect=False), as fast as possible or at the recorded speed.
+
+DEFAULT_SEGMENT_FRAMES = 500000
+DEFAULT_SEGMENT_SECONDS = 3600
+SEGMENT_SUFFIX = ".frames.gz"
+
+
+class FrameRecorder:
+    def __init__(self, directory: str, exchange: str, segment_frames: int = DEFAULT_SEGMENT_FRAMES,
+                 segment_seconds: float = DEFAULT_SEGMENT_SECONDS):
+        self._directory = directory
+        self._exchange = exchange
+        self._segment_frames = segment_frames
+        self._segment_ns = int(segment_seconds * 1e9)
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._segment_start = 0
+        self._segment_count = 0
+
+        self.frames = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def _open_segment(self, now: int):
+        if self._file is not None:
+            self._file.close()
+
+        # the receive time of the first frame in the name: segments sort in recording order
+        path = os.path.join(self._directory, f"{self._exchange}-{now:019d}{SEGMENT_SUFFIX}")
+        self._file = gzip.open(path, "wt", encoding="utf-8", compresslevel=1)
+        self._segment_start = now
+        self._segment_count = 0
+
+    def record(self, msg: str):
+        now = time.time_ns()
+
+        with self._lock:
+            if self._file is None or self._segment_count >= self._segment_frames or \
+                    now - self._segment_start >= self._segment_ns:
+                self._open_segment(now)
+
+            # JSON frames never contain a raw new line inside a string, replacing the others keeps one frame per line
+            self._file.write(f"{now}\t{msg.replace(chr(10), ' ')}\n")
+
+            self._segment_count += 1
+            self.frames += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class FrameReplayer:
+    def __init__(self, directory: str, exchange: str):
+        self.paths = sorted(glob.glob(os.path.join(directory, f"{exchange}-*{SEGMENT_SUFFIX}")))
+
+    def frames(self) -> typing.Iterator[typing.Tuple[int, str]]:
+        for path in self.paths:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    recv_ns, msg = line.rstrip("\n").split("\t", 1)
+                    yield int(recv_ns), msg
+
+    # speed None: as fast as possible, else a multiple of the recorded speed (1.0 = as recorded)
+    def replay(self, callback: typing.Callable[[str], None],
+               speed: typing.Optional[float] = None) -> typing.Dict[str, float]:
+        count = 0
+        first_recv = None
+        start = time.perf_counter()
+
+        for recv_ns, msg in self.frames():
+            if speed is not None:
+                if first_recv is None:
+                    first_recv = recv_ns
+                delay = (recv_ns - first_recv) / 1e9 / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+
+            callback(msg)
+            count += 1
+
+        elapsed = time.perf_counter() - start
+
+        return {"frames": count, "seconds": elapsed, "frames_per_second": count / elapsed if elapsed > 0 else 0.0}
+
+
+# first trade (price, timestamp) of each symbol in a recording, used to seed the candles of the replayed strategies
+def _first_trades(replayer: FrameReplayer, exchange: str,
+                  symbols: typing.List[str]) -> typing.Dict[str, typing.Tuple[float, int]]:
+    first = dict()
+
+    for recv_ns, msg in replayer.frames():
+        data = json.loads(msg)
+
+        if exchange == "binance" and data.get('e') == "aggTrade":
+            trades = [(data['s'], float(data['p']), data['T'])]
+        elif exchange == "bitmex" and data.get('table') == "trade":
+            trades = [(d['symbol'], float(d['price']), iso_to_ms(d['timestamp'])) for d in data['data']]
+        else:
+            continue
+
+        for symbol, price, ts in trades:
+            if symbol in symbols and symbol not in first:
+                first[symbol] = (price, ts)
+
+        if len(first) == len(symbols):
+            break
+
+    return first
+
+
+# Offline throughput of the real decode -> dispatch -> parse_trades/check_trade path on a recording:
+# python -m connectors.recorder <directory> binance --symbols BTCUSDT,ETHUSDT --strategy Breakout --timeframe 1m
+def main():
+    from connectors.binance_futures import BinanceFuturesClient
+    from connectors.bitmex import BitmexClient
+    from strategies import TechnicalStrategy, BreakoutStrategy, TF_EQUIV
+
+    parser = argparse.ArgumentParser(description="Replay recorded websocket frames through an offline connector")
+    parser.add_argument("directory")
+    parser.add_argument("exchange", choices=["binance", "bitmex"])
+    parser.add_argument("--symbols", required=True, help="comma separated symbols to run strategies on")
+    parser.add_argument("--strategy", choices=["Technical", "Breakout"], default="Breakout")
+    parser.add_argument("--timeframe", choices=list(TF_EQUIV.keys()), default="1m")
+    parser.add_argument("--strategies-per-symbol", type=int, default=1)
+    parser.add_argument("--speed", type=float, default=None, help="1.0 = recorded speed, default as fast as possible")
+    args = parser.parse_args()
+
+    # the replayed trades are old: the trade lag warnings of parse_trades would flood the output
+    logging.basicConfig(level=logging.ERROR)
+
+    replayer = FrameReplayer(args.directory, args.exchange)
+    if len(replayer.paths) == 0:
+        parser.error(f"No {args.exchange} recording in {args.directory}")
+
+    if args.exchange == "binance":
+        client = BinanceFuturesClient("", "", True, connect=False)
+    else:
+        client = BitmexClient("", "", True, connect=False)
+
+    symbols = args.symbols.split(",")
+    first_trades = _first_trades(replayer, args.exchange, symbols)
+
+    tf_ms = TF_EQUIV[args.timeframe] * 1000
+    strategy_class = TechnicalStrategy if args.strategy == "Technical" else BreakoutStrategy
+    other_params = {"rsi_length": 14, "ema_fast": 12, "ema_slow": 26, "ema_signal": 9, "min_volume": 0.0}
+
+    b_index = 0
+    for symbol, (price, ts) in first_trades.items():
+        contract = Contract(symbol, "", "", 8, 8, 1e-8, 1e-8)
+        for _ in range(args.strategies_per_symbol):
+            strat = strategy_class(client, contract, args.exchange, args.timeframe, 1, 1, 1, other_params)
+            open_ts = ts - ts % tf_ms
+            strat.candles.append(open_ts - tf_ms, price, price, price, price, 0)
+            strat.candles.append(open_ts, price, price, price, price, 0)
+            client.add_strategy(b_index, strat)
+            b_index += 1
+
+    start = time.perf_counter()
+    result = replayer.replay(lambda msg: client._on_message(None, msg), args.speed)
+
+    # the trades are only queued by _on_message, the replay ends when the strategies processed all of them
+    client.wait_idle()
+    result['seconds_with_strategies'] = time.perf_counter() - start
+
+    print(json.dumps({"replay": result, "strategies": b_index, "decoder": client.decoder_stats(),
+                      "dispatch": client.dispatch_stats()}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
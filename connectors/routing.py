@@ -0,0 +1,86 @@
+import threading
+import typing
+
+from candle_aggregator import CandleAggregator
+from candle_store import CandleStore
+
+if typing.TYPE_CHECKING:
+    from strategies import Strategy
+
+
+# symbol -> strategies index used by the connectors to dispatch each trade only to the strategies trading it.
+# The index is copy-on-write: add/remove (Tk thread) build a new dict of tuples and swap the reference, so the
+# websocket thread reads it with a single dict lookup and without taking the lock.
+# The router also keeps the candle aggregator of every symbol traded: the strategies of a symbol and timeframe
+# share one CandleStore, built once per trade by the dispatcher.
+class StrategyRouter:
+    def __init__(self):
+        self._lock = threading.Lock()
+
+        self.strategies: typing.Dict[int, "Strategy"] = dict()
+        self._by_symbol: typing.Dict[str, typing.Tuple["Strategy", ...]] = dict()
+        self._aggregators: typing.Dict[str, CandleAggregator] = dict()
+
+    def _rebuild(self):
+        by_symbol = dict()
+        for strat in self.strategies.values():
+            by_symbol.setdefault(strat.contract.symbol, []).append(strat)
+
+        self._by_symbol = {symbol: tuple(strats) for symbol, strats in by_symbol.items()}
+
+    # the candles of the strategy are replaced by the ones already built for its symbol and timeframe, if any
+    def add(self, key: int, strategy: "Strategy"):
+        with self._lock:
+            previous = self.strategies.get(key)
+            if previous is not None:
+                self._release_candles(previous)
+
+            aggregators = dict(self._aggregators)
+            symbol = strategy.contract.symbol
+            if symbol not in aggregators:
+                aggregators[symbol] = CandleAggregator(strategy.exchange, symbol)
+            strategy.candles = aggregators[symbol].add(strategy.tf, strategy.tf_equiv, strategy.candles)
+            self._aggregators = aggregators
+
+            self.strategies[key] = strategy
+            self._rebuild()
+
+    def remove(self, key: int) -> typing.Optional["Strategy"]:
+        with self._lock:
+            strategy = self.strategies.pop(key, None)
+            if strategy is not None:
+                self._release_candles(strategy)
+            self._rebuild()
+
+        return strategy
+
+    def _release_candles(self, strategy: "Strategy"):
+        symbol = strategy.contract.symbol
+        aggregator = self._aggregators[symbol]
+        aggregator.remove(strategy.tf)
+
+        if len(aggregator) == 0:
+            aggregators = dict(self._aggregators)
+            del aggregators[symbol]
+            self._aggregators = aggregators
+
+    def get(self, symbol: str) -> typing.Tuple["Strategy", ...]:
+        return self._by_symbol.get(symbol, ())
+
+    def aggregator(self, symbol: str) -> typing.Optional[CandleAggregator]:
+        return self._aggregators.get(symbol)
+
+    # candles built live for the symbol and timeframe, None if no strategy uses them
+    def candles(self, symbol: str, timeframe: str) -> typing.Optional[CandleStore]:
+        aggregator = self._aggregators.get(symbol)
+        if aggregator is None:
+            return None
+        return aggregator.candles(timeframe)
+
+    def symbols(self) -> typing.List[str]:
+        return list(self._by_symbol.keys())
+
+    def stats(self) -> typing.Dict[str, typing.Union[int, typing.Dict[str, typing.List[str]]]]:
+        aggregators = self._aggregators
+        return {"strategies": len(self.strategies), "symbols": len(aggregators),
+                "timeframes": {symbol: a.timeframes() for symbol, a in aggregators.items()}}
@@ -0,0 +1,32 @@
+import threading
+import time
+import typing
+
+
+# Time at which each startup phase of a connector completed, in seconds since the creation of the client.
+# The slow phases (REST requests, connections) run in the background so that the constructor returns right away,
+# a phase is only recorded the first time it completes (not on the reconnections).
+class StartupTimer:
+    def __init__(self, name: str):
+        self._name = name
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+        self.phases: typing.Dict[str, float] = dict()
+
+    def mark(self, phase: str):
+        elapsed = time.monotonic() - self._start
+        with self._lock:
+            self.phases.setdefault(phase, elapsed)
+
+    # runs target() in a daemon thread and records the phase when it returns
+    def background(self, phase: str, target: typing.Callable[[], typing.Any]):
+        def run():
+            target()
+            self.mark(phase)
+
+        t = threading.Thread(target=run, name=f"{self._name} {phase}", daemon=True)
+        t.start()
+
+    def stats(self) -> typing.Dict[str, float]:
+        with self._lock:
+            return {phase: round(elapsed, 4) for phase, elapsed in self.phases.items()}
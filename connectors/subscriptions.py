@@ -0,0 +1,186 @@
+import json
+import logging
+import threading
+import time
+import typing
+
+import websocket
+
+logger = logging.getLogger()
+
+# Binance closes a connection subscribed to more than 200 streams ("invalid close opcode")
+DEFAULT_MAX_STREAMS = 200
+
+
+class _Shard:
+    def __init__(self, index: int):
+        self.index = index
+        self.streams: typing.Set[str] = set()
+        self.ws: typing.Optional[websocket.WebSocketApp] = None
+        self.connected = False
+        self.closed = False
+
+
+# Market stream subscriptions of the Binance connector, driven by demand: a stream (e.g. "btcusdt@aggTrade") is
+# subscribed while at least one user acquired it (a strategy, a watchlist row) and unsubscribed after the last
+# release. The streams are spread over several websocket connections (shards) of at most max_streams streams each,
+# a shard is opened when the others are full and closed when it has no stream left.
+# Every shard reconnects on its own and subscribes again to all its streams when its connection opens.
+class SubscriptionManager:
+    def __init__(self, name: str, wss_url: str, on_message: typing.Callable[[websocket.WebSocketApp, str], None],
+                 on_open: typing.Optional[typing.Callable[[int], None]] = None,
+                 max_streams: int = DEFAULT_MAX_STREAMS, connect: bool = True):
+        self._name = name
+        self._wss_url = wss_url
+        self._on_message = on_message
+        self._on_open_callback = on_open
+        self.max_streams = max_streams
+        self._connect = connect
+
+        self._lock = threading.RLock()
+        self._users: typing.Dict[str, int] = dict()
+        self._shard_of: typing.Dict[str, _Shard] = dict()
+        self._shards: typing.List[_Shard] = []
+        self._next_index = 0
+
+        self._request_id = 1
+        self.messages_sent = 0
+        self.reconnections = 0
+
+    # streams users, the streams that weren't subscribed yet are subscribed
+    def acquire(self, streams: typing.Iterable[str]):
+        added: typing.Dict[_Shard, typing.List[str]] = dict()
+
+        with self._lock:
+            for stream in streams:
+                self._users[stream] = self._users.get(stream, 0) + 1
+                if self._users[stream] > 1:
+                    continue
+
+                shard = self._shard_with_room()
+                shard.streams.add(stream)
+                self._shard_of[stream] = shard
+                added.setdefault(shard, []).append(stream)
+
+            for shard, shard_streams in added.items():
+                if shard.ws is None:
+                    self._open(shard)
+                else:
+                    self._send(shard, "SUBSCRIBE", shard_streams)
+
+    # the streams without users left are unsubscribed, the shards without streams left are closed
+    def release(self, streams: typing.Iterable[str]):
+        removed: typing.Dict[_Shard, typing.List[str]] = dict()
+
+        with self._lock:
+            for stream in streams:
+                users = self._users.get(stream, 0)
+                if users == 0:
+                    continue
+                if users > 1:
+                    self._users[stream] = users - 1
+                    continue
+
+                del self._users[stream]
+                shard = self._shard_of.pop(stream)
+                shard.streams.discard(stream)
+                removed.setdefault(shard, []).append(stream)
+
+            for shard, shard_streams in removed.items():
+                if len(shard.streams) == 0:
+                    self._close(shard)
+                else:
+                    self._send(shard, "UNSUBSCRIBE", shard_streams)
+
+    def subscribed(self) -> typing.List[str]:
+        return list(self._users.keys())
+
+    def _shard_with_room(self) -> _Shard:
+        for shard in self._shards:
+            if len(shard.streams) < self.max_streams:
+                return shard
+
+        shard = _Shard(self._next_index)
+        self._next_index += 1
+        self._shards.append(shard)
+
+        return shard
+
+    def _open(self, shard: _Shard):
+        shard.ws = websocket.WebSocketApp(self._wss_url, on_open=lambda ws: self._on_open(shard),
+                                          on_close=lambda ws, *args: self._on_close(shard),
+                                          on_error=lambda ws, msg: self._on_error(shard, msg),
+                                          on_message=self._on_message)
+
+        if not self._connect:
+            return
+
+        t = threading.Thread(target=self._run, args=(shard,), name=f"{self._name} stream {shard.index}", daemon=True)
+        t.start()
+
+    def _close(self, shard: _Shard):
+        shard.closed = True
+        self._shards.remove(shard)
+
+        if shard.ws is not None and shard.connected:
+            shard.ws.close()
+
+    def _run(self, shard: _Shard):
+        while not shard.closed:
+            try:
+                shard.ws.run_forever()
+            except Exception as e:
+                logger.error("%s error in run_forever() method of stream connection %s: %s", self._name, shard.index, e)
+
+            if shard.closed:
+                break
+
+            self.reconnections += 1
+            time.sleep(2)
+
+    def _on_open(self, shard: _Shard):
+        logger.info("%s stream connection %s opened", self._name, shard.index)
+
+        # a new connection starts without any subscription
+        with self._lock:
+            if shard.closed:
+                shard.ws.close()
+                return
+
+            shard.connected = True
+            if len(shard.streams) > 0:
+                self._send(shard, "SUBSCRIBE", sorted(shard.streams))
+
+        if self._on_open_callback is not None:
+            self._on_open_callback(shard.index)
+
+    def _on_close(self, shard: _Shard):
+        shard.connected = False
+        if not shard.closed:
+            logger.warning("%s stream connection %s closed", self._name, shard.index)
+
+    def _on_error(self, shard: _Shard, msg):
+        logger.error("%s stream connection %s error: %s", self._name, shard.index, msg)
+
+    # the subscriptions of a shard not connected yet are sent by _on_open()
+    def _send(self, shard: _Shard, method: str, streams: typing.List[str]):
+        if not shard.connected:
+            return
+
+        data = dict()
+        data['method'] = method
+        data['params'] = streams
+        data['id'] = self._request_id
+        self._request_id += 1
+
+        try:
+            shard.ws.send(json.dumps(data))
+            self.messages_sent += 1
+        except Exception as e:
+            logger.error("Websocket error while sending %s of %s streams: %s", method, len(streams), e)
+
+    def stats(self) -> typing.Dict[str, typing.Union[int, typing.List[int]]]:
+        with self._lock:
+            return {"streams": len(self._users), "connections": len(self._shards),
+                    "streams_per_connection": [len(shard.streams) for shard in self._shards],
+                    "messages_sent": self.messages_sent, "reconnections": self.reconnections}
@@ -0,0 +1,65 @@
+import asyncio
+import functools
+import threading
+import typing
+
+
+# Blocking access to an asyncio connector (connectors/aio_binance_futures.py, connectors/aio_bitmex.py) for the code
+# written for the threaded connectors: the strategies, the Tk interface and the scripts.
+# The coroutine methods of the client are run on its event loop and their result is waited for, every other attribute
+# is the one of the client. Without a loop given, one is run in a daemon thread and shared by the adapters created
+# after, so that several connectors share a single I/O thread.
+class SyncAdapter:
+    _shared_loop: typing.Optional[asyncio.AbstractEventLoop] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, client, loop: typing.Optional[asyncio.AbstractEventLoop] = None,
+                 timeout: typing.Optional[float] = None):
+        self._client = client
+        self._loop = loop if loop is not None else self._get_shared_loop()
+        self._timeout = timeout
+
+        self.run(client.start())
+
+    @classmethod
+    def _get_shared_loop(cls) -> asyncio.AbstractEventLoop:
+        with cls._shared_lock:
+            if cls._shared_loop is None:
+                loop = asyncio.new_event_loop()
+                t = threading.Thread(target=loop.run_forever, name="Connectors event loop", daemon=True)
+                t.start()
+                cls._shared_loop = loop
+
+            return cls._shared_loop
+
+    @property
+    def client(self):
+        return self._client
+
+    # waits for the result of a coroutine run on the event loop of the client, from any other thread
+    def run(self, coro: typing.Coroutine) -> typing.Any:
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        if running is self._loop:
+            coro.close()
+            raise RuntimeError("SyncAdapter called from its own event loop, await the client coroutine instead")
+
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(self._timeout)
+
+    def close(self):
+        self.run(self._client.close())
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._client, name)
+
+        if asyncio.iscoroutinefunction(attr):
+            @functools.wraps(attr)
+            def blocking(*args, **kwargs):
+                return self.run(attr(*args, **kwargs))
+
+            return blocking
+
+        return attr
@@ -0,0 +1,244 @@
+import collections
+import logging
+import math
+import threading
+import typing
+
+import numpy as np
+import pandas as pd
+
+from candle_store import CandleStore
+from indicators import EMA, RSI
+
+logger = logging.getLogger()
+
+# indicators kept for all the strategies, an EMA / RSI / MACD signal state is a few floats
+DEFAULT_MAX_ENTRIES = 1000
+
+# (exchange, symbol, timeframe)
+SeriesKey = typing.Tuple[str, str, str]
+
+
+# signal line of a MACD whose fast and slow EMAs are entries of the cache shared with other indicators
+class _MACDSignal:
+    def __init__(self, fast: EMA, slow: EMA, signal: EMA):
+        self.fast = fast
+        self.slow = slow
+        self.signal = signal
+
+    # after the EMAs were updated with the close
+    def update(self):
+        self.signal.update(self.fast.value - self.slow.value)
+
+
+class _Series:
+    def __init__(self):
+        self.last_ts: typing.Optional[int] = None  # last closed candle fed to the indicators
+        # cache key -> indicator, the MACD signals are updated after the EMAs
+        self.indicators: typing.Dict[typing.Tuple, typing.Union[EMA, RSI]] = dict()
+        self.signals: typing.Dict[typing.Tuple, _MACDSignal] = dict()
+
+
+# Indicator values shared by all the strategies, keyed on (exchange, symbol, timeframe, indicator, params): two
+# TechnicalStrategy rows on the same contract and timeframe read the same EMAs and RSI, a MACD only owns its signal
+# line and shares its fast / slow EMAs with any other indicator using the same spans.
+# The indicators of a series are updated together once per closed candle, by the first lookup after the candle
+# closed; the next lookups of the candle are hits. An indicator missing from the cache is warmed up on the closed
+# candles of the series. The number of indicators kept is bounded, the least recently used ones are evicted.
+class IndicatorCache:
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        if max_entries < 3:
+            raise ValueError("An indicator cache needs room for at least 3 indicators (a MACD and its EMAs)")
+
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        # cache key -> series key, ordered from the least to the most recently used
+        self._lru: typing.OrderedDict[typing.Tuple, SeriesKey] = collections.OrderedDict()
+        self._series: typing.Dict[SeriesKey, _Series] = dict()
+
+        self.hits = 0
+        self.updates = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def ema(self, series: SeriesKey, candles: CandleStore, span: int) -> float:
+        with self._lock:
+            if not self._advance(series, candles):
+                return math.nan
+
+            key = series + ("ema", span)
+            ema = self._get(series, key)
+            if ema is None:
+                ema = EMA.from_span(span)
+                ema.warm_up(self._closes(candles))
+                self._add(series, key, ema)
+
+            return ema.value
+
+    # relative strength index of the last closed candle
+    def rsi(self, series: SeriesKey, candles: CandleStore, length: int) -> float:
+        with self._lock:
+            if not self._advance(series, candles):
+                return math.nan
+
+            key = series + ("rsi", length)
+            rsi = self._get(series, key)
+            if rsi is None:
+                rsi = RSI(length)
+                rsi.warm_up(self._closes(candles))
+                self._add(series, key, rsi)
+
+            return rsi.value
+
+    # macd line and macd signal of the last closed candle
+    def macd(self, series: SeriesKey, candles: CandleStore, ema_fast: int, ema_slow: int,
+             ema_signal: int) -> typing.Tuple[float, float]:
+        with self._lock:
+            if not self._advance(series, candles):
+                return math.nan, math.nan
+
+            key = series + ("macd", ema_fast, ema_slow, ema_signal)
+            fast_key = series + ("ema", ema_fast)
+            slow_key = series + ("ema", ema_slow)
+
+            # the EMAs are touched after the MACD: a MACD is always evicted before its EMAs
+            macd = self._get(series, key)
+            fast = self._get(series, fast_key, False)
+            slow = self._get(series, slow_key, False)
+
+            # the EMA series computed by a warm-up also give the macd line of a new MACD
+            closes = fast_values = slow_values = None
+            if macd is None or fast is None or slow is None:
+                closes = self._closes(candles)
+
+            if fast is None:
+                fast = EMA.from_span(ema_fast)
+                fast_values = fast.warm_up(closes)
+                self._add(series, fast_key, fast)
+            if slow is None:
+                slow = EMA.from_span(ema_slow)
+                slow_values = slow.warm_up(closes)
+                self._add(series, slow_key, slow)
+
+            if macd is None:
+                if fast_values is None:
+                    fast_values = closes.ewm(span=ema_fast).mean()
+                if slow_values is None:
+                    slow_values = closes.ewm(span=ema_slow).mean()
+
+                signal = EMA.from_span(ema_signal)
+                signal.warm_up(fast_values - slow_values)
+
+                macd = _MACDSignal(fast, slow, signal)
+                self._add(series, key, macd)
+
+            return fast.value - slow.value, macd.signal.value
+
+    # closes of the closed candles, the last candle is still being built
+    @staticmethod
+    def _closes(candles: CandleStore) -> pd.Series:
+        return pd.Series(candles.closes[:-1], dtype=float)
+
+    # the indicators of the series are fed the closes of the candles closed since the previous lookup.
+    # False if the series has no closed candle yet
+    def _advance(self, key: SeriesKey, candles: CandleStore) -> bool:
+        if len(candles) < 2:
+            return False
+
+        timestamps = candles.timestamps
+        closed_ts = int(timestamps[-2])
+
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _Series()
+        elif series.last_ts is not None and series.last_ts != closed_ts:
+            if len(timestamps) > 2 and int(timestamps[-3]) == series.last_ts:
+                # one candle closed since the previous lookup, the usual case
+                new_closes = (float(candles.closes[-2]),)
+            elif int(timestamps[0]) <= series.last_ts < closed_ts:
+                first_new = int(np.searchsorted(timestamps[:-1], series.last_ts, side="right"))
+                new_closes = candles.closes[first_new:-1].tolist()
+            else:
+                # older than the candles kept or newer than the last one: other candles than the ones the
+                # indicators were computed on, they are warmed up again
+                self._drop(key, series)
+                series = self._series[key] = _Series()
+                new_closes = ()
+
+            for close in new_closes:
+                for indicator in series.indicators.values():
+                    indicator.update(close)
+                for signal in series.signals.values():
+                    signal.update()
+
+            if len(new_closes) > 0:
+                self.updates += 1
+
+        series.last_ts = closed_ts
+
+        return True
+
+    def _get(self, series: SeriesKey, key: typing.Tuple, lookup: bool = True):
+        s = self._series[series]
+        indicator = s.signals.get(key) if key[3] == "macd" else s.indicators.get(key)
+
+        if indicator is not None:
+            self._lru.move_to_end(key)
+            if lookup:
+                self.hits += 1
+        elif lookup:
+            self.misses += 1
+
+        return indicator
+
+    def _add(self, series: SeriesKey, key: typing.Tuple, indicator):
+        s = self._series[series]
+        if key[3] == "macd":
+            s.signals[key] = indicator
+        else:
+            s.indicators[key] = indicator
+        self._lru[key] = series
+
+        while len(self._lru) > self.max_entries:
+            self._evict(next(iter(self._lru)))
+
+    def _evict(self, key: typing.Tuple):
+        series_key = self._lru.pop(key)
+        series = self._series[series_key]
+        self.evictions += 1
+
+        if key[3] == "macd":
+            del series.signals[key]
+        else:
+            indicator = series.indicators.pop(key)
+            # the MACDs reading an evicted EMA would stop being updated
+            for signal_key, signal in list(series.signals.items()):
+                if signal.fast is indicator or signal.slow is indicator:
+                    del series.signals[signal_key]
+                    del self._lru[signal_key]
+                    self.evictions += 1
+
+        if len(series.indicators) == 0 and len(series.signals) == 0:
+            del self._series[series_key]
+
+    def _drop(self, key: SeriesKey, series: _Series):
+        for indicator_key in list(series.indicators.keys()) + list(series.signals.keys()):
+            del self._lru[indicator_key]
+        del self._series[key]
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+            self._series.clear()
+
+    def stats(self) -> typing.Dict[str, typing.Union[int, float]]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._lru), "series": len(self._series), "lookups": lookups, "hits": self.hits,
+                    "misses": self.misses, "updates": self.updates, "evictions": self.evictions,
+                    "hit_rate": round(self.hits / lookups, 4) if lookups > 0 else 0.0}
+
+
+# cache of the live strategies
+shared_cache = IndicatorCache()
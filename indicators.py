@@ -0,0 +1,180 @@
+import math
+import typing
+
+import pandas as pd
+
+# Indicators used by the strategies, in two flavours:
+# - batch functions working on a pandas series of close prices (used to warm up from the historical candles)
+# - streaming classes keeping the indicator state and updating it in constant time for each closed candle
+# Both follow pandas ewm(adjust=True) so the streaming values match the batch ones.
+
+
+def rsi_series(closes: pd.Series, length: int) -> pd.Series:
+    # relative strength index, formulas:
+    # 100 - (100/1 + RS); RS = Relative Strength RS = Average Gain / Average Loss
+    delta = closes.diff().dropna()
+
+    up, down = delta.copy(), delta.copy()
+    up[up < 0] = 0
+    down[down > 0] = 0
+
+    avg_gain = up.ewm(com=(length - 1), min_periods=length).mean()
+    avg_loss = down.abs().ewm(com=(length - 1), min_periods=length).mean()
+
+    rs = avg_gain / avg_loss
+
+    rsi = 100 - 100 / (1 + rs)
+
+    return rsi.round(2)
+
+
+def macd_series(closes: pd.Series, ema_fast: int, ema_slow: int,
+                ema_signal: int) -> typing.Tuple[pd.Series, pd.Series]:
+    macd_line = closes.ewm(span=ema_fast).mean() - closes.ewm(span=ema_slow).mean()
+    macd_signal = macd_line.ewm(span=ema_signal).mean()
+
+    return macd_line, macd_signal
+
+
+# pandas ewm(adjust=True) written as a recursion: ema = num / den with
+# num = (1 - alpha) * num + x and den = (1 - alpha) * den + 1, so each new value costs O(1)
+class EMA:
+    def __init__(self, alpha: float, min_periods: int = 0):
+        self._decay = 1 - alpha
+        self._min_periods = max(min_periods, 1)
+
+        self._num = 0.0
+        self._den = 0.0
+
+        self.count = 0
+        self.value = math.nan
+
+    @classmethod
+    def from_span(cls, span: int, min_periods: int = 0) -> "EMA":
+        return cls(2 / (span + 1), min_periods)
+
+    @classmethod
+    def from_com(cls, com: float, min_periods: int = 0) -> "EMA":
+        return cls(1 / (com + 1), min_periods)
+
+    def update(self, x: float) -> float:
+        self._num = self._num * self._decay + x
+        self._den = self._den * self._decay + 1
+        self.count += 1
+
+        if self.count >= self._min_periods:
+            self.value = self._num / self._den
+
+        return self.value
+
+    # batch warm-up: pandas computes the EMA series and the recursion state is rebuilt from its last value
+    def warm_up(self, values: pd.Series) -> pd.Series:
+        n = len(values)
+        if n == 0:
+            return pd.Series(dtype=float)
+
+        ema = values.ewm(alpha=1 - self._decay).mean()
+        last = float(ema.iloc[-1])
+
+        self._den = (1 - self._decay ** n) / (1 - self._decay) if self._decay != 1 else float(n)
+        self._num = last * self._den
+        self.count = n
+
+        if self.count >= self._min_periods:
+            self.value = last
+
+        return ema
+
+
+def _rsi_from_averages(avg_gain: float, avg_loss: float) -> float:
+    if math.isnan(avg_gain) or math.isnan(avg_loss):
+        return math.nan
+
+    if avg_loss == 0:
+        # same results as the pandas division: gain / 0 = inf -> RSI 100, 0 / 0 = nan
+        return 100.0 if avg_gain > 0 else math.nan
+
+    return round(100 - 100 / (1 + avg_gain / avg_loss), 2)
+
+
+class RSI:
+    def __init__(self, length: int):
+        self._avg_gain = EMA.from_com(length - 1, min_periods=length)
+        self._avg_loss = EMA.from_com(length - 1, min_periods=length)
+
+        self._prev_close = None
+
+        self.value = math.nan
+
+    def update(self, close: float) -> float:
+        if self._prev_close is not None:
+            delta = close - self._prev_close
+            self._avg_gain.update(delta if delta > 0 else 0.0)
+            self._avg_loss.update(-delta if delta < 0 else 0.0)
+
+            self.value = _rsi_from_averages(self._avg_gain.value, self._avg_loss.value)
+
+        self._prev_close = close
+
+        return self.value
+
+    def warm_up(self, closes: pd.Series) -> float:
+        if len(closes) == 0:
+            return self.value
+
+        delta = closes.diff().dropna()
+
+        if len(delta) > 0:
+            self._avg_gain.warm_up(delta.clip(lower=0))
+            self._avg_loss.warm_up((-delta).clip(lower=0))
+
+            self.value = _rsi_from_averages(self._avg_gain.value, self._avg_loss.value)
+
+        self._prev_close = float(closes.iloc[-1])
+
+        return self.value
+
+
+class MACD:
+    def __init__(self, ema_fast: int, ema_slow: int, ema_signal: int):
+        self._ema_fast = EMA.from_span(ema_fast)
+        self._ema_slow = EMA.from_span(ema_slow)
+        self._ema_signal = EMA.from_span(ema_signal)
+
+        self.macd_line = math.nan
+        self.macd_signal = math.nan
+
+    def update(self, close: float) -> typing.Tuple[float, float]:
+        self.macd_line = self._ema_fast.update(close) - self._ema_slow.update(close)
+        self.macd_signal = self._ema_signal.update(self.macd_line)
+
+        return self.macd_line, self.macd_signal
+
+    def warm_up(self, closes: pd.Series) -> typing.Tuple[float, float]:
+        if len(closes) == 0:
+            return self.macd_line, self.macd_signal
+
+        macd_line = self._ema_fast.warm_up(closes) - self._ema_slow.warm_up(closes)
+        self._ema_signal.warm_up(macd_line)
+
+        self.macd_line = self._ema_fast.value - self._ema_slow.value
+        self.macd_signal = self._ema_signal.value
+
+        return self.macd_line, self.macd_signal
+
+
+# RSI + MACD of the TechnicalStrategy, fed with the close price of each closed candle
+class TechnicalIndicators:
+    def __init__(self, rsi_length: int, ema_fast: int, ema_slow: int, ema_signal: int):
+        self.rsi = RSI(rsi_length)
+        self.macd = MACD(ema_fast, ema_slow, ema_signal)
+
+    def update(self, close: float):
+        self.rsi.update(close)
+        self.macd.update(close)
+
+    def warm_up(self, closes: typing.Sequence[float]):
+        closes = pd.Series(closes, dtype=float)
+
+        self.rsi.warm_up(closes)
+        self.macd.warm_up(closes)
@@ -47,6 +47,9 @@ class Root(tk.Tk):
         self._trades_frame = TradesWatch(self._right_frame, bg=BG_COLOR)
         self._trades_frame.pack(side=tk.TOP)
 
+        # exchange -> symbol -> contract of the watchlist rows whose bid / ask stream is subscribed
+        self._watched = {"Binance": dict(), "Bitmex": dict()}
+
         # self._logging_frame.add_log("This is a test message")
         # time.sleep(2)
         # self._logging_frame.add_log("This is another test message")
@@ -70,6 +73,8 @@ class Root(tk.Tk):
                 log['displayed'] = True
 
         # Watchlist prices
+        watched = {"Binance": dict(), "Bitmex": dict()}
+
         try:
             for key, value in self._watchlist_frame.body_widgets['symbol'].items():
 
@@ -80,6 +85,8 @@ class Root(tk.Tk):
                     if symbol not in self.binance.contracts:
                         continue
 
+                    watched[exchange][symbol] = self.binance.contracts[symbol]
+
                     if symbol not in self.binance.prices:
                         self.binance.get_bid_ask(self.binance.contracts[symbol])
                         continue
@@ -90,6 +97,8 @@ class Root(tk.Tk):
                     if symbol not in self.bitmex.contracts:
                         continue
 
+                    watched[exchange][symbol] = self.bitmex.contracts[symbol]
+
                     if symbol not in self.bitmex.prices:
                         continue
 
@@ -111,5 +120,16 @@ class Root(tk.Tk):
 
         except RuntimeError as e:
             logger.error("Error while looping through the watchlist dictionary: %s", e)
+            watched = self._watched
+
+        # the rows added / removed since the last update
+        for exchange, client in (("Binance", self.binance), ("Bitmex", self.bitmex)):
+            for symbol, contract in watched[exchange].items():
+                if symbol not in self._watched[exchange]:
+                    client.watch(contract)
+            for symbol, contract in self._watched[exchange].items():
+                if symbol not in watched[exchange]:
+                    client.unwatch(contract)
+        self._watched = watched
 
         self.after(1000, self._update_ui)
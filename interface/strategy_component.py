@@ -223,7 +223,7 @@ class StrategyEditor(tk.Frame):
             else:
                 return
 
-            new_strategy.candles = self._exchanges[exchange].get_historical_candles(contract, timeframe)
+            new_strategy.candles = self._exchanges[exchange].get_strategy_candles(contract, timeframe)
 
             # means there is an error durign the request
             if len(new_strategy.candles) == 0:
@@ -232,7 +232,7 @@ class StrategyEditor(tk.Frame):
 
             new_strategy._check_signal()
 
-            self._exchanges[exchange].strategies[b_index] = new_strategy
+            self._exchanges[exchange].add_strategy(b_index, new_strategy)
 
             for param in self._base_params:
                 code_name = param['code_name']
@@ -243,7 +243,7 @@ class StrategyEditor(tk.Frame):
                 self.body_widgets['activation'][b_index].config(bg="darkgreen", text="ON")
                 self.root.logging_frame.add_log(f"{strat_selected} strategy on {symbol} / {timeframe} started")
         else:
-            del self._exchanges[exchange].strategies[b_index]
+            self._exchanges[exchange].remove_strategy(b_index)
 
             for param in self._base_params:
                 code_name = param['code_name']
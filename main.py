@@ -2,14 +2,22 @@
 # pip install websocket
 # pip install websocket-client===0.58.0
 # pip install python-dateutil>=2.7.0
+# pip install aiohttp (only for ASYNC_CONNECTORS=1)
+# or all of them: pip install -r requirements.txt
 
 # import tkinter as tk
 import logging
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
 
 from connectors.binance_futures import BinanceFuturesClient
 from connectors.bitmex import BitmexClient
 
+from indicator_cache import shared_cache
 from interface.root_component import Root
+from scanner import ContractScanner
 
 
 logger = logging.getLogger()
@@ -28,10 +36,69 @@ file_handler.setLevel(logging.DEBUG)
 logger.addHandler(stream_handler)
 logger.addHandler(file_handler)
 
+# milliseconds after the start of the interface at which the startup phases of the connectors are logged
+STARTUP_REPORT_DELAY = 10000
+
+
+def log_startup(clients):
+    for name, client in clients.items():
+        logger.info("%s startup phases (seconds): %s, contracts: %s", name, client.startup_stats(),
+                    client.contract_stats())
+
+
+# milliseconds between two logs of the indicator cache hit rates
+INDICATOR_REPORT_INTERVAL = 600000
+
+
+def log_indicator_cache(root):
+    logger.info("Indicator cache: %s", shared_cache.stats())
+    root.after(INDICATOR_REPORT_INTERVAL, log_indicator_cache, root)
+
+
+# SCANNER=<strategy>:<timeframe> (e.g. Breakout:1m) logs on each candle close the contracts of both exchanges that
+# produce a signal of the strategy, see scanner.py
+def start_scanners(*clients):
+    strategy, timeframe = os.environ["SCANNER"].split(":")
+
+    for client in clients:
+        ContractScanner(client, timeframe, strategy).start()
+
+
+BINANCE_KEYS = ("a92e0ce00b1d053bc1e8fdbf6ca9554894084d35f79b859f4e51b26bd4462f99",
+                "d9eb702c036e07bea81a52bc7f403db0b33fac2c68291cf377ab6bff00ce007a")
+BITMEX_KEYS = ("NOhUtBbsDMtZkL7nVNdrt7CG", "I8JDSEjDFHQiO30I13pPN4-IdZMJMqTXkRdXZv4_v-Fa0Neg")
+
+
 if __name__ == '__main__':
-    binance = BinanceFuturesClient("a92e0ce00b1d053bc1e8fdbf6ca9554894084d35f79b859f4e51b26bd4462f99",
-                                   "d9eb702c036e07bea81a52bc7f403db0b33fac2c68291cf377ab6bff00ce007a", True)
-    bitmex = BitmexClient("NOhUtBbsDMtZkL7nVNdrt7CG", "I8JDSEjDFHQiO30I13pPN4-IdZMJMqTXkRdXZv4_v-Fa0Neg", True)
+    start = time.monotonic()
+
+    binance_urls = {"base_url": os.environ.get("BINANCE_BASE_URL"), "wss_url": os.environ.get("BINANCE_WSS_URL")}
+    bitmex_urls = {"base_url": os.environ.get("BITMEX_BASE_URL"), "wss_url": os.environ.get("BITMEX_WSS_URL")}
+
+    # ASYNC_CONNECTORS=1 runs the I/O of both exchanges on one asyncio event loop (requires aiohttp)
+    if os.environ.get("ASYNC_CONNECTORS"):
+        from connectors.aio_binance_futures import AsyncBinanceFuturesClient
+        from connectors.aio_bitmex import AsyncBitmexClient
+        from connectors.sync_adapter import SyncAdapter
+
+        def binance_client():
+            return SyncAdapter(AsyncBinanceFuturesClient(*BINANCE_KEYS, True, **binance_urls))
+
+        def bitmex_client():
+            return SyncAdapter(AsyncBitmexClient(*BITMEX_KEYS, True, **bitmex_urls))
+    else:
+        def binance_client():
+            return BinanceFuturesClient(*BINANCE_KEYS, True, **binance_urls)
+
+        def bitmex_client():
+            return BitmexClient(*BITMEX_KEYS, True, **bitmex_urls)
+
+    # both exchanges are initialised at the same time
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        binance_future = executor.submit(binance_client)
+        bitmex_future = executor.submit(bitmex_client)
+        binance = binance_future.result()
+        bitmex = bitmex_future.result()
 
     # print(bitmex.contracts['XBTUSD'].base_asset, bitmex.contracts['XBTUSD'].price_decimals)
     # Bitmex returns XBt symbol for satoshi instead of XBT symbol for Bitcoin
@@ -49,4 +116,9 @@ if __name__ == '__main__':
 
     # root = tk.Tk()
     root = Root(binance, bitmex)
+    logger.info("Interface built in %.3f seconds", time.monotonic() - start)
+    root.after(STARTUP_REPORT_DELAY, log_startup, {"Binance": binance, "Bitmex": bitmex})
+    root.after(INDICATOR_REPORT_INTERVAL, log_indicator_cache, root)
+    if os.environ.get("SCANNER"):
+        start_scanners(binance, bitmex)
     root.mainloop()
@@ -0,0 +1,61 @@
+# Local mock exchange for end-to-end and soak tests of the connectors:
+# python -m mock_exchange binance --port 8765 --rate 2000
+# python -m mock_exchange bitmex --port 8766 --replay recordings/ --speed 4
+# then point the connectors at it, e.g. BinanceFuturesClient(..., base_url="http://127.0.0.1:8765",
+# wss_url="ws://127.0.0.1:8765/ws") or with the environment variables read by main.py.
+# The stats (frames sent, trades per second, tick-to-order latency percentiles) are printed every --stats-interval
+# seconds as one JSON line, and are also served on GET /mock/stats.
+
+import argparse
+import json
+import logging
+import time
+
+from mock_exchange.binance import MockBinanceFutures
+from mock_exchange.bitmex import MockBitmex, DEFAULT_TRADES_PER_FRAME
+
+EXCHANGES = {"binance": MockBinanceFutures, "bitmex": MockBitmex}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Binance Futures / Bitmex stand-in")
+    parser.add_argument("exchange", choices=list(EXCHANGES.keys()))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port")
+    parser.add_argument("--symbols", default=None, help="comma separated, default the exchange main contracts")
+    parser.add_argument("--rate", type=float, default=100.0, help="synthetic trades per second, all symbols")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--fill-delay", type=float, default=0.0, help="seconds before market orders are filled")
+    parser.add_argument("--trades-per-frame", type=int, default=DEFAULT_TRADES_PER_FRAME, help="bitmex only")
+    parser.add_argument("--replay", default=None, help="directory of a recording to send instead of the synthetic feed")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed, 0 for as fast as possible")
+    parser.add_argument("--duration", type=float, default=0.0, help="seconds before stopping, 0 runs until Ctrl+C")
+    parser.add_argument("--stats-interval", type=float, default=10.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s :: %(message)s")
+
+    kwargs = dict()
+    if args.exchange == "bitmex":
+        kwargs['trades_per_frame'] = args.trades_per_frame
+
+    symbols = args.symbols.split(",") if args.symbols is not None else None
+    mock = EXCHANGES[args.exchange](args.host, args.port, symbols, args.rate, args.seed, args.fill_delay, **kwargs)
+    mock.start(args.replay, args.speed if args.speed > 0 else None)
+
+    print(f"base_url={mock.base_url} wss_url={mock.wss_url}", flush=True)
+
+    start = time.monotonic()
+    try:
+        while args.duration <= 0 or time.monotonic() - start < args.duration:
+            time.sleep(min(args.stats_interval, args.duration - (time.monotonic() - start))
+                       if args.duration > 0 else args.stats_interval)
+            print(json.dumps(mock.stats()), flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mock.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+import json
+import time
+import typing
+import uuid
+
+from strategies import TF_EQUIV
+
+from mock_exchange.server import MockExchange, WebSocketClient, synthetic_candle, candle_times, \
+    price_decimals
+
+KLINES_MAX_LIMIT = 1500
+WALLET_BALANCE = "10000.00000000"
+
+
+# Binance Futures stand-in: the endpoints of connectors/binance_futures.py, the /ws market streams
+# (aggTrade and bookTicker, SUBSCRIBE / UNSUBSCRIBE) and the /ws/<listen key> user data streams (ORDER_TRADE_UPDATE,
+# ACCOUNT_UPDATE).
+# Signatures and API keys are not checked.
+class MockBinanceFutures(MockExchange):
+    exchange = "binance"
+    ws_path = "/ws"
+    default_symbols = {"BTCUSDT": 32000.0, "ETHUSDT": 1300.0, "BNBUSDT": 45.0, "XRPUSDT": 0.27}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self._next_order_id = 1000000
+        self._agg_id = 0
+        self.listen_key = uuid.uuid4().hex
+
+        self.routes.update({
+            ("GET", "/fapi/v1/exchangeInfo"): self._exchange_info,
+            ("GET", "/fapi/v1/klines"): self._klines,
+            ("GET", "/fapi/v1/ticker/bookTicker"): self._book_ticker,
+            ("GET", "/fapi/v1/account"): self._account,
+            ("POST", "/fapi/v1/order"): self._post_order,
+            ("GET", "/fapi/v1/order"): self._get_order,
+            ("DELETE", "/fapi/v1/order"): self._delete_order,
+            ("POST", "/fapi/v1/listenKey"): self._listen_key,
+            ("PUT", "/fapi/v1/listenKey"): self._listen_key,
+            ("DELETE", "/fapi/v1/listenKey"): lambda params: (200, dict()),
+        })
+
+    def error_body(self, msg: str) -> typing.Any:
+        return {"code": -1100, "msg": msg}
+
+    def _exchange_info(self, params: typing.Dict[str, str]) -> typing.Tuple[int, typing.Any]:
+        symbols = []
+        for symbol, price in self.base_prices.items():
+            decimals = price_decimals(price)
+            symbols.append({"symbol": symbol, "pair": symbol, "contractType": "PERPETUAL", "status": "TRADING",
+                            "baseAsset": symbol[:-4], "quoteAsset": "USDT", "marginAsset": "USDT",
+                            "pricePrecision": decimals, "quantityPrecision": 3})
+
+        return 200, {"timezone": "UTC", "serverTime": int(time.time() * 1000), "symbols": symbols}
+
+    def _klines(self, params: typing.Dict[str, str]) -> typing.Tuple[int, typing.Any]:
+        symbol = params['symbol']
+        if symbol not in self.base_prices:
+            return 400, self.error_body(f"Invalid symbol {symbol}")
+
+        tf_ms = TF_EQUIV[params['interval']] * 1000
+        limit = min(int(params.get('limit', 500)), KLINES_MAX_LIMIT)
+        start = int(params['startTime']) if 'startTime' in params else None
+        end = int(params['endTime']) if 'endTime' in params else None
+
+        rows = []
+        for open_ts in candle_times(tf_ms, limit, start, end):
+            o, h, l, c, v = synthetic_candle(symbol, self.base_prices[symbol], open_ts, tf_ms)
+            rows.append([open_ts, str(o), str(h), str(l), str(c), str(v), open_ts + tf_ms - 1, str(round(v * c, 2)),
+                         100, str(round(v / 2, 3)), str(round(v * c / 2, 2)), "0"])
+
+        return 200, rows
+
+    def _book_ticker(self, params: typing.Dict[str, str]) -> typing.Tuple[int, typing.Any]:
+        market = self.markets[params['symbol']]
+        return 200, {"symbol": market.symbol, "bidPrice": str(market.price), "bidQty": "1.000",
+                     "askPrice": str(market.price), "askQty": "1.000", "time": int(time.time() * 1000)}
+
+    def _account(self, params: typing.Dict[str, str]) -> typing.Tuple[int, typing.Any]:
+        asset = {"asset": "USDT", "walletBalance": WALLET_BALANCE, "unrealizedProfit": "0.00000000",
+                 "marginBalance": WALLET_BALANCE, "maintMargin": "0.00000000", "initialMargin": "0.00000000"}
+        return 200, {"assets": [asset], "positions": []}
+
+    def _order_body(self, order: typing.Dict) -> typing.Dict:
+        if order['canceled']:
+            status = "CANCELED"
+        elif self.is_filled(order):
+            status = "FILLED"
+        else:
+            status = "NEW"
+
+        return {"orderId": order['id'], "symbol": order['symbol'], "status": status,
+                "avgPrice": str(order['price']) if status == "FILLED" else "0.00000",
+                "origQty": str(order['quantity']), "executedQty": str(order['quantity']) if status == "FILLED" else "0",
+                "side": order['side'], "type": "MARKET", "updateTime": int(time.time() * 1000)}
+
+    def _post_order(self, params: typing.Dict[str, str]) -> typing.Tuple[int, typing.Any]:
+        if params['symbol'] not in self.markets:
+            return 400, self.error_body(f"Invalid symbol {params['symbol']}")
+
+        self._next_order_id += 1
+        order = self.new_order(self._next_order_id, params['symbol'], params['side'], float(params['quantity']))
+
+        return 200, self._order_body(order)
+
+    def _find_order(self, params: typing.Dict[str, str]) -> typing.Optional[typing.Dict]:
+        return self.orders.get(params['orderId'])
+
+    def _get_order(self, params: typing.Dict[str, str]) -> typing.Tuple[int, typing.Any]:
+        order = self._find_order(params)
+        if order is None:
+            return 400, {"code": -2013, "msg": "Order does not exist."}
+        return 200, self._order_body(order)
+
+    def _delete_order(self, params: typing.Dict[str, str]) -> typing.Tuple[int, typing.Any]:
+        order = self._find_order(params)
+        if order is None:
+            return 400, {"code": -2011, "msg": "Unknown order sent."}
+
+        self.cancel_order(order)
+        return 200, self._order_body(order)
+
+    def _listen_key(self, params: typing.Dict[str, str]) -> typing.Tuple[int, typing.Any]:
+        return 200, {"listenKey": self.listen_key}
+
+    def publish_order(self, order: typing.Dict):
+        body = self._order_body(order)
+        now = int(time.time() * 1000)
+
+        msg = json.dumps({"e": "ORDER_TRADE_UPDATE", "E": now, "T": now,
+                          "o": {"s": body['symbol'], "c": "", "S": body['side'], "o": "MARKET", "f": "GTC",
+                                "q": body['origQty'], "p": "0", "ap": body['avgPrice'], "sp": "0",
+                                "x": "TRADE" if body['status'] == "FILLED" else body['status'], "X": body['status'],
+                                "i": body['orderId'], "l": body['executedQty'], "z": body['executedQty'],
+                                "L": body['avgPrice'], "T": now}}, separators=(",", ":"))
+
+        messages = [msg]
+        if body['status'] == "FILLED":
+            messages.append(json.dumps({"e": "ACCOUNT_UPDATE", "E": now, "T": now,
+                                        "a": {"m": "ORDER", "B": [{"a": "USDT", "wb": WALLET_BALANCE,
+                                                                   "cw": WALLET_BALANCE, "bc": "0"}], "P": []}},
+                                       separators=(",", ":")))
+
+        for client in self._clients:
+            if client.path != self.ws_path:
+                for msg in messages:
+                    self.send(client, msg)
+
+    def on_client_message(self, client: WebSocketClient, msg: str):
+        try:
+            data = json.loads(msg)
+            method = data['method']
+            params = data.get('params', [])
+        except (ValueError, KeyError, TypeError):
+            self.send(client, json.dumps({"error": {"code": 2, "msg": f"Invalid request: {msg[:100]}"}}))
+            return
+
+        if method == "SUBSCRIBE":
+            client.subscriptions.update(params)
+        elif method == "UNSUBSCRIBE":
+            client.subscriptions.difference_update(params)
+
+        self.send(client, json.dumps({"result": None, "id": data.get('id')}))
+
+    def trade_frames(self, trades: typing.List[typing.Tuple[str, float, float, int]]) -> \
+            typing.List[typing.Tuple[str, str]]:
+        frames = []
+
+        for symbol, price, size, ts in trades:
+            self._agg_id += 1
+            stream = symbol.lower()
+            frames.append((stream + "@aggTrade", json.dumps(
+                {"e": "aggTrade", "E": ts, "s": symbol, "a": self._agg_id, "p": str(price), "q": str(size),
+                 "f": self._agg_id, "l": self._agg_id, "T": ts, "m": False}, separators=(",", ":"))))
+            frames.append((stream + "@bookTicker", json.dumps(
+                {"e": "bookTicker", "u": self._agg_id, "s": symbol, "b": str(price), "B": "1.000", "a": str(price),
+                 "A": "1.000", "T": ts, "E": ts}, separators=(",", ":"))))
+
+        return frames
+
+    def frame_symbols(self, msg: str) -> typing.Optional[typing.List[str]]:
+        data = json.loads(msg)
+        if data.get('e') != "aggTrade":
+            return None
+        return [data['s']]
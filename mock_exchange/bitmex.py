@@ -0,0 +1,225 @@
+import json
+import time
+import typing
+import uuid
+
+from models import BITMEX_TF_MINUTES, iso_to_ms, ms_to_iso
+
+from mock_exchange.server import MockExchange, WebSocketClient, synthetic_candle, candle_times, \
+    price_decimals
+
+# maximum of the count parameter of every endpoint
+MAX_COUNT = 1000
+DEFAULT_TRADES_PER_FRAME = 5
+
+
+# Bitmex stand-in: the endpoints of connectors/bitmex.py and the /realtime tables instrument, quote, trade,
+# execution, order and margin (subscribe / unsubscribe to a table or to table:SYMBOL). API keys and signatures are not checked.
+# The trades of a feed period are sent by frames of up to trades_per_frame prints, grouped by symbol. A subscription
+# to the trades is answered with a "partial" snapshot of the last trade of the symbols, like the exchange does.
+class MockBitmex(MockExchange):
+    exchange = "bitmex"
+    ws_path = "/realtime"
+    default_symbols = {"XBTUSD": 32000.0, "ETHUSD": 1300.0, "XRPUSD": 0.27}
+
+    def __init__(self, *args, trades_per_frame: int = DEFAULT_TRADES_PER_FRAME, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.trades_per_frame = trades_per_frame
+
+        self.routes.update({
+            ("GET", "/api/v1/instrument/active"): self._instruments,
+            ("GET", "/api/v1/trade/bucketed"): self._bucketed,
+            ("GET", "/api/v1/user/margin"): self._margin,
+            ("POST", "/api/v1/order"): self._post_order,
+            ("GET", "/api/v1/order"): self._get_orders,
+            ("DELETE", "/api/v1/order"): self._delete_order,
+        })
+
+    def error_body(self, msg: str) -> typing.Any:
+        return {"error": {"message": msg, "name": "HTTPError"}}
+
+    def _instruments(self, params: typing.Dict[str, str]) -> typing.Tuple[int, typing.Any]:
+        instruments = []
+        for symbol, price in self.base_prices.items():
+            inverse = symbol.startswith("XBT")
+            instruments.append({"symbol": symbol, "rootSymbol": symbol[:-3], "state": "Open", "typ": "FFWCSX",
+                                "quoteCurrency": "USD", "tickSize": 10 ** -price_decimals(price), "lotSize": 1,
+                                "isQuanto": not inverse, "isInverse": inverse,
+                                "multiplier": -100000000 if inverse else 100,
+                                "lastPrice": self.markets[symbol].price})
+
+        return 200, instruments
+
+    def _bucketed(self, params: typing.Dict[str, str]) -> typing.Tuple[int, typing.Any]:
+        symbol = params['symbol']
+        if symbol not in self.base_prices:
+            return 400, self.error_body(f"Invalid symbol {symbol}")
+
+        tf_ms = BITMEX_TF_MINUTES[params['binSize']] * 60000
+        count = min(int(params.get('count', 100)), MAX_COUNT)
+
+        # the bucket timestamps are close times, the candles are generated by open time
+        start = iso_to_ms(params['startTime']) - tf_ms if 'startTime' in params else None
+        end = iso_to_ms(params['endTime']) - tf_ms if 'endTime' in params else None
+
+        buckets = []
+        for open_ts in candle_times(tf_ms, count, start, end):
+            o, h, l, c, v = synthetic_candle(symbol, self.base_prices[symbol], open_ts, tf_ms)
+            buckets.append({"timestamp": ms_to_iso(open_ts + tf_ms), "symbol": symbol, "open": o, "high": h,
+                            "low": l, "close": c, "trades": 100, "volume": int(v * 1000), "vwap": c,
+                            "lastSize": 1, "turnover": int(v * 1000 * c), "homeNotional": v,
+                            "foreignNotional": v * c})
+
+        if params.get('reverse', "").lower() == "true":
+            buckets.reverse()
+
+        return 200, buckets
+
+    def _margin_row(self) -> typing.Dict:
+        return {"account": 1, "currency": "XBt", "initMargin": 0, "maintMargin": 0, "marginBalance": 100000000,
+                "walletBalance": 100000000, "unrealisedPnl": 0}
+
+    def _margin(self, params: typing.Dict[str, str]) -> typing.Tuple[int, typing.Any]:
+        return 200, [self._margin_row()]
+
+    def _order_body(self, order: typing.Dict) -> typing.Dict:
+        if order['canceled']:
+            status = "Canceled"
+        elif self.is_filled(order):
+            status = "Filled"
+        else:
+            status = "New"
+
+        return {"orderID": order['id'], "symbol": order['symbol'], "side": order['side'], "ordType": "Market",
+                "orderQty": order['quantity'], "ordStatus": status,
+                "avgPx": order['price'] if status == "Filled" else None,
+                "cumQty": order['quantity'] if status == "Filled" else 0,
+                "timestamp": ms_to_iso(int(time.time() * 1000))}
+
+    def _post_order(self, params: typing.Dict[str, str]) -> typing.Tuple[int, typing.Any]:
+        if params['symbol'] not in self.markets:
+            return 400, self.error_body(f"Invalid symbol {params['symbol']}")
+
+        order = self.new_order(str(uuid.uuid4()), params['symbol'], params['side'], float(params['orderQty']))
+
+        return 200, self._order_body(order)
+
+    def _get_orders(self, params: typing.Dict[str, str]) -> typing.Tuple[int, typing.Any]:
+        # filter: JSON object of field values the orders must match, e.g. {"orderID": "..."}
+        filters = json.loads(params['filter']) if 'filter' in params else dict()
+        if 'symbol' in params:
+            filters['symbol'] = params['symbol']
+
+        orders = [self._order_body(o) for o in list(self.orders.values())]
+        orders = [o for o in orders if all(o.get(key) == value for key, value in filters.items())]
+
+        if params.get('reverse', "").lower() == "true":
+            orders.reverse()
+
+        return 200, orders[:min(int(params.get('count', 100)), MAX_COUNT)]
+
+    def _delete_order(self, params: typing.Dict[str, str]) -> typing.Tuple[int, typing.Any]:
+        order = self.orders.get(params['orderID'])
+        if order is None:
+            return 404, self.error_body("Not Found")
+
+        self.cancel_order(order)
+        return 200, [self._order_body(order)]
+
+    def publish_order(self, order: typing.Dict):
+        body = self._order_body(order)
+
+        tables = [("order", body)]
+        if body['ordStatus'] == "Filled":
+            tables.append(("execution", dict(body, execType="Trade", execID=str(uuid.uuid4()),
+                                             lastPx=body['avgPx'], lastQty=body['orderQty'])))
+            tables.append(("margin", self._margin_row()))
+
+        for table, row in tables:
+            msg = json.dumps({"table": table, "action": "insert", "data": [row]}, separators=(",", ":"))
+            for client in self._clients:
+                if self.subscribed(client, table + ":" + body['symbol']):
+                    self.send(client, msg)
+
+    def on_client_connected(self, client: WebSocketClient):
+        self.send(client, json.dumps({"info": "Welcome to the BitMEX Realtime API.", "version": "mock",
+                                      "timestamp": ms_to_iso(int(time.time() * 1000))}))
+
+    def on_client_message(self, client: WebSocketClient, msg: str):
+        try:
+            data = json.loads(msg)
+            op = data['op']
+            args = data.get('args', [])
+        except (ValueError, KeyError, TypeError):
+            self.send(client, json.dumps({"status": 400, "error": f"Unrecognized request: {msg[:100]}"}))
+            return
+
+        if op == "authKeyExpires":
+            self.send(client, json.dumps({"success": True, "request": data}))
+            return
+
+        if isinstance(args, str):
+            args = [args]
+
+        for arg in args:
+            if op == "subscribe":
+                client.subscriptions.add(arg)
+            elif op == "unsubscribe":
+                client.subscriptions.discard(arg)
+            self.send(client, json.dumps({"success": True, op: arg, "request": data}))
+
+            if op == "subscribe" and arg.split(":")[0] == "trade":
+                self._send_trade_partial(client, arg)
+
+    def _trade_row(self, symbol: str, price: float, size: float, ts: int) -> typing.Dict:
+        return {"timestamp": ms_to_iso(ts), "symbol": symbol, "side": "Buy", "size": max(1, int(size * 100)),
+                "price": price, "tickDirection": "ZeroPlusTick", "trdMatchID": str(uuid.uuid4()),
+                "grossValue": int(size * 100 * price), "homeNotional": size, "foreignNotional": size * price}
+
+    # last trade of the symbols of the topic, already counted in the candles the client downloaded
+    def _send_trade_partial(self, client: WebSocketClient, topic: str):
+        symbols = list(self.markets.keys()) if topic == "trade" else [topic.split(":")[1]]
+        ts = int(time.time() * 1000)
+
+        data = [self._trade_row(symbol, self.markets[symbol].price, 1.0, ts)
+                for symbol in symbols if symbol in self.markets]
+        self.send(client, json.dumps({"table": "trade", "action": "partial", "keys": [], "data": data},
+                                     separators=(",", ":")))
+
+    # subscribed to the whole table or to the table of the symbol
+    def subscribed(self, client: WebSocketClient, channel: str) -> bool:
+        return channel in client.subscriptions or channel.split(":")[0] in client.subscriptions
+
+    def trade_frames(self, trades: typing.List[typing.Tuple[str, float, float, int]]) -> \
+            typing.List[typing.Tuple[str, str]]:
+        by_symbol = dict()
+        for symbol, price, size, ts in trades:
+            by_symbol.setdefault(symbol, []).append((price, size, ts))
+
+        frames = []
+
+        for symbol, symbol_trades in by_symbol.items():
+            for i in range(0, len(symbol_trades), self.trades_per_frame):
+                data = [self._trade_row(symbol, price, size, ts)
+                        for price, size, ts in symbol_trades[i:i + self.trades_per_frame]]
+                frames.append(("trade:" + symbol, json.dumps({"table": "trade", "action": "insert", "data": data},
+                                                             separators=(",", ":"))))
+
+            price = symbol_trades[-1][0]
+            frames.append(("instrument:" + symbol, json.dumps(
+                {"table": "instrument", "action": "update",
+                 "data": [{"symbol": symbol, "bidPrice": price, "askPrice": price,
+                           "timestamp": ms_to_iso(symbol_trades[-1][2])}]}, separators=(",", ":"))))
+            frames.append(("quote:" + symbol, json.dumps(
+                {"table": "quote", "action": "insert",
+                 "data": [{"timestamp": ms_to_iso(symbol_trades[-1][2]), "symbol": symbol, "bidSize": 100,
+                           "bidPrice": price, "askPrice": price, "askSize": 100}]}, separators=(",", ":"))))
+
+        return frames
+
+    def frame_symbols(self, msg: str) -> typing.Optional[typing.List[str]]:
+        data = json.loads(msg)
+        if data.get('table') != "trade":
+            return None
+        return [d['symbol'] for d in data.get('data', [])]
@@ -0,0 +1,519 @@
+import base64
+import collections
+import hashlib
+import json
+import logging
+import math
+import random
+import socket
+import struct
+import threading
+import time
+import typing
+import zlib
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+logger = logging.getLogger()
+
+# Local stand-in of an exchange for end-to-end tests of the connectors: one HTTP server answering the REST endpoints
+# used by the connector and, on the websocket path of the exchange, a minimal RFC 6455 server (text frames, ping,
+# close) pushing the market data feed. The feed is either synthetic (seeded random walk per symbol, at a configured
+# number of trades per second) or a recording of connectors/recorder.py replayed as is.
+# Every order received is matched with the last trade frame sent for its symbol: the time between the two is the
+# tick-to-order latency of the bot (decoding, dispatch, strategy, REST request), reported by stats(). It is exact when
+# the trades of a symbol are further apart than the latency, a lower bound otherwise (a later trade may be matched).
+
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+_OP_TEXT = 0x1
+_OP_CLOSE = 0x8
+_OP_PING = 0x9
+_OP_PONG = 0xA
+
+# feed thread period: the trades of each period are sent in one burst, the order fills are checked as often
+FEED_TICK = 0.01
+# order latencies kept for the percentiles
+LATENCY_WINDOW = 100000
+
+
+def _ws_frame(opcode: int, payload: bytes) -> bytes:
+    length = len(payload)
+
+    # server frames are never masked
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+
+    return header + payload
+
+
+def _read_exact(rfile, size: int) -> bytes:
+    data = rfile.read(size)
+    if len(data) < size:
+        raise ConnectionError("websocket closed by the client")
+    return data
+
+
+def _read_ws_frame(rfile) -> typing.Tuple[int, bytes]:
+    b0, b1 = _read_exact(rfile, 2)
+    opcode = b0 & 0x0f
+    length = b1 & 0x7f
+
+    if length == 126:
+        length = struct.unpack("!H", _read_exact(rfile, 2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", _read_exact(rfile, 8))[0]
+
+    mask = _read_exact(rfile, 4) if b1 & 0x80 else None
+    payload = _read_exact(rfile, length)
+
+    if mask is not None:
+        # xor of the whole payload at once with the mask repeated to its length
+        repeated = (mask * (length // 4 + 1))[:length]
+        payload = (int.from_bytes(payload, "big") ^ int.from_bytes(repeated, "big")).to_bytes(length, "big")
+
+    return opcode, payload
+
+
+class WebSocketClient:
+    def __init__(self, connection: socket.socket, address, path: str):
+        self._connection = connection
+        self._lock = threading.Lock()
+        self.address = address
+        # request path of the connection, e.g. the Binance user data streams are /ws/<listen key>
+        self.path = path
+        # channels the client subscribed to, in the format of the exchange
+        self.subscriptions: typing.Set[str] = set()
+        self.open = True
+
+    def send(self, msg: str):
+        self.send_frame(_OP_TEXT, msg.encode())
+
+    def send_frame(self, opcode: int, payload: bytes):
+        frame = _ws_frame(opcode, payload)
+        with self._lock:
+            self._connection.sendall(frame)
+
+    def close(self):
+        try:
+            self.send_frame(_OP_CLOSE, struct.pack("!H", 1001))
+            self._connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, exchange: "MockExchange"):
+        super().__init__(address, _Handler)
+        self.exchange = exchange
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # keep-alive, the connectors reuse their connections
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self, method: str):
+        exchange: MockExchange = self.server.exchange
+        url = urlsplit(self.path)
+
+        if method == "GET" and (url.path == exchange.ws_path or url.path.startswith(exchange.ws_path + "/")) and \
+                self.headers.get("Upgrade", "").lower() == "websocket":
+            self._websocket(exchange, url.path)
+            return
+
+        params = dict(parse_qsl(url.query))
+
+        length = int(self.headers.get("Content-Length", 0))
+        if length > 0:
+            params.update(parse_qsl(self.rfile.read(length).decode()))
+
+        status, body = exchange.handle_request(method, url.path, params)
+
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def _websocket(self, exchange: "MockExchange", path: str):
+        key = self.headers.get("Sec-WebSocket-Key", "")
+        accept = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode()).digest()).decode()
+
+        self.send_response(101)
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.end_headers()
+
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        client = WebSocketClient(self.connection, self.client_address, path)
+        exchange.add_client(client)
+
+        try:
+            while True:
+                opcode, payload = _read_ws_frame(self.rfile)
+
+                if opcode == _OP_TEXT:
+                    exchange.on_client_message(client, payload.decode())
+                elif opcode == _OP_PING:
+                    client.send_frame(_OP_PONG, payload)
+                elif opcode == _OP_CLOSE:
+                    client.send_frame(_OP_CLOSE, payload[:2])
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            exchange.remove_client(client)
+            self.close_connection = True
+
+
+def price_decimals(price: float) -> int:
+    return 2 if price >= 10 else 4
+
+
+# seeded random walk of the last price of a symbol
+class _Market:
+    def __init__(self, symbol: str, price: float, seed: int):
+        self.symbol = symbol
+        self.price = price
+        self._tick = 10 ** -price_decimals(price)
+        self._random = random.Random(seed)
+
+    def next_trade(self) -> typing.Tuple[float, float]:
+        self.price = max(self._tick, self.price * (1 + self._random.gauss(0, 0.0002)))
+        self.price = round(round(self.price / self._tick) * self._tick, 8)
+        size = round(self._random.expovariate(1.0), 3) + 0.001
+        return self.price, size
+
+
+def _uniform(symbol: str, timestamp: int, salt: int) -> float:
+    return zlib.crc32(f"{symbol}{timestamp}{salt}".encode()) / 0xffffffff
+
+
+def _close_at(symbol: str, base_price: float, open_ts: int) -> float:
+    # a daily wave plus noise, a function of the candle time only: every page of every request is consistent
+    wave = math.sin(2 * math.pi * open_ts / 86400000 + zlib.crc32(symbol.encode()) % 7)
+    return base_price * (1 + 0.05 * wave) * (1 + 0.004 * (_uniform(symbol, open_ts, 0) - 0.5))
+
+
+# deterministic (open, high, low, close, volume) of the candle of a symbol opening at open_ts
+def synthetic_candle(symbol: str, base_price: float, open_ts: int,
+                     tf_ms: int) -> typing.Tuple[float, float, float, float, float]:
+    open_ = _close_at(symbol, base_price, open_ts - tf_ms)
+    close = _close_at(symbol, base_price, open_ts)
+    high = max(open_, close) * (1 + 0.001 * _uniform(symbol, open_ts, 1))
+    low = min(open_, close) * (1 - 0.001 * _uniform(symbol, open_ts, 2))
+    volume = 10 + 100 * _uniform(symbol, open_ts, 3)
+
+    decimals = price_decimals(base_price)
+
+    return round(open_, decimals), round(high, decimals), round(low, decimals), round(close, decimals), \
+        round(volume, 3)
+
+
+# open times of the candles of a request: from start or the `limit` last ones before end, never after now
+def candle_times(tf_ms: int, limit: int, start: typing.Optional[int], end: typing.Optional[int]) -> typing.List[int]:
+    now = int(time.time() * 1000)
+    last = now - now % tf_ms
+    if end is not None:
+        last = min(last, end - end % tf_ms)
+
+    if start is not None:
+        first = start + (-start) % tf_ms
+        return list(range(first, min(last, first + (limit - 1) * tf_ms) + 1, tf_ms))
+
+    return list(range(max(0, last - (limit - 1) * tf_ms), last + 1, tf_ms))
+
+
+class MockExchange:
+    exchange = ""
+    ws_path = ""
+    # symbol -> starting price of the synthetic feed
+    default_symbols: typing.Dict[str, float] = dict()
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, symbols: typing.Optional[typing.List[str]] = None,
+                 rate: float = 100.0, seed: int = 1, fill_delay: float = 0.0):
+        # rate: synthetic trades per second over all the symbols, fill_delay: seconds before a market order
+        # reports as filled
+        if symbols is None:
+            symbols = list(self.default_symbols.keys())
+
+        self.rate = rate
+        self.fill_delay = fill_delay
+
+        self.base_prices = {s: self.default_symbols.get(s, 100.0) for s in symbols}
+        self.markets = {s: _Market(s, price, seed + zlib.crc32(s.encode())) for s, price in self.base_prices.items()}
+        self.orders: typing.Dict[str, typing.Dict] = dict()
+        self._orders_lock = threading.Lock()
+        # orders whose fill wasn't pushed to the clients yet
+        self._unfilled: typing.Set[str] = set()
+
+        # copy-on-write like connectors.routing: the feed thread iterates without locking
+        self._clients: typing.Tuple[WebSocketClient, ...] = tuple()
+        self._clients_lock = threading.Lock()
+
+        # (method, path) -> handler(params) returning (HTTP status, JSON body)
+        self.routes: typing.Dict[typing.Tuple[str, str], typing.Callable[[typing.Dict], typing.Tuple[int, typing.Any]]]
+        self.routes = {("GET", "/mock/stats"): lambda params: (200, self.stats())}
+
+        self._last_trade_ns: typing.Dict[str, int] = dict()
+        self._latencies: typing.Deque[float] = collections.deque(maxlen=LATENCY_WINDOW)
+
+        self.frames_sent = 0
+        self.trades_sent = 0
+        self.requests = 0
+        self.send_errors = 0
+        self._started = None
+
+        self._stop = threading.Event()
+        self._server = _Server((host, port), self)
+        self._threads: typing.List[threading.Thread] = []
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self._server.server_address[0]}:{self.port}"
+
+    @property
+    def wss_url(self) -> str:
+        return f"ws://{self._server.server_address[0]}:{self.port}{self.ws_path}"
+
+    # replay_directory: directory of a recording (connectors/recorder.py) sent instead of the synthetic feed,
+    # at `speed` times the recorded speed (None: as fast as possible)
+    def start(self, replay_directory: typing.Optional[str] = None, speed: typing.Optional[float] = 1.0):
+        self._started = time.perf_counter()
+
+        self._threads.append(threading.Thread(target=self._server.serve_forever, name=f"mock {self.exchange} http",
+                                              daemon=True))
+        if replay_directory is None:
+            feed = threading.Thread(target=self._synthetic_feed, name=f"mock {self.exchange} feed", daemon=True)
+        else:
+            feed = threading.Thread(target=self._replay_feed, args=(replay_directory, speed),
+                                    name=f"mock {self.exchange} replay", daemon=True)
+        self._threads.append(feed)
+        self._threads.append(threading.Thread(target=self._fills_loop, name=f"mock {self.exchange} fills",
+                                              daemon=True))
+
+        for t in self._threads:
+            t.start()
+
+    def stop(self):
+        self._stop.set()
+        self._server.shutdown()
+        self._server.server_close()
+
+        for client in self._clients:
+            client.close()
+
+    # REST
+
+    def handle_request(self, method: str, path: str, params: typing.Dict[str, str]) -> typing.Tuple[int, typing.Any]:
+        self.requests += 1
+
+        handler = self.routes.get((method, path))
+        if handler is None:
+            return 404, self.error_body(f"Unknown endpoint {method} {path}")
+
+        try:
+            return handler(params)
+        except (KeyError, ValueError) as e:
+            return 400, self.error_body(f"Invalid parameters for {method} {path}: {e}")
+
+    def error_body(self, msg: str) -> typing.Any:
+        return {"msg": msg}
+
+    def new_order(self, order_id, symbol: str, side: str, quantity: float) -> typing.Dict:
+        now = time.perf_counter_ns()
+
+        last_trade = self._last_trade_ns.get(symbol)
+        if last_trade is not None:
+            self._latencies.append((now - last_trade) / 1e6)
+
+        order = {"id": order_id, "symbol": symbol, "side": side, "quantity": quantity,
+                 "price": self.markets[symbol].price if symbol in self.markets else 0.0,
+                 "created": time.monotonic(), "canceled": False}
+
+        with self._orders_lock:
+            self.orders[str(order_id)] = order
+            if not self.is_filled(order):
+                self._unfilled.add(str(order_id))
+
+        # like the exchanges, the update may reach the user stream before the REST answer reaches the client
+        self.publish_order(order)
+
+        return order
+
+    def cancel_order(self, order: typing.Dict):
+        with self._orders_lock:
+            if str(order['id']) not in self._unfilled:
+                return
+            self._unfilled.discard(str(order['id']))
+            order['canceled'] = True
+
+        self.publish_order(order)
+
+    def is_filled(self, order: typing.Dict) -> bool:
+        return not order['canceled'] and time.monotonic() - order['created'] >= self.fill_delay
+
+    # pushes the current state of an order to the user data stream clients
+    def publish_order(self, order: typing.Dict):
+        pass
+
+    def _fills_loop(self):
+        while not self._stop.is_set():
+            time.sleep(FEED_TICK)
+
+            if len(self._unfilled) == 0:
+                continue
+
+            with self._orders_lock:
+                filled = [self.orders[key] for key in self._unfilled if self.is_filled(self.orders[key])]
+                for order in filled:
+                    self._unfilled.discard(str(order['id']))
+
+            for order in filled:
+                self.publish_order(order)
+
+    # websocket
+
+    def add_client(self, client: WebSocketClient):
+        with self._clients_lock:
+            self._clients = self._clients + (client,)
+        self.on_client_connected(client)
+
+    def remove_client(self, client: WebSocketClient):
+        client.open = False
+        with self._clients_lock:
+            self._clients = tuple(c for c in self._clients if c is not client)
+
+    def on_client_connected(self, client: WebSocketClient):
+        pass
+
+    def on_client_message(self, client: WebSocketClient, msg: str):
+        raise NotImplementedError
+
+    def send(self, client: WebSocketClient, msg: str):
+        try:
+            client.send(msg)
+            self.frames_sent += 1
+        except OSError:
+            self.send_errors += 1
+            self.remove_client(client)
+
+    # frames of one period of the synthetic feed: (channel, frame) with the channel in the subscription format
+    def trade_frames(self, trades: typing.List[typing.Tuple[str, float, float, int]]) -> \
+            typing.List[typing.Tuple[str, str]]:
+        raise NotImplementedError
+
+    # symbols of the trades in a recorded frame, None when the frame isn't a trade frame
+    def frame_symbols(self, msg: str) -> typing.Optional[typing.List[str]]:
+        raise NotImplementedError
+
+    def subscribed(self, client: WebSocketClient, channel: str) -> bool:
+        return channel in client.subscriptions
+
+    def _synthetic_feed(self):
+        symbols = list(self.markets.keys())
+        pending = 0.0
+        turn = 0
+        last = time.perf_counter()
+
+        while not self._stop.is_set():
+            time.sleep(FEED_TICK)
+
+            now = time.perf_counter()
+            pending += self.rate * (now - last)
+            last = now
+
+            count = int(pending)
+            pending -= count
+            if count == 0 or len(symbols) == 0:
+                continue
+
+            ts = int(time.time() * 1000)
+            trades = []
+            for _ in range(count):
+                market = self.markets[symbols[turn % len(symbols)]]
+                turn += 1
+                price, size = market.next_trade()
+                trades.append((market.symbol, price, size, ts))
+
+            self.trades_sent += count
+            frames = self.trade_frames(trades)
+
+            for client in self._clients:
+                for channel, msg in frames:
+                    if self.subscribed(client, channel):
+                        self.send(client, msg)
+
+            sent_ns = time.perf_counter_ns()
+            for symbol, _, _, _ in trades:
+                self._last_trade_ns[symbol] = sent_ns
+
+    def _replay_feed(self, directory: str, speed: typing.Optional[float]):
+        from connectors.recorder import FrameReplayer
+
+        replayer = FrameReplayer(directory, self.exchange)
+
+        # the recording starts when the first client is connected
+        while len(self._clients) == 0 and not self._stop.is_set():
+            time.sleep(0.1)
+
+        def broadcast(msg: str):
+            for client in self._clients:
+                self.send(client, msg)
+
+            symbols = self.frame_symbols(msg)
+            if symbols is not None:
+                self.trades_sent += len(symbols)
+                sent_ns = time.perf_counter_ns()
+                for symbol in symbols:
+                    self._last_trade_ns[symbol] = sent_ns
+
+        result = replayer.replay(broadcast, speed)
+        logger.info("Mock %s: replay of %s frames done in %.1f s", self.exchange, result['frames'],
+                    result['seconds'])
+
+    def stats(self) -> typing.Dict[str, typing.Any]:
+        elapsed = time.perf_counter() - self._started if self._started is not None else 0.0
+        latencies = sorted(self._latencies)
+
+        def percentile(p: float) -> typing.Optional[float]:
+            if len(latencies) == 0:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))], 3)
+
+        return {"exchange": self.exchange, "seconds": round(elapsed, 1), "clients": len(self._clients),
+                "frames_sent": self.frames_sent, "trades_sent": self.trades_sent,
+                "trades_per_second": round(self.trades_sent / elapsed, 1) if elapsed > 0 else 0.0,
+                "send_errors": self.send_errors, "requests": self.requests, "orders": len(self.orders),
+                "tick_to_order_ms": {"count": len(latencies), "p50": percentile(50), "p90": percentile(90),
+                                     "p99": percentile(99), "max": round(latencies[-1], 3) if latencies else None}}
@@ -1,56 +1,132 @@
 import dateutil.parser
 import datetime
+import typing
 
 BITMEX_MULTIPLIER = 0.00000001
 BITMEX_TF_MINUTES = {"1m": 1, "5m": 5, "1h": 60, "1d": 1440}
 
+# bitmex indicate the time with ISO 8601 2021-01-24T10:00:00.000Z format, always the same length and separators.
+# The epoch milliseconds of the "2021-01-24T10:00" prefix are cached: all the trades of a minute share it and only
+# the seconds and milliseconds are converted. Anything not matching the format goes through dateutil.
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_MINUTE_CACHE: typing.Dict[str, int] = dict()
+_MINUTE_CACHE_SIZE = 10000
+
+
+def _minute_to_ms(prefix: str) -> typing.Optional[int]:
+    if prefix[4] != "-" or prefix[7] != "-" or prefix[10] != "T" or prefix[13] != ":":
+        return None
+
+    try:
+        dt = datetime.datetime(int(prefix[0:4]), int(prefix[5:7]), int(prefix[8:10]), int(prefix[11:13]),
+                               int(prefix[14:16]), tzinfo=datetime.timezone.utc)
+    except ValueError:
+        return None
+
+    return (dt - _EPOCH) // datetime.timedelta(milliseconds=1)
+
+
+def iso_to_ms(timestamp: str) -> int:
+    if len(timestamp) == 24 and timestamp[23] == "Z" and timestamp[19] == "." and timestamp[16] == ":":
+        minute_ms = _MINUTE_CACHE.get(timestamp[:16])
+
+        if minute_ms is None:
+            minute_ms = _minute_to_ms(timestamp[:16])
+            if minute_ms is not None:
+                if len(_MINUTE_CACHE) >= _MINUTE_CACHE_SIZE:
+                    _MINUTE_CACHE.clear()
+                _MINUTE_CACHE[timestamp[:16]] = minute_ms
+
+        seconds = timestamp[17:19]
+        millis = timestamp[20:23]
+
+        if minute_ms is not None and seconds.isdecimal() and millis.isdecimal() and seconds < "60":
+            return minute_ms + int(seconds) * 1000 + int(millis)
+
+    return int(dateutil.parser.isoparse(timestamp).timestamp() * 1000)
+
+
+def ms_to_iso(timestamp: int) -> str:
+    dt = _EPOCH + datetime.timedelta(milliseconds=timestamp)
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.") + "{:03d}Z".format(dt.microsecond // 1000)
+
+
+# the models are created in large numbers (every contract of both exchanges, every candle) so they use __slots__
+# instead of a per instance __dict__. Each exchange payload is converted by its own factory classmethod.
+
 
 class Balance:
-    def __init__(self, info, exchange):
-        if exchange == "binance":
-            self.initial_margin = float(info['initialMargin'])
-            self.maintenance_margin = float(info['maintMargin'])
-            self.margin_balance = float(info['marginBalance'])
-            self.wallet_balance = float(info['walletBalance'])
-            self.unrealized_pnl = float(info['unrealizedProfit'])
-
-        elif exchange == "bitmex":
+    __slots__ = ("initial_margin", "maintenance_margin", "margin_balance", "wallet_balance", "unrealized_pnl")
+
+    def __init__(self, initial_margin: float, maintenance_margin: float, margin_balance: float,
+                 wallet_balance: float, unrealized_pnl: float):
+        self.initial_margin = initial_margin
+        self.maintenance_margin = maintenance_margin
+        self.margin_balance = margin_balance
+        self.wallet_balance = wallet_balance
+        self.unrealized_pnl = unrealized_pnl
+
+    @classmethod
+    def from_binance(cls, info) -> "Balance":
+        return cls(float(info['initialMargin']), float(info['maintMargin']), float(info['marginBalance']),
+                   float(info['walletBalance']), float(info['unrealizedProfit']))
+
+    @classmethod
+    def from_bitmex(cls, info) -> "Balance":
+        return cls(info['initMargin'] * BITMEX_MULTIPLIER, info['maintMargin'] * BITMEX_MULTIPLIER,
+                   info['marginBalance'] * BITMEX_MULTIPLIER, info['walletBalance'] * BITMEX_MULTIPLIER,
+                   info['unrealisedPnl'] * BITMEX_MULTIPLIER)
+
+    # "B" item of an ACCOUNT_UPDATE event of the Binance user data stream, which only carries the wallet balance
+    def update_from_binance_stream(self, info):
+        wallet_balance = float(info['wb'])
+        self.margin_balance += wallet_balance - self.wallet_balance
+        self.wallet_balance = wallet_balance
+
+    # row of the Bitmex margin table, the update rows only carry the changed fields
+    def update_from_bitmex(self, info):
+        if 'initMargin' in info:
             self.initial_margin = info['initMargin'] * BITMEX_MULTIPLIER
+        if 'maintMargin' in info:
             self.maintenance_margin = info['maintMargin'] * BITMEX_MULTIPLIER
+        if 'marginBalance' in info:
             self.margin_balance = info['marginBalance'] * BITMEX_MULTIPLIER
+        if 'walletBalance' in info:
             self.wallet_balance = info['walletBalance'] * BITMEX_MULTIPLIER
+        if 'unrealisedPnl' in info:
             self.unrealized_pnl = info['unrealisedPnl'] * BITMEX_MULTIPLIER
 
 
 class Candle:
-    def __init__(self, candle_info, timeframe, exchange):
-        if exchange == "binance":
-            self.timestamp = candle_info[0]
-            self.open = float(candle_info[1])
-            self.high = float(candle_info[2])
-            self.low = float(candle_info[3])
-            self.close = float(candle_info[4])
-            self.volume = float(candle_info[5])
-
-        elif exchange == "bitmex":
-            self.timestamp = dateutil.parser.isoparse(candle_info['timestamp'])
-            self.timestamp = self.timestamp - datetime.timedelta(minutes=BITMEX_TF_MINUTES[timeframe])
-            # since Binance timestamp is in milliseconds and integer we the settings to the conversion
-            self.timestamp = int(self.timestamp.timestamp() * 1000)
-            # print(candle_info['timestamp'], dateutil.parser.isoparse(candle_info['timestamp']), self.timestamp)
-            self.open = candle_info['open']
-            self.high = candle_info['high']
-            self.low = candle_info['low']
-            self.close = candle_info['close']
-            self.volume = candle_info['volume']
-
-        elif exchange == "parse_trade":
-            self.timestamp = candle_info['ts']
-            self.open = candle_info['open']
-            self.high = candle_info['high']
-            self.low = candle_info['low']
-            self.close = candle_info['close']
-            self.volume = candle_info['volume']
+    __slots__ = ("timestamp", "open", "high", "low", "close", "volume")
+
+    def __init__(self, timestamp: int, open_: float, high: float, low: float, close: float, volume: float):
+        self.timestamp = timestamp
+        self.open = open_
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+    @classmethod
+    def from_binance(cls, candle_info) -> "Candle":
+        return cls(candle_info[0], float(candle_info[1]), float(candle_info[2]), float(candle_info[3]),
+                   float(candle_info[4]), float(candle_info[5]))
+
+    # "k" object of a kline event of the market streams
+    @classmethod
+    def from_binance_stream(cls, candle_info) -> "Candle":
+        return cls(candle_info['t'], float(candle_info['o']), float(candle_info['h']), float(candle_info['l']),
+                   float(candle_info['c']), float(candle_info['v']))
+
+    @classmethod
+    def from_bitmex(cls, candle_info, timeframe: str) -> "Candle":
+        # bitmex timestamps are the close time of the candle, we want the open time
+        # in milliseconds like the Binance timestamps
+        timestamp = iso_to_ms(candle_info['timestamp']) - BITMEX_TF_MINUTES[timeframe] * 60000
+
+        return cls(timestamp, candle_info['open'], candle_info['high'], candle_info['low'], candle_info['close'],
+                   candle_info['volume'])
 
 
 def tick_to_decimals(tick_size: float) -> int:
@@ -67,57 +143,79 @@ def tick_to_decimals(tick_size: float) -> int:
 
 
 class Contract:
-    def __init__(self, contract_info, exchange):
-        if exchange == "binance":
-            # print(contract_info)
-            self.symbol = contract_info['symbol']
-            self.base_asset = contract_info['baseAsset']
-            self.quote_asset = contract_info['quoteAsset']
-            self.price_decimals = contract_info['pricePrecision']
-            self.quantity_decimals = contract_info['quantityPrecision']
-            self.tick_size = 1 / pow(10, contract_info['pricePrecision'])
-            self.lot_size = 1 / pow(10, contract_info['quantityPrecision'])
-
-        elif exchange == "bitmex":
-            self.symbol = contract_info['symbol']
-            self.base_asset = contract_info['rootSymbol']
-            self.quote_asset = contract_info['quoteCurrency']
-            self.price_decimals = tick_to_decimals(contract_info['tickSize'])
-            self.quantity_decimals = tick_to_decimals(contract_info['lotSize'])
-            self.tick_size = contract_info['tickSize']
-            self.lot_size = contract_info['lotSize']
-
-            self.quanto = contract_info['isQuanto']
-            self.inverse = contract_info['isInverse']
-
-            # is in satoshi we need to covert to bitcoin
-            self.multiplier = contract_info['multiplier'] * BITMEX_MULTIPLIER
-
-            # if an inverse contract we multiply multiplier by -1 to make it positive
-            if self.inverse:
-                self.multiplier *= -1
+    __slots__ = ("symbol", "base_asset", "quote_asset", "price_decimals", "quantity_decimals", "tick_size",
+                 "lot_size", "quanto", "inverse", "multiplier")
+
+    def __init__(self, symbol: str, base_asset: str, quote_asset: str, price_decimals: int, quantity_decimals: int,
+                 tick_size: float, lot_size: float, quanto: bool = False, inverse: bool = False,
+                 multiplier: float = 1.0):
+        self.symbol = symbol
+        self.base_asset = base_asset
+        self.quote_asset = quote_asset
+        self.price_decimals = price_decimals
+        self.quantity_decimals = quantity_decimals
+        self.tick_size = tick_size
+        self.lot_size = lot_size
+
+        self.quanto = quanto
+        self.inverse = inverse
+        self.multiplier = multiplier
+
+    @classmethod
+    def from_binance(cls, contract_info) -> "Contract":
+        return cls(contract_info['symbol'], contract_info['baseAsset'], contract_info['quoteAsset'],
+                   contract_info['pricePrecision'], contract_info['quantityPrecision'],
+                   1 / pow(10, contract_info['pricePrecision']), 1 / pow(10, contract_info['quantityPrecision']))
+
+    @classmethod
+    def from_bitmex(cls, contract_info) -> "Contract":
+        # is in satoshi we need to covert to bitcoin
+        multiplier = contract_info['multiplier'] * BITMEX_MULTIPLIER
+
+        # if an inverse contract we multiply multiplier by -1 to make it positive
+        if contract_info['isInverse']:
+            multiplier *= -1
+
+        return cls(contract_info['symbol'], contract_info['rootSymbol'], contract_info['quoteCurrency'],
+                   tick_to_decimals(contract_info['tickSize']), tick_to_decimals(contract_info['lotSize']),
+                   contract_info['tickSize'], contract_info['lotSize'],
+                   contract_info['isQuanto'], contract_info['isInverse'], multiplier)
 
 
 class OrderStatus:
-    def __init__(self, order_info, exchange):
-        if exchange == "binance":
-            self.order_id = order_info['orderId']
-            self.status = order_info['status'].lower()
-            self.avg_price = float(order_info['avgPrice'])
-        elif exchange == "bitmex":
-            self.order_id = order_info['orderID']
-            self.status = order_info['ordStatus'].lower()
-            self.avg_price = order_info['avgPx']
+    __slots__ = ("order_id", "status", "avg_price")
+
+    def __init__(self, order_id, status: str, avg_price: float):
+        self.order_id = order_id
+        self.status = status
+        self.avg_price = avg_price
+
+    @classmethod
+    def from_binance(cls, order_info) -> "OrderStatus":
+        return cls(order_info['orderId'], order_info['status'].lower(), float(order_info['avgPrice']))
+
+    # "o" object of an ORDER_TRADE_UPDATE event of the user data stream
+    @classmethod
+    def from_binance_stream(cls, order_info) -> "OrderStatus":
+        return cls(order_info['i'], order_info['X'].lower(), float(order_info['ap']))
+
+    # also used for the rows of the execution and order tables, which may not carry the average price
+    @classmethod
+    def from_bitmex(cls, order_info) -> "OrderStatus":
+        return cls(order_info['orderID'], order_info['ordStatus'].lower(), order_info.get('avgPx'))
 
 
 class Trade:
-    def __init__(self, trade_info):
-        self.time: int = trade_info['time']
-        self.contract: Contract = trade_info['contract']
-        self.strategy: str = trade_info['strategy']
-        self.side: str = trade_info['side']
-        self.entry_price: float = trade_info['entry_price']
-        self.status: str = trade_info['status']
-        self.pnl: float = trade_info['pnl']
-        self.quantity = trade_info['quantity']
-        self.entry_id = trade_info['entry_id']
+    __slots__ = ("time", "contract", "strategy", "side", "entry_price", "status", "pnl", "quantity", "entry_id")
+
+    def __init__(self, time: int, contract: Contract, strategy: str, side: str, entry_price: float, status: str,
+                 pnl: float, quantity, entry_id):
+        self.time = time
+        self.contract = contract
+        self.strategy = strategy
+        self.side = side
+        self.entry_price = entry_price
+        self.status = status
+        self.pnl = pnl
+        self.quantity = quantity
+        self.entry_id = entry_id
@@ -0,0 +1,277 @@
+import argparse
+import csv
+import itertools
+import multiprocessing
+import multiprocessing.util
+import os
+import time
+import typing
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from backtest import COLUMNS, technical_signals, breakout_signals, simulate
+
+# Parameter search of the TechnicalStrategy and BreakoutStrategy on the candles of the local history cache
+# (see connectors/history.py), with the vectorized backtests of backtest.py.
+# Every combination of the strategy parameters (the _extra_params of the strategy editor) and of the take profit /
+# stop loss is backtested ("grid"), or --samples combinations drawn at random from the same values ("random").
+# The combinations are spread over a pool of processes. The candles are copied once into a shared memory block that
+# every process maps, the tasks only carry parameters: one task per set of signal parameters, whose signals are
+# computed once and simulated with each take profit / stop loss.
+#
+# A range of values is "start:stop:step" (stop included) or a comma separated list. Run from the repository root:
+# python optimize.py Technical cache/history/binance/BTCUSDT_1h.npz --rsi-length 7:21:7 --take-profit 1,2,4
+# python optimize.py Breakout cache/history/bitmex/XBTUSD_5m.npz --min-volume 0:5000:500 --search random --samples 500
+
+SIGNAL_PARAMS = {"Technical": ("rsi_length", "ema_fast", "ema_slow", "ema_signal"), "Breakout": ("min_volume",)}
+INT_PARAMS = ("rsi_length", "ema_fast", "ema_slow", "ema_signal")
+
+DEFAULT_RANGES = {"rsi_length": "7:28:7", "ema_fast": "8:16:4", "ema_slow": "20:32:6", "ema_signal": "6:12:3",
+                  "min_volume": "0", "take_profit": "0.5,1,2,4", "stop_loss": "0.5,1,2,4"}
+
+# the metrics of BacktestResult.summary() a table can be sorted by, the drawdown ranks the lowest first
+SORT_KEYS = ("total_return_pct", "pnl_pct", "win_rate", "trades", "max_drawdown_pct")
+
+# candles of the worker process, views on the shared memory block
+_shared_block: typing.Optional[shared_memory.SharedMemory] = None
+_shared_columns: typing.Dict[str, np.ndarray] = dict()
+
+
+def parse_values(text: str, integer: bool) -> typing.List[typing.Union[int, float]]:
+    cast = int if integer else float
+
+    if ":" in text:
+        start, stop, step = (cast(part) for part in text.split(":"))
+        if step <= 0:
+            raise ValueError(f"The step of the range {text} must be positive")
+        # the stop is included, within a rounding tolerance for the float steps
+        count = int(np.floor((stop - start) / step + 1e-9)) + 1
+        values = [start + i * step for i in range(max(count, 0))]
+        return values if integer else [round(v, 10) for v in values]
+
+    return [cast(part) for part in text.split(",")]
+
+
+# the timestamps and the OHLCV columns in one shared memory block: n int64 followed by 5 rows of n float64
+class SharedCandles:
+    def __init__(self, columns: typing.Dict[str, np.ndarray]):
+        self.length = len(columns['timestamp'])
+        self.block = shared_memory.SharedMemory(create=True, size=max(1, 6 * self.length * 8))
+
+        views = self.views(self.block, self.length)
+        for name in COLUMNS:
+            views[name][:] = columns[name]
+
+    @property
+    def name(self) -> str:
+        return self.block.name
+
+    @staticmethod
+    def views(block: shared_memory.SharedMemory, length: int) -> typing.Dict[str, np.ndarray]:
+        views = {"timestamp": np.ndarray((length,), dtype=np.int64, buffer=block.buf)}
+        ohlcv = np.ndarray((5, length), dtype=np.float64, buffer=block.buf, offset=length * 8)
+        for row, name in enumerate(COLUMNS[1:]):
+            views[name] = ohlcv[row]
+        return views
+
+    def release(self):
+        self.block.close()
+        self.block.unlink()
+
+
+def _attach(name: str, length: int):
+    global _shared_block, _shared_columns
+
+    _shared_block = shared_memory.SharedMemory(name=name)
+    _shared_columns = SharedCandles.views(_shared_block, length)
+
+    # run when the worker exits after pool.close(): the parent unlinks the block once every worker closed it
+    multiprocessing.util.Finalize(None, _detach, exitpriority=10)
+
+
+def _detach():
+    global _shared_block, _shared_columns
+
+    # the views must be gone before the block is closed
+    _shared_columns = dict()
+    if _shared_block is not None:
+        _shared_block.close()
+        _shared_block = None
+
+
+# one task: the signals of a set of signal parameters, simulated with each (take profit, stop loss)
+def _evaluate(task: typing.Tuple[str, typing.Dict, typing.List[typing.Tuple[float, float]], float]) -> \
+        typing.List[typing.Dict[str, typing.Union[int, float]]]:
+    strategy, params, exits, balance_pct = task
+    columns = _shared_columns
+
+    if strategy == "Technical":
+        signals = technical_signals(columns['close'], params['rsi_length'], params['ema_fast'], params['ema_slow'],
+                                    params['ema_signal'])
+        entry_prices, exit_offset = columns['open'], 0
+    else:
+        signals = breakout_signals(columns['high'], columns['low'], columns['close'], columns['volume'],
+                                   params['min_volume'])
+        entry_prices, exit_offset = columns['close'], 1
+
+    results = []
+    for take_profit, stop_loss in exits:
+        result = simulate(columns, signals, entry_prices, take_profit, stop_loss, exit_offset, balance_pct)
+
+        row = dict(params)
+        row['take_profit'] = take_profit
+        row['stop_loss'] = stop_loss
+        row.update(result.summary())
+        results.append(row)
+
+    return results
+
+
+# the values of each parameter as 1-tuples, in the order of SIGNAL_PARAMS then take profit / stop loss. The EMA
+# spans of the Technical strategy are a single dimension of the (fast, slow) pairs with fast < slow: a MACD whose
+# fast EMA isn't faster than the slow one gives no meaningful signal, so these pairs are never drawn
+def _dimensions(strategy: str, values: typing.Dict[str, typing.List]) -> typing.List[typing.List[typing.Tuple]]:
+    dimensions = []
+
+    for name in list(SIGNAL_PARAMS[strategy]) + ["take_profit", "stop_loss"]:
+        if strategy == "Technical" and name == "ema_fast":
+            dimensions.append([(fast, slow) for fast in values['ema_fast'] for slow in values['ema_slow']
+                               if fast < slow])
+        elif strategy == "Technical" and name == "ema_slow":
+            continue
+        else:
+            dimensions.append([(value,) for value in values[name]])
+
+    return dimensions
+
+
+# combinations grouped by signal parameters, in tasks
+def build_tasks(strategy: str, values: typing.Dict[str, typing.List], search: str, samples: int, seed: int,
+                balance_pct: float) -> typing.List[typing.Tuple[str, typing.Dict, typing.List, float]]:
+    dimensions = _dimensions(strategy, values)
+    sizes = [len(dimension) for dimension in dimensions]
+    total = int(np.prod(sizes, dtype=np.int64))
+    if total == 0:
+        return []
+
+    if search == "grid":
+        combinations = (sum(parts, ()) for parts in itertools.product(*dimensions))
+    else:
+        rng = np.random.default_rng(seed)
+        indexes = rng.choice(total, size=min(samples, total), replace=False)
+        # combination index -> one value index per dimension, the last dimension varying the fastest
+        combinations = []
+        for index in sorted(indexes.tolist()):
+            parts = []
+            for dimension, size in zip(reversed(dimensions), reversed(sizes)):
+                index, value_idx = divmod(index, size)
+                parts.append(dimension[value_idx])
+            combinations.append(sum(reversed(parts), ()))
+
+    groups: typing.Dict[typing.Tuple, typing.List[typing.Tuple[float, float]]] = dict()
+    for combination in combinations:
+        groups.setdefault(combination[:-2], []).append(combination[-2:])
+
+    signal_names = SIGNAL_PARAMS[strategy]
+
+    return [(strategy, dict(zip(signal_names, params)), exits, balance_pct) for params, exits in groups.items()]
+
+
+def optimize(columns: typing.Dict[str, np.ndarray], tasks: typing.List, workers: int) -> \
+        typing.List[typing.Dict[str, typing.Union[int, float]]]:
+    shared = SharedCandles(columns)
+
+    try:
+        with multiprocessing.Pool(workers, initializer=_attach, initargs=(shared.name, shared.length)) as pool:
+            # a few tasks per worker at a time: large enough to amortize the messages, small enough to balance
+            chunksize = max(1, len(tasks) // (workers * 8))
+            results = [row for rows in pool.imap_unordered(_evaluate, tasks, chunksize) for row in rows]
+
+            # the workers exit on their own and close their mapping of the block (leaving the with block
+            # would terminate them)
+            pool.close()
+            pool.join()
+    finally:
+        shared.release()
+
+    return results
+
+
+# the processes return their results in any order: the ties are ranked by parameter values
+def rank(results: typing.List[typing.Dict], names: typing.List[str], sort_key: str,
+         min_trades: int) -> typing.List[typing.Dict]:
+    kept = sorted((row for row in results if row['trades'] >= min_trades),
+                  key=lambda row: tuple(row[name] for name in names))
+    return sorted(kept, key=lambda row: row[sort_key], reverse=sort_key != "max_drawdown_pct")
+
+
+def print_table(rows: typing.List[typing.Dict], names: typing.List[str]):
+    metrics = ["trades", "win_rate", "pnl_pct", "total_return_pct", "max_drawdown_pct"]
+
+    header = f"{'rank':>5}" + "".join(f"{name:>13}" for name in names) + "".join(f"{m:>18}" for m in metrics)
+    print(header)
+
+    for idx, row in enumerate(rows):
+        line = f"{idx + 1:>5}" + "".join(f"{row[name]:>13}" for name in names)
+        line += "".join(f"{row[m]:>18}" for m in metrics)
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the strategy parameters on the cached candle history")
+    parser.add_argument("strategy", choices=list(SIGNAL_PARAMS.keys()))
+    parser.add_argument("cache_file", help="e.g. cache/history/binance/BTCUSDT_1m.npz")
+    for name, default in DEFAULT_RANGES.items():
+        parser.add_argument("--" + name.replace("_", "-"), default=default,
+                            help=f"start:stop:step or comma separated values (default {default})")
+    parser.add_argument("--balance-pct", type=float, default=100.0)
+    parser.add_argument("--search", choices=["grid", "random"], default="grid")
+    parser.add_argument("--samples", type=int, default=1000,
+                        help="combinations drawn by the random search (all of them when there are fewer)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--sort", choices=SORT_KEYS, default="total_return_pct")
+    parser.add_argument("--min-trades", type=int, default=1, help="combinations with fewer trades aren't ranked")
+    parser.add_argument("--top", type=int, default=20, help="rows of the table printed")
+    parser.add_argument("--output", default=None, help="write every ranked combination to this CSV file")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.cache_file):
+        parser.error(f"{args.cache_file} doesn't exist")
+
+    with np.load(args.cache_file) as cached:
+        columns = {name: cached[name] for name in COLUMNS}
+
+    names = list(SIGNAL_PARAMS[args.strategy]) + ["take_profit", "stop_loss"]
+    try:
+        values = {name: parse_values(getattr(args, name), name in INT_PARAMS) for name in names}
+    except ValueError as e:
+        parser.error(str(e))
+
+    tasks = build_tasks(args.strategy, values, args.search, args.samples, args.seed, args.balance_pct)
+    combinations = sum(len(task[2]) for task in tasks)
+
+    print(f"{len(columns['timestamp'])} candles, {combinations} combinations ({len(tasks)} signal sets) "
+          f"on {args.workers} processes")
+
+    start = time.perf_counter()
+    results = optimize(columns, tasks, args.workers)
+    elapsed = time.perf_counter() - start
+
+    ranked = rank(results, names, args.sort, args.min_trades)
+
+    print(f"{len(results)} combinations backtested in {elapsed:.2f} seconds, {len(ranked)} ranked by {args.sort}")
+    print_table(ranked[:args.top], names)
+
+    if args.output is not None:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["rank"] + names + list(SORT_KEYS))
+            writer.writeheader()
+            for idx, row in enumerate(ranked):
+                writer.writerow({"rank": idx + 1, **{key: row[key] for key in names + list(SORT_KEYS)}})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,365 @@
+import argparse
+import glob
+import logging
+import os
+import threading
+import time
+import typing
+
+import numpy as np
+
+from candle_store import CandleStore
+from models import Candle, Contract
+from strategies import TF_EQUIV
+
+logger = logging.getLogger()
+
+# Which contracts produce a Technical or Breakout signal on their last closed candle, all of them evaluated at once:
+# the last `depth` closed candles of every contract are stacked into 2-D arrays (one row per contract) and the
+# RSI / MACD and breakout conditions are computed column by column for all the rows together, with the same formulas
+# as the live _check_signal() methods. The EMAs start on the first candle of the window instead of the first candle
+# of the history, the difference fades after a few times their span.
+#
+# ContractScanner runs the scan on each candle close over every contract of a connector, whose closed candles
+# CandleUniverse keeps in memory (started by main.py with SCANNER=<strategy>:<timeframe>), the command line scans the
+# local history cache. Run from the repository root:
+# python scanner.py Technical cache/history/binance --timeframe 1h
+# python scanner.py Breakout cache/history/bitmex --timeframe 5m --min-volume 1000
+
+DEFAULT_DEPTH = 200
+# seconds after the candle close before the scan starts, the exchanges publish the closed candle with some delay
+DEFAULT_CLOSE_DELAY = 2.0
+
+DEFAULT_PARAMS = {"Technical": {"rsi_length": 14, "ema_fast": 12, "ema_slow": 26, "ema_signal": 9},
+                  "Breakout": {"min_volume": 0.0}}
+
+COLUMNS = ("high", "low", "close", "volume")
+
+
+# last `depth` candles of every contract with at least `depth` candles, one row per contract
+def stack(columns_by_symbol: typing.Dict[str, typing.Dict[str, np.ndarray]],
+          depth: int) -> typing.Tuple[typing.List[str], typing.Dict[str, np.ndarray]]:
+    symbols = [symbol for symbol, columns in columns_by_symbol.items() if len(columns['close']) >= depth]
+
+    stacked = dict()
+    for name in COLUMNS:
+        stacked[name] = np.empty((len(symbols), depth), dtype=np.float64)
+        for row, symbol in enumerate(symbols):
+            stacked[name][row] = columns_by_symbol[symbol][name][-depth:]
+
+    return symbols, stacked
+
+
+# pandas ewm(adjust=True) of each row, same recursion as indicators.EMA
+def ewm(values: np.ndarray, alpha: float, min_periods: int = 0) -> np.ndarray:
+    decay = 1 - alpha
+
+    result = np.empty_like(values)
+    num = np.zeros(values.shape[0])
+    den = 0.0
+
+    for col in range(values.shape[1]):
+        num = num * decay + values[:, col]
+        den = den * decay + 1
+        result[:, col] = num / den
+
+    result[:, :max(min_periods, 1) - 1] = np.nan
+
+    return result
+
+
+# relative strength index of the last candle of each row, same values as indicators.rsi_series
+def rsi_last(closes: np.ndarray, length: int) -> np.ndarray:
+    delta = np.diff(closes, axis=1)
+
+    alpha = 1 / length
+    avg_gain = ewm(np.clip(delta, 0, None), alpha, length)[:, -1]
+    avg_loss = ewm(np.clip(-delta, 0, None), alpha, length)[:, -1]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = 100 - 100 / (1 + avg_gain / avg_loss)
+
+    return np.round(rsi, 2)
+
+
+# macd line and macd signal of the last candle of each row
+def macd_last(closes: np.ndarray, ema_fast: int, ema_slow: int,
+              ema_signal: int) -> typing.Tuple[np.ndarray, np.ndarray]:
+    macd_line = ewm(closes, 2 / (ema_fast + 1)) - ewm(closes, 2 / (ema_slow + 1))
+    macd_signal = ewm(macd_line, 2 / (ema_signal + 1))
+
+    return macd_line[:, -1], macd_signal[:, -1]
+
+
+# 1 long / -1 short / 0 per row, TechnicalStrategy._check_signal() on the last candle of the row
+def technical_scan(stacked: typing.Dict[str, np.ndarray], rsi_length: int, ema_fast: int, ema_slow: int,
+                   ema_signal: int) -> np.ndarray:
+    closes = stacked['close']
+
+    rsi = rsi_last(closes, rsi_length)
+    macd_line, macd_signal = macd_last(closes, ema_fast, ema_slow, ema_signal)
+
+    signals = np.zeros(len(closes), dtype=np.int8)
+    signals[(rsi < 30) & (macd_line > macd_signal)] = 1
+    signals[(rsi > 70) & (macd_line < macd_signal)] = -1
+
+    return signals
+
+
+# 1 long / -1 short / 0 per row, BreakoutStrategy._check_signal() on the last candle of the row
+def breakout_scan(stacked: typing.Dict[str, np.ndarray], min_volume: float) -> np.ndarray:
+    highs, lows, closes, volumes = stacked['high'], stacked['low'], stacked['close'], stacked['volume']
+
+    enough_volume = volumes[:, -1] > min_volume
+
+    signals = np.zeros(len(closes), dtype=np.int8)
+    signals[(closes[:, -1] > highs[:, -2]) & enough_volume] = 1
+    signals[(closes[:, -1] < lows[:, -2]) & enough_volume & (signals == 0)] = -1
+
+    return signals
+
+
+SCANS = {"Technical": technical_scan, "Breakout": breakout_scan}
+
+
+# symbol -> signal (1 long / -1 short) of the contracts whose last candle produces a signal
+def scan(strategy: str, columns_by_symbol: typing.Dict[str, typing.Dict[str, np.ndarray]],
+         params: typing.Optional[typing.Dict] = None, depth: int = DEFAULT_DEPTH) -> typing.Dict[str, int]:
+    params = DEFAULT_PARAMS[strategy] if params is None else params
+
+    symbols, stacked = stack(columns_by_symbol, depth)
+    if len(symbols) == 0:
+        return dict()
+
+    signals = SCANS[strategy](stacked, **params)
+
+    return {symbols[row]: int(signals[row]) for row in np.flatnonzero(signals)}
+
+
+# Last `depth` closed candles in one timeframe of every contract of a connector (client.contracts). The history of
+# each contract is loaded once through the connector history service and its local cache, then the candles closed
+# on the exchange streams (watch_candles(): klines on Binance, tradeBin buckets on Bitmex) are appended as they come.
+# A contract whose stream skips candles (e.g. a reconnection) is loaded again from the history by the next refresh().
+# The stream callbacks run on the websocket threads, the loads and reads on the scanner thread. watch_candles() raises
+# ValueError for the timeframes without a stream (Bitmex: 1m, 5m, 1h and 1d only) and on the asyncio Binance connector
+# when the kline streams don't fit on its single connection.
+class CandleUniverse:
+    def __init__(self, client, timeframe: str, depth: int = DEFAULT_DEPTH):
+        self._client = client
+        self.timeframe = timeframe
+        self._tf_ms = TF_EQUIV[timeframe] * 1000
+        self.depth = depth
+
+        self._contracts: typing.Dict[str, Contract] = dict()
+        self._candles: typing.Dict[str, CandleStore] = dict()
+        # symbols to load from the history: not loaded yet, or whose stream skipped candles
+        self._stale: typing.Set[str] = set()
+        self._lock = threading.Lock()
+
+        self.loads = 0
+        self.streamed = 0
+        self.gaps = 0
+
+    # blocks until the history of every contract is loaded. The streams are subscribed first: a candle closing
+    # during the load is either in the history or received from the stream
+    def start(self):
+        self._contracts = dict(self._client.contracts)
+        self._client.watch_candles(list(self._contracts.values()), self.timeframe, self._on_candle)
+
+        with self._lock:
+            self._stale.update(self._contracts.keys())
+
+        start = time.perf_counter()
+        self.refresh()
+        logger.info("%s candles of %s contracts loaded in %.1f seconds", self.timeframe, len(self._candles),
+                    time.perf_counter() - start)
+
+    def stop(self):
+        self._client.unwatch_candles(list(self._contracts.values()), self.timeframe)
+
+    # loads the history of the contracts not loaded yet or whose stream skipped candles
+    def refresh(self):
+        with self._lock:
+            symbols = sorted(self._stale)
+            self._stale.clear()
+
+        for symbol in symbols:
+            self._load(self._contracts[symbol])
+
+    def _load(self, contract: Contract):
+        history = self._client.get_historical_candles(contract, self.timeframe, self.depth + 1)
+
+        with self._lock:
+            # no history (e.g. a failed request): tried again by the next refresh
+            if len(history) < 2:
+                self._stale.add(contract.symbol)
+                return
+
+            # the last candle of the history is still open
+            self._candles[contract.symbol] = CandleStore.from_arrays(
+                history.timestamps[:-1], history.opens[:-1], history.highs[:-1], history.lows[:-1],
+                history.closes[:-1], history.volumes[:-1], capacity=self.depth)
+            self.loads += 1
+
+    # closed candle received from the stream of the symbol
+    def _on_candle(self, symbol: str, candle: Candle):
+        with self._lock:
+            candles = self._candles.get(symbol)
+            if candles is None or symbol in self._stale:
+                return
+
+            expected = candles.last_timestamp + self._tf_ms
+
+            if candle.timestamp == expected:
+                candles.append(candle.timestamp, candle.open, candle.high, candle.low, candle.close, candle.volume)
+                self.streamed += 1
+            # an older candle is already stored (e.g. repeated by a subscription)
+            elif candle.timestamp > expected:
+                self._stale.add(symbol)
+                self.gaps += 1
+
+    # symbol -> closed candle columns, copied: the streams keep appending while the scan reads them
+    def columns(self) -> typing.Dict[str, typing.Dict[str, np.ndarray]]:
+        with self._lock:
+            return {symbol: {"high": candles.highs.copy(), "low": candles.lows.copy(), "close": candles.closes.copy(),
+                             "volume": candles.volumes.copy()}
+                    for symbol, candles in self._candles.items()}
+
+    def stats(self) -> typing.Dict[str, int]:
+        with self._lock:
+            return {"contracts": len(self._candles), "stale": len(self._stale), "loads": self.loads,
+                    "streamed": self.streamed, "gaps": self.gaps}
+
+
+# Scan on each candle close of the timeframe, in a daemon thread, of every contract of the connector: the candles are
+# kept by a CandleUniverse, after its first load a scan only reads memory (and loads again the few contracts whose
+# stream skipped candles). on_signals() is called with the matching symbols of every scan.
+# A scan never overlaps the next one: the next close waited for is the first one after the end of the scan, and a
+# scan lasting more than one timeframe period is logged with the closes it missed.
+class ContractScanner:
+    def __init__(self, client, timeframe: str, strategy: str, params: typing.Optional[typing.Dict] = None,
+                 depth: int = DEFAULT_DEPTH,
+                 on_signals: typing.Optional[typing.Callable[[typing.Dict[str, int]], None]] = None,
+                 close_delay: float = DEFAULT_CLOSE_DELAY):
+        if strategy not in SCANS:
+            raise ValueError(f"Unknown strategy {strategy}, expected one of {list(SCANS.keys())}")
+
+        self._client = client
+        self.timeframe = timeframe
+        self._tf_ms = TF_EQUIV[timeframe] * 1000
+        self.strategy = strategy
+        self.params = DEFAULT_PARAMS[strategy] if params is None else params
+        self.depth = depth
+        self._on_signals = on_signals
+        self._close_delay = close_delay
+
+        self.signals: typing.Dict[str, int] = dict()
+        self.scans = 0
+        self.missed_closes = 0
+        self.contracts_scanned = 0
+        self.last_duration = 0.0
+
+        self.universe = CandleUniverse(client, timeframe, depth)
+
+        self._stop = threading.Event()
+
+    def start(self):
+        t = threading.Thread(target=self._run, name=f"{self.strategy} {self.timeframe} scanner", daemon=True)
+        t.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        try:
+            self.universe.start()
+        except Exception as e:
+            logger.exception("Error while loading the %s candles of the contracts: %s", self.timeframe, e)
+
+        while True:
+            now = time.time() * 1000
+            next_close = now - now % self._tf_ms + self._tf_ms
+            if self._stop.wait((next_close - now) / 1000 + self._close_delay):
+                self.universe.stop()
+                return
+
+            try:
+                signals = self.scan_once()
+            except Exception as e:
+                logger.exception("Error while scanning the %s %s signals: %s", self.strategy, self.timeframe, e)
+                continue
+
+            # a scan longer than one period: the closes that happened during the scan aren't scanned
+            missed = int((time.time() * 1000 - next_close) // self._tf_ms)
+            if missed > 0:
+                self.missed_closes += missed
+                logger.warning("%s %s scan took %.2f seconds, %s candle closes skipped", self.strategy,
+                               self.timeframe, self.last_duration, missed)
+
+            if self._on_signals is not None:
+                self._on_signals(signals)
+
+    def scan_once(self) -> typing.Dict[str, int]:
+        start = time.perf_counter()
+
+        self.universe.refresh()
+        columns_by_symbol = self.universe.columns()
+        self.signals = scan(self.strategy, columns_by_symbol, self.params, self.depth)
+
+        self.scans += 1
+        self.contracts_scanned = len(columns_by_symbol)
+        self.last_duration = time.perf_counter() - start
+
+        logger.info("%s %s scan of %s contracts in %.3f seconds: %s", self.strategy, self.timeframe,
+                    len(columns_by_symbol), self.last_duration, self.signals)
+
+        return self.signals
+
+    def stats(self) -> typing.Dict[str, typing.Union[int, float, typing.Dict[str, int]]]:
+        return {"scans": self.scans, "missed_closes": self.missed_closes, "contracts": self.contracts_scanned,
+                "signals": len(self.signals), "last_duration": round(self.last_duration, 3),
+                "universe": self.universe.stats()}
+
+
+# scan of the contracts of the local history cache, e.g. cache/history/binance/<symbol>_<timeframe>.npz
+def main():
+    parser = argparse.ArgumentParser(description="Contracts whose last closed candle produces a strategy signal")
+    parser.add_argument("strategy", choices=list(SCANS.keys()))
+    parser.add_argument("cache_dir", help="e.g. cache/history/binance")
+    parser.add_argument("--timeframe", choices=list(TF_EQUIV.keys()), default="1h")
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH, help="closed candles evaluated per contract")
+    parser.add_argument("--rsi-length", type=int, default=14)
+    parser.add_argument("--ema-fast", type=int, default=12)
+    parser.add_argument("--ema-slow", type=int, default=26)
+    parser.add_argument("--ema-signal", type=int, default=9)
+    parser.add_argument("--min-volume", type=float, default=0.0)
+    args = parser.parse_args()
+
+    paths = glob.glob(os.path.join(args.cache_dir, f"*_{args.timeframe}.npz"))
+    if len(paths) == 0:
+        parser.error(f"No {args.timeframe} candles cached in {args.cache_dir}")
+
+    columns_by_symbol = dict()
+    for path in paths:
+        symbol = os.path.basename(path)[:-len(f"_{args.timeframe}.npz")]
+        with np.load(path) as cached:
+            # the last cached candle may have been saved while still open
+            columns_by_symbol[symbol] = {name: cached[name][:-1] for name in COLUMNS}
+
+    if args.strategy == "Technical":
+        params = {"rsi_length": args.rsi_length, "ema_fast": args.ema_fast, "ema_slow": args.ema_slow,
+                  "ema_signal": args.ema_signal}
+    else:
+        params = {"min_volume": args.min_volume}
+
+    start = time.perf_counter()
+    signals = scan(args.strategy, columns_by_symbol, params, args.depth)
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(columns_by_symbol)} contracts scanned in {elapsed * 1000:.1f} ms, {len(signals)} signals")
+    for symbol, signal in sorted(signals.items()):
+        print(f"{symbol:<20}{'long' if signal == 1 else 'short'}")
+
+
+if __name__ == '__main__':
+    main()
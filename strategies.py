@@ -2,20 +2,19 @@ import logging
 import time
 from typing import *
 
-# allows call delay without block open_position execution
-from threading import Timer
-
-import pandas as pd
-
 from models import *
 
+from candle_store import CandleStore
+from candle_aggregator import fold_trade, fold_trades, log_new_candles, check_latency
+from indicator_cache import IndicatorCache, shared_cache
+
 if TYPE_CHECKING:
     from connectors.bitmex import BitmexClient
     from connectors.binance_futures import BinanceFuturesClient
 
 logger = logging.getLogger()
 
-TF_EQUIV = {"1m": 60, "5m": 300, "15m": 900, "30m": 900, "1h": 3600, "4h": 14400}
+TF_EQUIV = {"1m": 60, "5m": 300, "15m": 900, "30m": 1800, "1h": 3600, "4h": 14400, "1d": 86400}
 
 
 class Strategy:
@@ -36,7 +35,7 @@ class Strategy:
 
         self.ongoing_position = False
 
-        self.candles: List[Candle] = []
+        self.candles = CandleStore()
         self.trades: List[Trade] = []
         self.logs = []
 
@@ -45,93 +44,51 @@ class Strategy:
         logger.info("%s", msg)
         self.logs.append({"log": msg, "displayed": False})
 
-    # 3 cases: update same current candle, new candle, new candle + missing candles
-    # by comparing the timestamp of the new trade with the timestamp of the most recent candle we have recorded
-    def parse_trades(self, price: float, size: float, timestamp: int) -> str:
-
-        timestamp_diff = int(time.time() * 1000) - timestamp
-        if timestamp_diff >= 2000:
-            logger.warning("%s %s: %s milliseconds of difference between the current time and the trade time",
-                        self.exchange, self.contract.symbol, timestamp_diff)
-            # if you see this msg to often means there is something wrong with check_signal that slows websocket updates
-
-        last_candle = self.candles[-1]
-
-        # Same Candle: update same current candle
-        if timestamp < last_candle.timestamp + self.tf_equiv:
-
-            last_candle.close = price
-            last_candle.volume += size
-
-            if price > last_candle.high:
-                last_candle.high = price
-            elif price < last_candle.low:
-                last_candle.low = price
-
-            return "same_candle"
-
-        # Missing Candle(s)
-        elif timestamp >= last_candle.timestamp + 2 * self.tf_equiv:
-
-            missing_candles = int((timestamp - last_candle.timestamp) / self.tf_equiv) - 1
-
-            logger.info("%s missing %s candles for %s %s (%s %s)", self.exchange, missing_candles, self.contract.symbol,
-                        self.tf, timestamp, last_candle.timestamp)
-            # adding number of missing candles to the candle list
-            for missing in range(missing_candles):
-                new_ts = last_candle.timestamp + self.tf_equiv
-                candle_info = {'ts': new_ts, 'open': last_candle.close, 'high': last_candle.close,
-                            'low': last_candle.close, 'close': last_candle.close, 'volume': 0}
-                new_candle = Candle(candle_info, self.tf, "parse_trade")
+    def _check_latency(self, timestamp: int):
+        check_latency(self.exchange, self.contract.symbol, timestamp)
 
-                self.candles.append(new_candle)
-
-                last_candle = new_candle
-
-            new_ts = last_candle.timestamp + self.tf_equiv
-            candle_info = {'ts': new_ts, 'open': price, 'high': price, 'low': price, 'close': price, 'volume': size}
-            new_candle = Candle(candle_info, self.tf, "parse_trade")
+    # candles of the strategy updated with a trade, returns "same_candle" or "new_candle".
+    # The live strategies share the candles built by the connector (candle_aggregator.CandleAggregator), these are
+    # for a strategy building its own candles (replays, benchmarks)
+    def parse_trades(self, price: float, size: float, timestamp: int) -> str:
 
-            self.candles.append(new_candle)
+        self._check_latency(timestamp)
 
-            return "new_candle"
+        tick_type, missing = fold_trade(self.candles, self.tf_equiv, price, size, timestamp)
+        if tick_type == "new_candle":
+            log_new_candles(self.exchange, self.contract.symbol, self.tf, missing)
 
-        # New Candle
-        elif timestamp >= last_candle.timestamp + self.tf_equiv:
-            new_ts = last_candle.timestamp + self.tf_equiv
-            candle_info = {'ts': new_ts, 'open': price, 'high': price, 'low': price, 'close': price, 'volume': size}
-            new_candle = Candle(candle_info, self.tf, "parse_trade")
+        return tick_type
 
-            self.candles.append(new_candle)
+    # several trades of the same symbol at once, only one event is returned (see candle_aggregator.fold_trades())
+    def parse_trades_batch(self, trades: List[Tuple[float, float, int]]) -> str:
 
-            logger.info("%s New candle for %s %s", self.exchange, self.contract.symbol, self.tf)
+        self._check_latency(trades[-1][2])
 
-            return "new_candle"
+        tick_type, missing = fold_trades(self.candles, self.tf_equiv, trades)
+        if tick_type == "new_candle":
+            log_new_candles(self.exchange, self.contract.symbol, self.tf, missing)
 
-    def _check_order_status(self, order_id):
+        return tick_type
 
-        order_status = self.client.get_order_status(self.contract, order_id)
+    # called by the connector with the updates of an order pushed by the exchange (user data stream), or requested
+    # over REST when the stream reconnects
+    def _on_order_update(self, order_status: OrderStatus):
 
-        # request is successful
-        if order_status is not None:
-            logger.info("%s order status: %s", self.exchange, order_status.status)
+        logger.info("%s order status: %s", self.exchange, order_status.status)
 
         if order_status.status == "filled":
             for trade in self.trades:
-                if trade.entry_id == order_id:
+                if trade.entry_id == order_status.order_id:
                     trade.entry_price = order_status.avg_price
                     break
-            return
-
-        t = Timer(2.0, lambda: self._check_order_status(order_id))
-        t.start()
 
     # we write open_position to further our signal processing
 
     def _open_position(self, signal_result: int):
 
         # pass the contract, current price, balance percentage parameter
-        trade_size = self.client.get_trade_size(self.contract, self.candles[-1].close, self.balance_pct)
+        trade_size = self.client.get_trade_size(self.contract, self.candles.last_close, self.balance_pct)
         if trade_size is None:
             return
 
@@ -154,16 +111,17 @@ class Strategy:
             # 2 cases: order is immediately executed returning order_status "filled" depending on the exchange
             if order_status.status == "filled":
                 avg_fill_price = order_status.avg_price
-            # execute get_order_status every to 2 seconds until we get the execution price
-            else:
-                t = Timer(2.0, lambda: self._check_order_status(order_status.order_id))
-                t.start()
-
-            new_trade = Trade({"time": int(time.time() * 1000), "entry_price": avg_fill_price,
-                               "contract": self.contract, "strategy": self.strat_name, "side": position_side,
-                               "status": "open", "pnl": 0, "quantity": trade_size, "entry_id": order_status.order_id})
+
+            new_trade = Trade(time=int(time.time() * 1000), contract=self.contract, strategy=self.strat_name,
+                              side=position_side, entry_price=avg_fill_price, status="open", pnl=0,
+                              quantity=trade_size, entry_id=order_status.order_id)
             self.trades.append(new_trade)
 
+            # otherwise the execution price comes with the fill update of the order (the trade must exist by then,
+            # the update may already have been received)
+            if order_status.status != "filled":
+                self.client.track_order(self.contract, order_status.order_id, self._on_order_update)
+
 
 # we have almost all the info to send a buy or sell order, the signal side.
 # we are going to place a market order -so no bid/ask price required at this point.
@@ -174,7 +132,8 @@ class Strategy:
 
 class TechnicalStrategy(Strategy):
     def __init__(self, client, contract: Contract, exchange: str, timeframe: str, balance_pct: float,
-                 take_profit: float, stop_loss: float, other_params: Dict):
+                 take_profit: float, stop_loss: float, other_params: Dict,
+                 indicator_cache: Optional[IndicatorCache] = None):
         super().__init__(client, contract, exchange, timeframe, balance_pct, take_profit, stop_loss, "Technical")
 
         self._ema_fast = other_params['ema_fast']
@@ -184,68 +143,21 @@ class TechnicalStrategy(Strategy):
         # print("Activated strategy for ", contract.symbol)
         self._rsi_length = other_params['rsi_length']
 
-        # using candlesticks to calculate indicators with 2 indicators rsi and macd
-
-    # relative strength index, formulas:
-    # 100 - (100/1 + RS); RS = Relative Strength RS = Average Gain / Average Loss
-    def _rsi(self):
-        close_list = []
-        for candle in self.candles:
-            close_list.append(candle.close)
-        # we'll need RSI periods or number of candles used to calculate the RSI.
-        closes = pd.Series(close_list)
-        # we need to calculate average gain and loss over the period to get a pandas series representing the variations,
-        # the gains and the losses between each close price, using diff() method.
-        # we create two delta series to separate the gains form the losses
-        delta = closes.diff().dropna()
-
-        up, down = delta.copy(), delta.copy()
-        # filters rows under 0 and keeps the gains only
-        up[up < 0] = 0
-        # filter rows higher than 0 set them to 0
-        down[down > 0] = 0
-
-        # use moving average to calculate the average gains
-        avg_gain = up.ewm(com=(self._rsi_length - 1), min_periods=self._rsi_length).mean()
-        avg_loss = down.abs().ewm(com=(self._rsi_length - 1), min_periods=self._rsi_length).mean()
-
-        rs = avg_gain / avg_loss
-
-        rsi = 100 - 100 / (1 + rs)
-        rsi = rsi.round(2)
-
-        # iloc select data in row number
-        return rsi.iloc[-2]
-
-    # moving average convergence-divergence in 4 steps: (EMA = exponential moving average)
-    # 1. Fast EMA calculation
-    # 2. Slow EMA calculation
-    # 3. Fast EMA - Slow EMA
-    # 4. EMA on the result of step 3
-    # we'll need a list of EMAS, each corresponding to each candlestick recorded
-    # we only need to compute the EMA based on the close price of each candle
-    # also we will provide a list of close prices of our candles
+        # using candlesticks to calculate indicators with 2 indicators rsi and macd.
+        # The indicators are read from a cache shared with the other strategies of the same contract and timeframe,
+        # updated once per closed candle (the last candle is still being built so it is never included)
+        self._indicator_cache = shared_cache if indicator_cache is None else indicator_cache
+        self._series = (exchange, contract.symbol, timeframe)
+
+    # relative strength index of the last finished candle, same value as the former rsi.iloc[-2]
+    def _rsi(self) -> float:
+        return self._indicator_cache.rsi(self._series, self.candles, self._rsi_length)
+
+    # moving average convergence-divergence of the last finished candle:
+    # returning a tuple of 2 elements: macd line and macd signal of the previous candle
     def _macd(self) -> Tuple[float, float]:
-        close_list = []
-        for candle in self.candles:
-            close_list.append(candle.close)
-        # we use pandas to work with Dataframes or time series since candles can be represented as time series
-        # each row is a new timestamp and columns represent open, high, low and close price
-        # we convert the list of close prices to a pandas series object
-        closes = pd.Series(close_list)
-        # we calculate the EMA of a series using ewm (Exponential Weighted Functions) then the mean with mean method
-        # span is the period chosen
-        ema_fast = closes.ewm(span=self._ema_fast).mean()
-        ema_slow = closes.ewm(span=self._ema_slow).mean()
-
-        macd_line = ema_fast - ema_slow
-        # we will calculate when there is a new candle, since we're interested in the last finished candle
-        # the signal will depend on whether the macd line is above or below the macd signal line.
-        # a long signal when the macd line goes above the signal line
-        # returning a tuple of 2 elements: macd line  and macd signal of the previous candle
-        macd_signal = macd_line.ewm(span=self._ema_signal).mean()
-
-        return macd_line.iloc[-2], macd_signal.iloc[-2]
+        return self._indicator_cache.macd(self._series, self.candles, self._ema_fast, self._ema_slow,
+                                          self._ema_signal)
 
     def _check_signal(self):
 
@@ -288,10 +200,13 @@ class BreakoutStrategy(Strategy):
     # check signal to enter long or short trade or do nothing, returning 1 = long, -1 = short and 0 no signal
     def _check_signal(self) -> int:
 
+        close = self.candles.closes[-1]
+        volume = self.candles.volumes[-1]
+
         # current candle volume must be more than the minimun volumen parameter input
-        if self.candles[-1].close > self.candles[-2].high and self.candles[-1].volume > self._min_volume:
+        if close > self.candles.highs[-2] and volume > self._min_volume:
             return 1
-        if self.candles[-1].close < self.candles[-2].low and self.candles[-1].volume > self._min_volume:
+        if close < self.candles.lows[-2] and volume > self._min_volume:
             return -1
         else:
             return 0
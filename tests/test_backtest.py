@@ -0,0 +1,72 @@
+# Run from the repository root: python -m pytest tests
+
+import numpy as np
+import pytest
+
+from backtest import backtest_breakout, simulate
+
+TF_MS = 60000
+
+
+def _columns(rows) -> dict:
+    table = np.array(rows, dtype=np.float64)
+    return {"timestamp": np.arange(len(rows), dtype=np.int64) * TF_MS, "open": table[:, 0], "high": table[:, 1],
+            "low": table[:, 2], "close": table[:, 3], "volume": table[:, 4]}
+
+
+# open, high, low, close, volume
+BREAKOUT_CANDLES = [
+    (100.0, 101.0, 99.0, 100.0, 1),
+    (100.0, 101.0, 99.0, 102.0, 10),  # closes above the previous high with volume: long at 102
+    (102.0, 103.0, 101.5, 102.5, 1),  # above the previous high without volume: no signal, the position stays open
+    (102.5, 105.0, 102.0, 104.5, 1),  # reaches the take profit 102 * 1.02
+    (104.5, 104.6, 100.0, 100.5, 10),  # closes below the previous low with volume: short at 100.5
+    (102.0, 102.5, 101.0, 101.8, 1),  # opens beyond the stop loss 100.5 * 1.01: exit at the open
+]
+
+
+def test_breakout_trades_of_a_hand_built_series():
+    result = backtest_breakout(_columns(BREAKOUT_CANDLES), take_profit=2, stop_loss=1, other_params={"min_volume": 5})
+    trades = result.trades
+
+    assert trades['entry_idx'].tolist() == [1, 4]
+    assert trades['exit_idx'].tolist() == [3, 5]
+    assert trades['side'].tolist() == [1, -1]
+    assert trades['exit_reason'].tolist() == ["tp", "sl"]
+    assert trades['entry_price'].tolist() == [102.0, 100.5]
+    assert trades['exit_price'].tolist() == pytest.approx([102 * 1.02, 102.0])
+
+    first, second = 2.0, -(102.0 / 100.5 - 1) * 100
+    assert trades['return_pct'].tolist() == pytest.approx([first, second])
+
+    summary = result.summary()
+    assert summary['trades'] == 2
+    assert summary['win_rate'] == 0.5
+    assert summary['pnl_pct'] == pytest.approx(round(first + second, 4))
+    assert summary['total_return_pct'] == pytest.approx(round((1.02 * (1 + second / 100) - 1) * 100, 4))
+    assert summary['max_drawdown_pct'] == pytest.approx(round(-second, 4))
+
+
+def test_half_of_the_balance_per_trade():
+    result = backtest_breakout(_columns(BREAKOUT_CANDLES), 2, 1, {"min_volume": 5}, balance_pct=50)
+
+    second = -(102.0 / 100.5 - 1) * 100
+    assert result.equity.tolist() == pytest.approx([1.01, 1.01 * (1 + second / 200)])
+
+
+def test_stop_loss_first_and_position_still_open():
+    columns = _columns([
+        (100.0, 100.5, 99.5, 100.0, 1),
+        (100.0, 103.0, 98.0, 101.0, 1),  # long at the open, both the take profit and the stop loss are reached
+        (101.0, 101.5, 100.5, 101.0, 1),  # short at the open, neither level is reached until the last candle
+        (101.0, 101.2, 100.8, 100.9, 1),
+    ])
+    signals = np.array([0, 1, -1, 0], dtype=np.int8)
+
+    result = simulate(columns, signals, columns['open'], take_profit=2, stop_loss=1, exit_offset=0)
+    trades = result.trades
+
+    assert trades['exit_reason'].tolist() == ["sl", "open"]
+    assert trades['exit_idx'].tolist() == [1, 3]
+    assert trades['exit_price'].tolist() == pytest.approx([99.0, 100.9])
+    assert trades['return_pct'].tolist() == pytest.approx([-1.0, -(100.9 / 101.0 - 1) * 100])
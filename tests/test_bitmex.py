@@ -0,0 +1,42 @@
+# Run from the repository root: python -m pytest tests
+
+import json
+import time
+
+from candle_store import CandleStore
+from connectors.bitmex import BitmexClient
+from models import Contract, ms_to_iso
+from strategies import BreakoutStrategy
+
+TF_MS = 60000
+
+
+def _trade_frame(action: str, price: float, size: float, timestamp: int) -> str:
+    return json.dumps({"table": "trade", "action": action,
+                       "data": [{"timestamp": ms_to_iso(timestamp), "symbol": "XBTUSD", "side": "Buy",
+                                 "size": size, "price": price}]})
+
+
+def test_trade_partial_is_not_counted_in_the_candles(tmp_path, monkeypatch):
+    # the contracts of the offline client mustn't replace the ones cached for the application
+    monkeypatch.chdir(tmp_path)
+
+    client = BitmexClient("", "", testnet=True, connect=False)
+    contract = Contract("XBTUSD", "XBT", "USD", 1, 0, 0.5, 1, inverse=True, multiplier=-100000000)
+
+    now = int(time.time() * 1000)
+    current_open = now - now % TF_MS
+
+    strategy = BreakoutStrategy(client, contract, "bitmex", "1m", 10, 1, 1, {"min_volume": 0})
+    strategy.candles = CandleStore()
+    strategy.candles.append(current_open, 100, 100, 100, 100, 5)
+    client.add_strategy(0, strategy)
+
+    # the snapshot repeats a trade of the current candle, only the trade inserted after it is new
+    client._on_message(None, _trade_frame("partial", 100, 5, now))
+    client._on_message(None, _trade_frame("insert", 101, 2, now))
+    client.wait_idle()
+
+    assert client.dispatch_stats()['submitted'] == 1
+    assert strategy.candles.volumes[-1] == 7
+    assert strategy.candles.highs[-1] == 101
@@ -0,0 +1,227 @@
+# Run from the repository root: python -m pytest tests
+
+import json
+import time
+
+import numpy as np
+import pytest
+
+from candle_aggregator import CandleAggregator, fold_trade, fold_trades
+from candle_store import CandleStore
+from connectors.bitmex import BitmexClient
+from models import Contract, ms_to_iso
+from strategies import BreakoutStrategy, TF_EQUIV
+
+TF_MS = 60000
+START = 1_700_000_040_000 - 1_700_000_040_000 % TF_MS
+
+
+def _store(open_ts: int = START, price: float = 100.0) -> CandleStore:
+    candles = CandleStore(capacity=500)
+    candles.append(open_ts - TF_MS, price, price, price, price, 3)
+    candles.append(open_ts, price, price, price, price, 1)
+    return candles
+
+
+def _assert_same_candles(a: CandleStore, b: CandleStore):
+    assert len(a) == len(b)
+    assert np.array_equal(a.timestamps, b.timestamps)
+    for column in ("opens", "highs", "lows", "closes", "volumes"):
+        assert np.array_equal(getattr(a, column), getattr(b, column)), column
+
+
+# the frame folded in one batch and print by print: same candles, one event for the whole frame
+def _fold_both_ways(trades, open_ts: int = START):
+    batched, one_by_one = _store(open_ts), _store(open_ts)
+
+    batch_event, batch_missing = fold_trades(batched, TF_MS, trades)
+
+    events, missing = [], 0
+    for price, size, timestamp in trades:
+        event, event_missing = fold_trade(one_by_one, TF_MS, price, size, timestamp)
+        events.append(event)
+        missing += event_missing
+
+    _assert_same_candles(batched, one_by_one)
+    assert batch_missing == missing
+    assert batch_event == ("new_candle" if "new_candle" in events else "same_candle")
+
+    return batched, batch_event, batch_missing
+
+
+def test_frame_inside_the_current_candle():
+    trades = [(101.0, 2, START + 1000), (99.5, 1, START + 1500), (100.5, 4, START + 2000)]
+
+    candles, event, missing = _fold_both_ways(trades)
+
+    assert event == "same_candle"
+    assert missing == 0
+    assert len(candles) == 2
+    assert (candles.highs[-1], candles.lows[-1], candles.closes[-1], candles.volumes[-1]) == (101.0, 99.5, 100.5, 8)
+
+
+def test_frame_crossing_a_candle_boundary():
+    trades = [(101.0, 2, START + 59000), (102.0, 1, START + 59500), (98.0, 3, START + TF_MS + 10),
+              (99.0, 5, START + TF_MS + 20)]
+
+    candles, event, missing = _fold_both_ways(trades)
+
+    assert event == "new_candle"
+    assert missing == 0
+    assert candles.timestamps[-1] == START + TF_MS
+    assert (candles.opens[-1], candles.highs[-1], candles.lows[-1], candles.closes[-1]) == (98.0, 99.0, 98.0, 99.0)
+    assert candles.volumes[-1] == 8
+    assert candles.volumes[-2] == 4
+
+
+def test_frame_with_a_gap_of_missing_candles():
+    trades = [(101.0, 2, START + 100), (97.0, 1, START + 4 * TF_MS + 100), (96.0, 1, START + 4 * TF_MS + 200),
+              (103.0, 2, START + 7 * TF_MS)]
+
+    candles, event, missing = _fold_both_ways(trades)
+
+    assert event == "new_candle"
+    assert missing == 3 + 2
+    assert np.array_equal(np.diff(candles.timestamps[1:]), np.full(7, TF_MS))
+    # the missing candles are flat at the last close, without volume
+    assert candles.volumes[2] == 0 and candles.opens[2] == candles.closes[2] == 101.0
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_frames(seed):
+    rng = np.random.default_rng(seed)
+
+    batched, one_by_one = _store(), _store()
+    timestamp = START
+    for _ in range(300):
+        trades = []
+        for _ in range(int(rng.integers(1, 20))):
+            # mostly a few ms between prints, sometimes a candle or more
+            timestamp += int(rng.choice([rng.integers(0, 2000), rng.integers(TF_MS, 4 * TF_MS)], p=[0.97, 0.03]))
+            trades.append((round(float(100 + rng.normal(0, 2)), 1), int(rng.integers(1, 100)), timestamp))
+
+        batch_event, _ = fold_trades(batched, TF_MS, trades)
+        events = [fold_trade(one_by_one, TF_MS, *trade)[0] for trade in trades]
+
+        assert batch_event == ("new_candle" if "new_candle" in events else "same_candle")
+
+    _assert_same_candles(batched, one_by_one)
+
+
+# a multi-print Bitmex frame reaches each strategy of the symbol as a single candle event
+def test_bitmex_frame_is_checked_once_per_strategy(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    client = BitmexClient("", "", testnet=True, connect=False)
+    contract = Contract("XBTUSD", "XBT", "USD", 1, 0, 0.5, 1, inverse=True, multiplier=-100000000)
+
+    ticks = []
+
+    class Recording(BreakoutStrategy):
+        def check_trade(self, tick_type: str):
+            ticks.append(tick_type)
+            return super().check_trade(tick_type)
+
+    strategy = Recording(client, contract, "bitmex", "1m", 10, 1, 1, {"min_volume": 1e12})
+    strategy.candles = _store()
+    reference = _store()
+    client.add_strategy(0, strategy)
+
+    trades = [(101.0, 2, START + 59000), (102.0, 1, START + 59500), (98.0, 3, START + TF_MS + 10)]
+    frame = {"table": "trade", "action": "insert",
+             "data": [{"timestamp": ms_to_iso(ts), "symbol": "XBTUSD", "side": "Buy", "size": size, "price": price}
+                      for price, size, ts in trades]}
+
+    client._on_message(None, json.dumps(frame))
+    client.wait_idle()
+
+    for trade in trades:
+        fold_trade(reference, TF_MS, *trade)
+
+    assert ticks == ["new_candle"]
+    _assert_same_candles(strategy.candles, reference)
+
+
+ROLL_UP = ["1m", "5m", "15m", "1h"]
+
+
+def _rolled_up_and_reference(trades_start: int):
+    contract = Contract("BTCUSDT", "BTC", "USDT", 2, 3, 0.01, 0.001)
+    aggregator = CandleAggregator("binance", "BTCUSDT")
+    strategies = dict()
+
+    # the history of every timeframe ends with the candle holding the first trade
+    for timeframe in ROLL_UP:
+        tf_ms = TF_EQUIV[timeframe] * 1000
+        current_open = trades_start - trades_start % tf_ms
+
+        strategy = BreakoutStrategy(None, contract, "binance", timeframe, 10, 1, 1, {"min_volume": 0})
+        strategy.candles = _store(current_open)
+        strategies[timeframe] = strategy
+        aggregator.add(timeframe, tf_ms, _store(current_open))
+
+    return aggregator, strategies
+
+
+def _random_trades(rng, start: int, count: int):
+    trades = []
+    timestamp = start
+    for _ in range(count):
+        # a few seconds between prints, sometimes a gap of minutes or hours without a trade
+        gap = rng.choice([rng.integers(0, 5000), rng.integers(60000, 1_200_000), rng.integers(3_600_000, 10_800_000)],
+                         p=[0.98, 0.015, 0.005])
+        timestamp += int(gap)
+        trades.append((round(float(100 + rng.normal(0, 2)), 1), int(rng.integers(1, 100)), timestamp))
+    return trades
+
+
+# the higher timeframes rolled up from the base candles are the candles each strategy would build from the trades
+@pytest.mark.parametrize("seed", range(3))
+def test_roll_up_matches_per_strategy_candles(seed):
+    rng = np.random.default_rng(seed)
+    # trades in the future of the clock: no latency warning
+    start = int(time.time() * 1000) + 3_600_000
+    aggregator, strategies = _rolled_up_and_reference(start)
+
+    for price, size, timestamp in _random_trades(rng, start, 5000):
+        ticks = aggregator.update(price, size, timestamp)
+        for timeframe, strategy in strategies.items():
+            assert ticks[timeframe] == strategy.parse_trades(price, size, timestamp), timeframe
+
+    for timeframe, strategy in strategies.items():
+        _assert_same_candles(aggregator.candles(timeframe), strategy.candles)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_batched_roll_up_matches_per_strategy_candles(seed):
+    rng = np.random.default_rng(seed)
+    start = int(time.time() * 1000) + 3_600_000
+    aggregator, strategies = _rolled_up_and_reference(start)
+
+    trades = _random_trades(rng, start, 5000)
+    idx = 0
+    while idx < len(trades):
+        frame = trades[idx:idx + int(rng.integers(1, 30))]
+        idx += len(frame)
+
+        ticks = aggregator.update_batch(frame)
+        for timeframe, strategy in strategies.items():
+            assert ticks[timeframe] == strategy.parse_trades_batch(frame), timeframe
+
+    for timeframe, strategy in strategies.items():
+        _assert_same_candles(aggregator.candles(timeframe), strategy.candles)
+
+
+def test_timeframes_are_shared_and_released_by_their_users():
+    aggregator = CandleAggregator("binance", "BTCUSDT")
+
+    first = aggregator.add("5m", 300000, _store(START))
+    assert aggregator.add("5m", 300000, _store(START)) is first
+    aggregator.add("1m", TF_MS, _store(START))
+
+    assert aggregator.timeframes() == ["1m", "5m"]
+
+    aggregator.remove("5m")
+    assert aggregator.candles("5m") is first
+    aggregator.remove("5m")
+    assert aggregator.timeframes() == ["1m"]
@@ -0,0 +1,110 @@
+# Run from the repository root: python -m pytest tests
+
+import numpy as np
+import pytest
+
+from candle_store import CandleStore
+from models import Candle
+
+TF_MS = 60000
+
+
+def _candle(idx: int) -> tuple:
+    return idx * TF_MS, 100.0 + idx, 101.0 + idx, 99.0 + idx, 100.5 + idx, float(idx)
+
+
+def _row(candle: Candle) -> tuple:
+    return candle.timestamp, candle.open, candle.high, candle.low, candle.close, candle.volume
+
+
+def _expected(first: int, last: int) -> np.ndarray:
+    return np.array([_candle(idx) for idx in range(first, last)], dtype=np.float64).T
+
+
+def _columns(store: CandleStore) -> np.ndarray:
+    return np.vstack([store.timestamps, store.opens, store.highs, store.lows, store.closes, store.volumes])
+
+
+# past the capacity the oldest candles are overwritten, the views still hold the last candles in order
+@pytest.mark.parametrize("count", [1, 7, 8, 9, 15, 16, 17, 50])
+def test_wraparound_keeps_the_last_candles_in_order(count):
+    capacity = 8
+    store = CandleStore(capacity)
+    for idx in range(count):
+        store.append(*_candle(idx))
+
+    first = max(0, count - capacity)
+    assert len(store) == count - first
+    assert np.array_equal(_columns(store), _expected(first, count))
+
+    assert _row(store[0]) == _candle(first)
+    assert _row(store[-1]) == _candle(count - 1)
+    assert [_row(c) for c in store] == [_candle(idx) for idx in range(first, count)]
+    assert store.last_timestamp == (count - 1) * TF_MS
+
+    with pytest.raises(IndexError):
+        store[len(store)]
+
+
+@pytest.mark.parametrize("count", [3, 8, 13])
+def test_views_are_contiguous_and_zero_copy(count):
+    store = CandleStore(8)
+    for idx in range(count):
+        store.append(*_candle(idx))
+
+    for column in (store.timestamps, store.opens, store.highs, store.lows, store.closes, store.volumes):
+        assert column.flags['C_CONTIGUOUS']
+        assert column.base is not None
+
+    # an update of the current candle is seen by a view taken before it
+    closes = store.closes
+    store.update_last(1000.0, 2)
+    assert closes[-1] == 1000.0
+    assert store.highs[-1] == 1000.0
+    assert store.volumes[-1] == count - 1 + 2
+
+
+def test_update_and_merge_of_the_last_candle_across_the_wrap():
+    store = CandleStore(4)
+    for idx in range(4):
+        store.append(*_candle(idx))
+
+    # the last candle is at the end of the ring, both of its copies are updated
+    store.update_last(90.0, 1)
+    store.merge_last(120.0, 95.0, 110.0, 3)
+    assert _row(store[-1]) == (3 * TF_MS, 103.0, 120.0, 90.0, 110.0, 7.0)
+
+    store.append(*_candle(4))
+    store.merge_last(110.0, 80.0, 85.0, 1)
+    assert _row(store[-1]) == (4 * TF_MS, 104.0, 110.0, 80.0, 85.0, 5.0)
+    assert np.array_equal(store.timestamps, np.arange(1, 5) * TF_MS)
+
+
+def test_current_candle_of_an_empty_store():
+    store = CandleStore(4)
+
+    with pytest.raises(IndexError):
+        store.update_last(100.0, 1)
+    with pytest.raises(IndexError):
+        store.merge_last(100.0, 100.0, 100.0, 1)
+    with pytest.raises(IndexError):
+        store.last_timestamp
+
+    assert len(store) == 0
+    assert len(store.closes) == 0
+
+
+@pytest.mark.parametrize("count", [0, 5, 8, 20])
+def test_from_arrays_keeps_the_last_rows(count):
+    columns = _expected(0, count) if count else np.zeros((6, 0))
+    store = CandleStore.from_arrays(columns[0].astype(np.int64), *columns[1:], capacity=8)
+
+    first = max(0, count - 8)
+    assert len(store) == count - first
+    if count:
+        assert np.array_equal(_columns(store), _expected(first, count))
+
+    # appending after a bulk load continues the ring
+    store.append(*_candle(count))
+    assert _row(store[-1]) == _candle(count)
+    assert np.array_equal(store.timestamps, np.arange(max(first, count + 1 - 8), count + 1) * TF_MS)
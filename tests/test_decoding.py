@@ -0,0 +1,103 @@
+# Run from the repository root: python -m pytest tests
+
+import importlib
+import json
+import sys
+import threading
+import types
+
+import pytest
+
+from connectors import decoding
+from connectors.decoding import FrameDecoder, OTHER_EVENTS, SNIFF_WINDOW
+
+AGG_TRADE = '{"e":"aggTrade","E":1,"s":"BTCUSDT","a":1,"p":"100.0","q":"1","T":1,"m":false}'
+DEPTH = '{"e":"depthUpdate","E":1,"s":"BTCUSDT","b":[],"a":[]}'
+
+
+def test_sniff_reads_the_key_at_the_start_of_the_frame():
+    decoder = FrameDecoder("e", ["aggTrade"])
+
+    assert decoder.sniff(AGG_TRADE) == "aggTrade"
+    assert decoder.sniff('{"table":"trade","action":"insert","data":[]}') is None
+
+    # a key nested in the payload, after the sniff window, isn't the event type
+    nested = '{"result":null,"id":1,"padding":"' + "x" * SNIFF_WINDOW + '","e":"aggTrade"}'
+    assert decoder.sniff(nested) is None
+
+
+def test_frames_not_accepted_are_dropped_before_parsing():
+    decoder = FrameDecoder("e", ["aggTrade"])
+
+    assert decoder.decode(AGG_TRADE)['p'] == "100.0"
+    assert decoder.decode(DEPTH) is None
+
+    stats = decoder.stats()
+    assert stats['aggTrade'] == {"frames": 1, "decoded": 1, "dropped": 0, "seconds": stats['aggTrade']['seconds']}
+    assert stats['depthUpdate']['dropped'] == 1
+    assert stats['depthUpdate']['decoded'] == 0
+    assert stats['depthUpdate']['seconds'] == 0.0
+
+
+def test_frames_without_the_key_are_decoded():
+    decoder = FrameDecoder("e", ["aggTrade"])
+
+    answer = '{"result":null,"id":1}'
+    assert decoder.decode(answer) == json.loads(answer)
+
+    # valid JSON with the key past the sniff window: decoded in full, counted with the other frames
+    nested = '{"result":null,"id":1,"padding":"' + "x" * SNIFF_WINDOW + '","e":"depthUpdate"}'
+    assert decoder.decode(nested)['e'] == "depthUpdate"
+
+    assert decoder.decode('{"e":"aggTrade",') is None
+
+    stats = decoder.stats()
+    assert stats[OTHER_EVENTS]['decoded'] == 2
+    assert stats['aggTrade'] == {"frames": 1, "decoded": 0, "dropped": 0, "seconds": stats['aggTrade']['seconds']}
+
+
+def test_counters_of_concurrent_connections():
+    decoder = FrameDecoder("e", ["aggTrade"])
+
+    def decode():
+        for _ in range(2000):
+            decoder.decode(AGG_TRADE)
+            decoder.decode(DEPTH)
+
+    threads = [threading.Thread(target=decode) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    stats = decoder.stats()
+    assert stats['aggTrade']['frames'] == stats['aggTrade']['decoded'] == 16000
+    assert stats['depthUpdate']['frames'] == stats['depthUpdate']['dropped'] == 16000
+
+
+def _backend_module(name: str) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.loads = json.loads
+    return module
+
+
+@pytest.fixture
+def reload_decoding():
+    yield lambda: importlib.reload(decoding)
+    importlib.reload(decoding)
+
+
+@pytest.mark.parametrize("installed, expected", [
+    (("orjson", "ujson"), "orjson"),
+    (("ujson",), "ujson"),
+    ((), "json"),
+])
+def test_backend_order(monkeypatch, reload_decoding, installed, expected):
+    # None in sys.modules makes the import fail, as if the package wasn't installed
+    for name in ("orjson", "ujson"):
+        monkeypatch.setitem(sys.modules, name, _backend_module(name) if name in installed else None)
+
+    module = reload_decoding()
+
+    assert module.JSON_BACKEND == expected
+    assert module.FrameDecoder("e", ["aggTrade"]).decode(AGG_TRADE)['s'] == "BTCUSDT"
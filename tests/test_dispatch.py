@@ -0,0 +1,69 @@
+# Run from the repository root: python -m pytest tests
+
+import threading
+import time
+
+from candle_store import CandleStore
+from connectors.dispatch import TradeDispatcher
+from connectors.routing import StrategyRouter
+from models import Contract
+from strategies import BreakoutStrategy
+
+SYMBOLS = ["BTCUSDT", "ETHUSDT", "SOLUSDT", "XRPUSDT"]
+TF_MS = 60000
+
+
+def _router(current_open: int) -> StrategyRouter:
+    router = StrategyRouter()
+    for idx, symbol in enumerate(SYMBOLS):
+        contract = Contract(symbol, symbol[:-4], "USDT", 2, 3, 0.01, 0.001)
+        strategy = BreakoutStrategy(None, contract, "binance", "1m", 10, 1, 1, {"min_volume": 1e12})
+        strategy.candles = CandleStore()
+        strategy.candles.append(current_open - TF_MS, 100, 100, 100, 100, 1)
+        strategy.candles.append(current_open, 100, 100, 100, 100, 1)
+        router.add(idx, strategy)
+    return router
+
+
+def _current_open() -> int:
+    now = int(time.time() * 1000)
+    return now - now % TF_MS
+
+
+# trades of the current candle, none of them opens a new one
+def _submit_from_threads(dispatcher: TradeDispatcher, threads: int, trades: int):
+    def submit(symbol: str):
+        timestamp = int(time.time() * 1000)
+        for _ in range(trades):
+            dispatcher.submit(symbol, 100.0, 1.0, timestamp)
+
+    workers = [threading.Thread(target=submit, args=(SYMBOLS[i % len(SYMBOLS)],)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+
+
+def test_counters_of_concurrent_submits():
+    dispatcher = TradeDispatcher(_router(_current_open()), "test", workers=2)
+    dispatcher.start()
+
+    _submit_from_threads(dispatcher, 8, 5000)
+    dispatcher.wait_idle()
+
+    stats = dispatcher.stats()
+    assert stats['submitted'] == 40000
+    assert stats['processed'] == 40000
+    assert stats['dropped'] == 0
+
+
+def test_counters_of_concurrent_submits_with_drops():
+    dispatcher = TradeDispatcher(_router(_current_open()), "test", workers=2, queue_size=10, overflow="drop_oldest")
+    dispatcher.start()
+
+    _submit_from_threads(dispatcher, 8, 5000)
+    dispatcher.wait_idle()
+
+    stats = dispatcher.stats()
+    assert stats['submitted'] == 40000
+    assert stats['processed'] + stats['dropped'] == 40000
@@ -0,0 +1,84 @@
+# Run from the repository root: python -m pytest tests
+
+import os
+import threading
+import time
+
+import numpy as np
+
+from connectors.history import HistoryService, COLUMNS
+from models import Contract
+
+TF_MS = 60000
+PAGE_SIZE = 1000
+
+
+def _service(tmp_path) -> HistoryService:
+    return HistoryService(None, "binance", PAGE_SIZE, 4, cache_dir=str(tmp_path))
+
+
+def _cache(service: HistoryService, first_ts: int, count: int):
+    timestamps = first_ts + np.arange(count, dtype=np.int64) * TF_MS
+    columns = {name: np.ones(count) for name in COLUMNS[1:]}
+    columns['timestamp'] = timestamps
+    service._save("BTCUSDT", "1m", columns)
+
+
+def _current_open() -> int:
+    now = int(time.time() * 1000)
+    return now - now % TF_MS
+
+
+def test_plan_ignores_a_cache_older_than_the_depth(tmp_path):
+    service = _service(tmp_path)
+    contract = Contract("BTCUSDT", "", "", 2, 3, 0.01, 0.001)
+
+    # two weeks old, 20 pages of candles behind the wanted window
+    _cache(service, _current_open() - 14 * 24 * 3600 * 1000, 500)
+
+    cached, pages, wanted_start = service._plan(contract, "1m", 500)
+
+    assert cached is None
+    assert len(pages) == 1
+    assert pages[0][0] == wanted_start
+    assert all(start >= wanted_start for start, end in pages)
+
+
+def test_plan_downloads_only_the_tail_of_a_recent_cache(tmp_path):
+    service = _service(tmp_path)
+    contract = Contract("BTCUSDT", "", "", 2, 3, 0.01, 0.001)
+
+    current_open = _current_open()
+    _cache(service, current_open - 509 * TF_MS, 500)
+
+    cached, pages, wanted_start = service._plan(contract, "1m", 500)
+
+    assert cached is not None
+    assert pages == [(current_open - 10 * TF_MS, current_open)]
+
+
+def test_concurrent_saves_of_the_same_contract(tmp_path):
+    service = _service(tmp_path)
+
+    first_ts = _current_open() - 99 * TF_MS
+    threads = [threading.Thread(target=_cache, args=(service, first_ts, 100)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    cached = service._load("BTCUSDT", "1m")
+    assert len(cached['timestamp']) == 100
+    assert os.listdir(tmp_path / "binance") == ["BTCUSDT_1m.npz"]
+
+
+def test_plan_of_the_daily_timeframe(tmp_path):
+    service = _service(tmp_path)
+    contract = Contract("BTCUSDT", "", "", 2, 3, 0.01, 0.001)
+
+    cached, pages, wanted_start = service._plan(contract, "1d", 30)
+
+    day_ms = 24 * 3600 * 1000
+    assert cached is None
+    assert wanted_start % day_ms == 0
+    assert pages == [(wanted_start, wanted_start + 29 * day_ms)]
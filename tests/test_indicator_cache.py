@@ -0,0 +1,212 @@
+# Run from the repository root: python -m pytest tests
+
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from candle_store import CandleStore
+from indicator_cache import IndicatorCache
+from indicators import rsi_series, macd_series
+from models import Contract
+from strategies import TechnicalStrategy
+
+TOLERANCE = 1e-9
+TF_MS = 60000
+SERIES = ("binance", "BTCUSDT", "1m")
+PARAMS = {"rsi_length": 14, "ema_fast": 12, "ema_slow": 26, "ema_signal": 9}
+
+
+def _candles(count: int, seed: int = 3) -> CandleStore:
+    rng = np.random.default_rng(seed)
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, count)))
+
+    candles = CandleStore()
+    for idx, close in enumerate(closes):
+        candles.append(idx * TF_MS, close, close, close, close, 1)
+    return candles
+
+
+def _new_candle(candles: CandleStore, close: float):
+    candles.append(candles.last_timestamp + TF_MS, close, close, close, close, 1)
+
+
+# the values computed from scratch on the closed candles, without the cache
+def _closed(candles: CandleStore) -> pd.Series:
+    return pd.Series(candles.closes[:-1], dtype=float)
+
+
+def _uncached_ema(candles: CandleStore, span: int) -> float:
+    return _closed(candles).ewm(span=span).mean().iloc[-1]
+
+
+def _uncached_rsi(candles: CandleStore, length: int) -> float:
+    return rsi_series(_closed(candles), length).iloc[-1]
+
+
+def _uncached_macd(candles: CandleStore, fast: int, slow: int, signal: int) -> tuple:
+    line, signal = macd_series(_closed(candles), fast, slow, signal)
+    return line.iloc[-1], signal.iloc[-1]
+
+
+def _assert_close(value: float, reference: float):
+    assert value == pytest.approx(reference, abs=TOLERANCE, rel=0)
+
+
+def test_strategies_of_the_same_series_share_the_entries():
+    cache = IndicatorCache()
+    contract = Contract("BTCUSDT", "BTC", "USDT", 2, 3, 0.01, 0.001)
+    candles = _candles(300)
+
+    strategies = [TechnicalStrategy(None, contract, "binance", "1m", 10, 1, 1, PARAMS, indicator_cache=cache)
+                  for _ in range(2)]
+    for strategy in strategies:
+        strategy.candles = candles
+
+    values = [(strategy._rsi(), strategy._macd()) for strategy in strategies]
+
+    assert values[0] == values[1]
+    stats = cache.stats()
+    # the RSI and the MACD are computed for the first strategy, read from the cache by the second one
+    assert (stats['misses'], stats['hits']) == (2, 2)
+    # RSI, MACD signal and its two EMAs
+    assert stats['entries'] == 4
+    assert stats['series'] == 1
+
+    # a MACD with other spans only adds its signal line when it shares its EMAs
+    cache.ema(SERIES, candles, 12)
+    cache.ema(SERIES, candles, 26)
+    cache.macd(SERIES, candles, 12, 26, 5)
+    assert cache.stats()['entries'] == 5
+    assert cache.stats()['hits'] == 4
+
+
+def test_a_new_closed_candle_updates_the_entries_once():
+    cache = IndicatorCache()
+    candles = _candles(300)
+
+    cache.rsi(SERIES, candles, 14)
+    cache.macd(SERIES, candles, 12, 26, 9)
+
+    # trades of the current candle don't change the values of the closed candles
+    candles.update_last(candles.last_close * 1.05, 10)
+    _assert_close(cache.rsi(SERIES, candles, 14), _uncached_rsi(candles, 14))
+    assert cache.stats()['updates'] == 0
+
+    rng = np.random.default_rng(11)
+    for _ in range(50):
+        _new_candle(candles, candles.last_close * math.exp(rng.normal(0, 0.01)))
+
+        rsi = cache.rsi(SERIES, candles, 14)
+        line, signal = cache.macd(SERIES, candles, 12, 26, 9)
+
+        _assert_close(rsi, _uncached_rsi(candles, 14))
+        reference_line, reference_signal = _uncached_macd(candles, 12, 26, 9)
+        _assert_close(line, reference_line)
+        _assert_close(signal, reference_signal)
+
+    assert cache.stats()['updates'] == 50
+    assert cache.stats()['misses'] == 2
+
+    # several candles closed between two lookups are all fed to the entries
+    for _ in range(7):
+        _new_candle(candles, candles.last_close * 1.001)
+    _assert_close(cache.rsi(SERIES, candles, 14), _uncached_rsi(candles, 14))
+    assert cache.stats()['updates'] == 51
+
+
+def test_least_recently_used_entry_is_evicted_at_capacity():
+    cache = IndicatorCache(max_entries=3)
+    candles = _candles(200)
+
+    for span in (5, 10, 20):
+        cache.ema(SERIES, candles, span)
+    # the EMA 5 is used again, the EMA 10 is now the least recently used
+    cache.ema(SERIES, candles, 5)
+    cache.ema(SERIES, candles, 30)
+
+    stats = cache.stats()
+    assert (stats['entries'], stats['evictions']) == (3, 1)
+
+    hits = stats['hits']
+    cache.ema(SERIES, candles, 5)
+    cache.ema(SERIES, candles, 30)
+    assert cache.stats()['hits'] == hits + 2
+
+    _assert_close(cache.ema(SERIES, candles, 10), _uncached_ema(candles, 10))
+    assert cache.stats()['misses'] == 5
+
+
+def test_evicting_an_ema_evicts_the_macd_reading_it():
+    cache = IndicatorCache(max_entries=3)
+    candles = _candles(200)
+
+    cache.macd(SERIES, candles, 12, 26, 9)
+    assert cache.stats()['entries'] == 3
+
+    # the fast EMA is the least recently used entry, the MACD signal can't be updated without it
+    cache.rsi(SERIES, candles, 14)
+    stats = cache.stats()
+    assert (stats['entries'], stats['evictions']) == (2, 2)
+
+    _new_candle(candles, candles.last_close * 1.01)
+    line, signal = cache.macd(SERIES, candles, 12, 26, 9)
+    reference_line, reference_signal = _uncached_macd(candles, 12, 26, 9)
+    _assert_close(line, reference_line)
+    _assert_close(signal, reference_signal)
+
+
+# entries evicted and warmed up again all along the stream: the values stay the uncached ones
+def test_values_after_evictions_match_the_uncached_computation():
+    cache = IndicatorCache(max_entries=4)
+    stores = {symbol: _candles(150, seed) for seed, symbol in enumerate(("BTCUSDT", "ETHUSDT"))}
+
+    rng = np.random.default_rng(5)
+    for step in range(120):
+        symbol = ("BTCUSDT", "ETHUSDT")[step % 2]
+        candles = stores[symbol]
+        series = ("binance", symbol, "1m")
+        if rng.random() < 0.5:
+            _new_candle(candles, candles.last_close * math.exp(rng.normal(0, 0.01)))
+
+        length = int(rng.choice([7, 14]))
+        _assert_close(cache.rsi(series, candles, length), _uncached_rsi(candles, length))
+
+        fast, slow = int(rng.choice([8, 12])), int(rng.choice([21, 26]))
+        line, signal = cache.macd(series, candles, fast, slow, 9)
+        reference_line, reference_signal = _uncached_macd(candles, fast, slow, 9)
+        _assert_close(line, reference_line)
+        _assert_close(signal, reference_signal)
+
+        assert cache.stats()['entries'] <= 4
+
+    assert cache.stats()['evictions'] > 0
+
+
+def test_hit_rate_report():
+    cache = IndicatorCache()
+    candles = _candles(100)
+
+    assert cache.stats() == {"entries": 0, "series": 0, "lookups": 0, "hits": 0, "misses": 0, "updates": 0,
+                             "evictions": 0, "hit_rate": 0.0}
+
+    # not enough candles: nothing is looked up
+    assert math.isnan(cache.rsi(SERIES, _candles(1), 14))
+    assert cache.stats()['lookups'] == 0
+
+    cache.rsi(SERIES, candles, 14)
+    cache.rsi(SERIES, candles, 14)
+    cache.rsi(SERIES, candles, 14)
+
+    stats = cache.stats()
+    assert (stats['lookups'], stats['hits'], stats['misses']) == (3, 2, 1)
+    assert stats['hit_rate'] == 0.6667
+
+    cache.clear()
+    assert cache.stats()['entries'] == 0
+
+
+def test_capacity_too_small_for_a_macd():
+    with pytest.raises(ValueError):
+        IndicatorCache(max_entries=2)
@@ -0,0 +1,119 @@
+# Run from the repository root: python -m pytest tests
+
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from candle_store import CandleStore
+from indicator_cache import IndicatorCache
+from indicators import EMA, RSI, MACD
+from models import Contract
+from strategies import TechnicalStrategy
+
+# the streaming indicators follow the same recursion as pandas ewm(adjust=True), only the float rounding differs
+TOLERANCE = 1e-9
+
+RSI_LENGTH, EMA_FAST, EMA_SLOW, EMA_SIGNAL = 14, 12, 26, 9
+TF_MS = 60000
+
+
+def _closes(count: int, seed: int = 7) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return 100 * np.exp(np.cumsum(rng.normal(0, 0.01, count)))
+
+
+# the former TechnicalStrategy._rsi(): RSI of the whole series, value of the candle before the last
+def _reference_rsi(closes: np.ndarray) -> float:
+    delta = pd.Series(closes).diff().dropna()
+    up, down = delta.copy(), delta.copy()
+    up[up < 0] = 0
+    down[down > 0] = 0
+
+    avg_gain = up.ewm(com=(RSI_LENGTH - 1), min_periods=RSI_LENGTH).mean()
+    avg_loss = down.abs().ewm(com=(RSI_LENGTH - 1), min_periods=RSI_LENGTH).mean()
+
+    return (100 - 100 / (1 + avg_gain / avg_loss)).round(2).iloc[-2]
+
+
+# the former TechnicalStrategy._macd(): macd line and signal of the candle before the last
+def _reference_macd(closes: np.ndarray) -> tuple:
+    series = pd.Series(closes)
+    macd_line = series.ewm(span=EMA_FAST).mean() - series.ewm(span=EMA_SLOW).mean()
+    macd_signal = macd_line.ewm(span=EMA_SIGNAL).mean()
+
+    return macd_line.iloc[-2], macd_signal.iloc[-2]
+
+
+def _assert_close(value: float, reference: float):
+    assert value == pytest.approx(reference, abs=TOLERANCE, rel=0)
+
+
+@pytest.mark.parametrize("warm_up_count", [0, 1, 10, 300])
+def test_streaming_ema_matches_pandas(warm_up_count):
+    closes = _closes(500)
+
+    ema = EMA.from_span(EMA_SLOW)
+    ema.warm_up(pd.Series(closes[:warm_up_count]))
+
+    reference = pd.Series(closes).ewm(span=EMA_SLOW).mean()
+    if warm_up_count > 0:
+        _assert_close(ema.value, reference.iloc[warm_up_count - 1])
+
+    for idx in range(warm_up_count, len(closes)):
+        _assert_close(ema.update(closes[idx]), reference.iloc[idx])
+
+
+@pytest.mark.parametrize("warm_up_count", [0, 5, 15, 300])
+def test_streaming_rsi_and_macd_match_pandas(warm_up_count):
+    closes = _closes(500)
+
+    rsi = RSI(RSI_LENGTH)
+    macd = MACD(EMA_FAST, EMA_SLOW, EMA_SIGNAL)
+    rsi.warm_up(pd.Series(closes[:warm_up_count]))
+    macd.warm_up(pd.Series(closes[:warm_up_count]))
+
+    # the reference of closes[:n] is read at iloc[-2] of closes[:n + 1]: n closed candles and one being built
+    fed = warm_up_count
+    for n in range(max(warm_up_count, 2), len(closes)):
+        while fed < n:
+            rsi.update(closes[fed])
+            macd.update(closes[fed])
+            fed += 1
+
+        reference_rsi = _reference_rsi(closes[:n + 1])
+        if math.isnan(reference_rsi):
+            assert math.isnan(rsi.value)
+        else:
+            _assert_close(rsi.value, reference_rsi)
+
+        line, signal = _reference_macd(closes[:n + 1])
+        _assert_close(macd.macd_line, line)
+        _assert_close(macd.macd_signal, signal)
+
+
+def test_technical_strategy_matches_the_former_pandas_computation():
+    closes = _closes(700)
+    history = 300
+
+    contract = Contract("BTCUSDT", "BTC", "USDT", 2, 3, 0.01, 0.001)
+    strategy = TechnicalStrategy(None, contract, "binance", "1m", 10, 1, 1,
+                                 {"rsi_length": RSI_LENGTH, "ema_fast": EMA_FAST, "ema_slow": EMA_SLOW,
+                                  "ema_signal": EMA_SIGNAL}, indicator_cache=IndicatorCache())
+
+    # the history warms the indicators up through pandas, then a new candle opens for each later close
+    strategy.candles = CandleStore()
+    for idx in range(history):
+        strategy.candles.append(idx * TF_MS, closes[idx], closes[idx], closes[idx], closes[idx], 1)
+
+    for idx in range(history, len(closes)):
+        rsi = strategy._rsi()
+        macd_line, macd_signal = strategy._macd()
+
+        reference_line, reference_signal = _reference_macd(closes[:idx])
+        _assert_close(rsi, _reference_rsi(closes[:idx]))
+        _assert_close(macd_line, reference_line)
+        _assert_close(macd_signal, reference_signal)
+
+        strategy.candles.append(idx * TF_MS, closes[idx], closes[idx], closes[idx], closes[idx], 1)
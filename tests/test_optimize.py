@@ -0,0 +1,76 @@
+# Run from the repository root: python -m pytest tests
+
+import numpy as np
+import pytest
+
+from backtest import backtest_technical, backtest_breakout
+from optimize import build_tasks, optimize
+
+TF_MS = 60000
+
+TECHNICAL_VALUES = {"rsi_length": [7, 14], "ema_fast": [8, 12, 26], "ema_slow": [12, 26], "ema_signal": [9],
+                    "take_profit": [0.5, 2.0], "stop_loss": [0.5, 1.0]}
+BREAKOUT_VALUES = {"min_volume": [0.0, 5.0, 8.0], "take_profit": [0.5, 2.0], "stop_loss": [0.5, 1.0]}
+
+
+def _columns(count: int = 3000, seed: int = 2) -> dict:
+    rng = np.random.default_rng(seed)
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.004, count)))
+    opens = np.concatenate(([100.0], closes[:-1]))
+    spread = np.abs(rng.normal(0, 0.002, count)) * closes
+
+    return {"timestamp": np.arange(count, dtype=np.int64) * TF_MS, "open": opens,
+            "high": np.maximum(opens, closes) + spread, "low": np.minimum(opens, closes) - spread, "close": closes,
+            "volume": rng.exponential(5, count)}
+
+
+def _key(row: dict, names) -> tuple:
+    return tuple(row[name] for name in names)
+
+
+# every combination computed by the worker processes is the result of a direct backtest.py run
+@pytest.mark.parametrize("strategy, values, backtest", [
+    ("Technical", TECHNICAL_VALUES, backtest_technical),
+    ("Breakout", BREAKOUT_VALUES, backtest_breakout),
+])
+def test_optimizer_results_match_direct_backtests(strategy, values, backtest):
+    columns = _columns()
+    tasks = build_tasks(strategy, values, "grid", 0, 1, 50.0)
+
+    results = optimize(columns, tasks, 2)
+
+    names = list(values.keys())
+    assert len(results) == len({_key(row, names) for row in results})
+    assert len(results) == sum(len(task[2]) for task in tasks)
+    assert sum(row['trades'] for row in results) > 0
+
+    for row in results:
+        result = backtest(columns, row['take_profit'], row['stop_loss'], row, 50.0)
+        assert {key: row[key] for key in result.summary()} == result.summary(), _key(row, names)
+
+
+def test_grid_skips_the_macd_without_a_faster_ema():
+    tasks = build_tasks("Technical", TECHNICAL_VALUES, "grid", 0, 1, 100.0)
+
+    pairs = {(task[1]['ema_fast'], task[1]['ema_slow']) for task in tasks}
+    assert pairs == {(8, 12), (8, 26), (12, 26)}
+    # 2 rsi lengths x 3 EMA pairs x 1 signal, each with 2 x 2 exits
+    assert len(tasks) == 6
+    assert all(len(task[2]) == 4 for task in tasks)
+
+
+@pytest.mark.parametrize("samples", [1, 10, 23, 24, 100])
+def test_random_search_draws_the_samples_requested(samples):
+    tasks = build_tasks("Technical", TECHNICAL_VALUES, "random", samples, 3, 100.0)
+
+    combinations = [(tuple(task[1].values()), exit_) for task in tasks for exit_ in task[2]]
+    assert len(combinations) == min(samples, 24)
+    assert len(set(combinations)) == len(combinations)
+    assert all(task[1]['ema_fast'] < task[1]['ema_slow'] for task in tasks)
+
+
+def test_no_valid_ema_pair():
+    values = dict(TECHNICAL_VALUES, ema_fast=[26], ema_slow=[12])
+
+    assert build_tasks("Technical", values, "random", 10, 1, 100.0) == []
+    assert build_tasks("Technical", values, "grid", 10, 1, 100.0) == []
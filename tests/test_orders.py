@@ -0,0 +1,40 @@
+# Run from the repository root: python -m pytest tests
+
+import threading
+import time
+
+from connectors.orders import OrderTracker
+from models import Contract, OrderStatus
+
+CONTRACT = Contract("BTCUSDT", "BTC", "USDT", 2, 3, 0.01, 0.001)
+
+
+def test_resync_in_background_returns_before_the_requests():
+    release = threading.Event()
+    requested = []
+
+    def get_order_status(contract, order_id):
+        release.wait(5)
+        requested.append(order_id)
+        return OrderStatus(order_id, "filled", 100.0)
+
+    updates = []
+    tracker = OrderTracker("test", get_order_status)
+    tracker.track(CONTRACT, 1, updates.append)
+
+    start = time.monotonic()
+    tracker.resync_in_background()
+    assert time.monotonic() - start < 1
+    assert requested == []
+
+    # asked for again while the first one runs: the order placed meanwhile is requested by a second pass
+    tracker.track(CONTRACT, 2, updates.append)
+    tracker.resync_in_background()
+
+    release.set()
+    deadline = time.monotonic() + 5
+    while len(updates) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert sorted(u.order_id for u in updates) == [1, 2]
+    assert tracker.pending() == 0
@@ -0,0 +1,176 @@
+# Run from the repository root: python -m pytest tests
+
+import json
+
+import numpy as np
+
+from candle_store import CandleStore
+from connectors.binance_futures import BinanceFuturesClient
+from connectors.bitmex import BitmexClient
+from models import Candle, Contract, ms_to_iso
+from scanner import CandleUniverse, ContractScanner, scan
+
+TF_MS = 60000
+START = 1_700_000_040_000 - 1_700_000_040_000 % TF_MS
+DEPTH = 30
+
+
+def _candle(symbol: str, open_ts: int) -> Candle:
+    close = 100 + 10 * np.sin(open_ts / TF_MS / 5 + len(symbol)) + sum(map(ord, symbol)) % 7
+    return Candle(open_ts, close - 0.5, close + 1, close - 1, close, 10 + open_ts // TF_MS % 13)
+
+
+# connector stand-in: the history of every symbol ends with the open candle at `now`
+class _Client:
+    def __init__(self, symbols):
+        self.contracts = {symbol: Contract(symbol, symbol[:-4], "USDT", 2, 3, 0.01, 0.001) for symbol in symbols}
+        self.now = START
+        self.requests = []
+        self.failing = set()
+        self.callback = None
+        self.watched = []
+
+    def watch_candles(self, contracts, timeframe, callback):
+        self.watched = [contract.symbol for contract in contracts]
+        self.callback = callback
+
+    def unwatch_candles(self, contracts, timeframe):
+        self.watched = []
+
+    def get_historical_candles(self, contract, timeframe, depth):
+        self.requests.append(contract.symbol)
+        if contract.symbol in self.failing:
+            return CandleStore()
+        return CandleStore.from_candles([_candle(contract.symbol, self.now - i * TF_MS)
+                                         for i in range(depth - 1, -1, -1)])
+
+
+def test_universe_loads_every_contract_and_appends_the_streamed_candles():
+    client = _Client(["AAAUSDT", "BBBUSDT", "CCCUSDT"])
+    universe = CandleUniverse(client, "1m", DEPTH)
+    universe.start()
+
+    assert client.watched == ["AAAUSDT", "BBBUSDT", "CCCUSDT"]
+    assert sorted(client.requests) == ["AAAUSDT", "BBBUSDT", "CCCUSDT"]
+
+    # the open candle of the history isn't kept
+    columns = universe.columns()
+    assert len(columns['AAAUSDT']['close']) == DEPTH
+    assert columns['AAAUSDT']['close'][-1] == _candle("AAAUSDT", START - TF_MS).close
+
+    client.callback("AAAUSDT", _candle("AAAUSDT", START))
+    # already stored, and a symbol outside of the contracts
+    client.callback("AAAUSDT", _candle("AAAUSDT", START - TF_MS))
+    client.callback("ZZZUSDT", _candle("ZZZUSDT", START))
+
+    columns = universe.columns()
+    assert len(columns['AAAUSDT']['close']) == DEPTH
+    assert columns['AAAUSDT']['close'][-1] == _candle("AAAUSDT", START).close
+    assert universe.stats() == {"contracts": 3, "stale": 0, "loads": 3, "streamed": 1, "gaps": 0}
+
+    # no request once loaded
+    universe.refresh()
+    assert len(client.requests) == 3
+
+
+def test_universe_reloads_a_contract_whose_stream_skipped_candles():
+    client = _Client(["AAAUSDT", "BBBUSDT"])
+    universe = CandleUniverse(client, "1m", DEPTH)
+    universe.start()
+
+    client.now = START + 3 * TF_MS
+    client.callback("BBBUSDT", _candle("BBBUSDT", START + 2 * TF_MS))
+    assert universe.stats()['gaps'] == 1
+
+    # the candles received until the reload are ignored
+    client.callback("BBBUSDT", _candle("BBBUSDT", START + 3 * TF_MS))
+
+    universe.refresh()
+    assert client.requests[-1] == "BBBUSDT"
+
+    closes = universe.columns()['BBBUSDT']['close']
+    assert closes[-1] == _candle("BBBUSDT", START + 2 * TF_MS).close
+    assert closes[-3] == _candle("BBBUSDT", START).close
+    assert universe.stats() == {"contracts": 2, "stale": 0, "loads": 3, "streamed": 0, "gaps": 1}
+
+
+def test_universe_retries_a_failed_load():
+    client = _Client(["AAAUSDT", "BBBUSDT"])
+    client.failing.add("BBBUSDT")
+    universe = CandleUniverse(client, "1m", DEPTH)
+    universe.start()
+
+    assert sorted(universe.columns().keys()) == ["AAAUSDT"]
+    assert universe.stats()['stale'] == 1
+
+    client.failing.clear()
+    universe.refresh()
+    assert sorted(universe.columns().keys()) == ["AAAUSDT", "BBBUSDT"]
+
+
+def test_scan_of_the_universe_matches_the_scan_of_the_history():
+    symbols = [f"S{i:02d}USDT" for i in range(20)]
+    client = _Client(symbols)
+    scanner = ContractScanner(client, "1m", "Breakout", depth=DEPTH)
+    scanner.universe.start()
+
+    for symbol in symbols:
+        client.callback(symbol, _candle(symbol, START))
+
+    columns = dict()
+    for symbol in symbols:
+        candles = [_candle(symbol, START - i * TF_MS) for i in range(DEPTH - 1, -1, -1)]
+        columns[symbol] = {"high": np.array([c.high for c in candles]), "low": np.array([c.low for c in candles]),
+                           "close": np.array([c.close for c in candles]),
+                           "volume": np.array([c.volume for c in candles])}
+
+    assert scanner.scan_once() == scan("Breakout", columns, depth=DEPTH)
+    assert scanner.stats()['contracts'] == 20
+
+
+def _kline(symbol: str, open_ts: int, closed: bool) -> str:
+    return json.dumps({"e": "kline", "E": open_ts + 1000, "s": symbol,
+                       "k": {"t": open_ts, "T": open_ts + TF_MS - 1, "s": symbol, "i": "1m", "o": "100.5",
+                             "c": "101.0", "h": "102.0", "l": "99.0", "v": "12.5", "x": closed}})
+
+
+def test_binance_streams_the_closed_klines():
+    client = BinanceFuturesClient("", "", testnet=True, connect=False)
+    contract = Contract("BTCUSDT", "BTC", "USDT", 2, 3, 0.01, 0.001)
+
+    received = []
+    client.watch_candles([contract], "1m", lambda symbol, candle: received.append((symbol, candle)))
+    assert client.subscription_stats()['streams'] == 1
+
+    client._on_message(None, _kline("BTCUSDT", START, False))
+    client._on_message(None, _kline("BTCUSDT", START, True))
+
+    assert len(received) == 1
+    symbol, candle = received[0]
+    assert (symbol, candle.timestamp, candle.open, candle.high, candle.low, candle.close, candle.volume) == \
+        ("BTCUSDT", START, 100.5, 102.0, 99.0, 101.0, 12.5)
+
+    client.unwatch_candles([contract], "1m")
+    assert client.subscription_stats()['streams'] == 0
+
+
+def test_bitmex_streams_the_trade_buckets():
+    client = BitmexClient("", "", testnet=True, connect=False)
+    contract = Contract("XBTUSD", "XBT", "USD", 1, 0, 0.5, 1, inverse=True, multiplier=-100000000)
+
+    received = []
+    client.watch_candles([contract], "1m", lambda symbol, candle: received.append((symbol, candle)))
+    assert client.subscription_stats()['subscribed'] == ["tradeBin1m:XBTUSD"]
+
+    # the buckets are timestamped with their close time
+    frame = {"table": "tradeBin1m", "action": "insert",
+             "data": [{"timestamp": ms_to_iso(START + TF_MS), "symbol": "XBTUSD", "open": 100.5, "high": 102.0,
+                       "low": 99.0, "close": 101.0, "volume": 12}]}
+    client._on_message(None, json.dumps(frame))
+
+    assert len(received) == 1
+    symbol, candle = received[0]
+    assert (symbol, candle.timestamp, candle.open, candle.close, candle.volume) == ("XBTUSD", START, 100.5, 101.0, 12)
+
+    client.unwatch_candles([contract], "1m")
+    assert client.subscription_stats()['subscribed'] == []
@@ -0,0 +1,74 @@
+# Run from the repository root: python -m pytest tests
+
+import time
+
+from connectors.subscriptions import SubscriptionManager, DEFAULT_MAX_STREAMS
+from mock_exchange.binance import MockBinanceFutures
+
+
+def _streams(count: int, start: int = 0):
+    return [f"sym{i}usdt@aggTrade" for i in range(start, start + count)]
+
+
+def _wait(condition, timeout: float = 10.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+def test_streams_are_sharded_and_their_slots_released():
+    manager = SubscriptionManager("Binance", "ws://localhost", lambda ws, msg: None, connect=False)
+
+    manager.acquire(_streams(450))
+    assert manager.stats()['streams_per_connection'] == [DEFAULT_MAX_STREAMS, DEFAULT_MAX_STREAMS, 50]
+
+    # a stream acquired twice takes a single slot, and stays subscribed until its last release
+    manager.acquire(_streams(10))
+    manager.release(_streams(10))
+    assert manager.stats()['streams'] == 450
+
+    # the released slots of the first connection are taken again before opening a new one
+    manager.release(_streams(120))
+    assert manager.stats()['streams_per_connection'] == [80, DEFAULT_MAX_STREAMS, 50]
+    manager.acquire(_streams(150, 1000))
+    assert manager.stats()['streams_per_connection'] == [DEFAULT_MAX_STREAMS, DEFAULT_MAX_STREAMS, 80]
+
+    # a connection without streams left is closed
+    manager.release(_streams(330, 120))
+    assert manager.stats()['streams_per_connection'] == [120, 30]
+    manager.release(_streams(150, 1000))
+    assert manager.stats() == {"streams": 0, "connections": 0, "streams_per_connection": [], "messages_sent": 0,
+                               "reconnections": 0}
+
+
+def test_subscriptions_seen_by_the_exchange():
+    mock = MockBinanceFutures(symbols=["BTCUSDT"], rate=1)
+    mock.start()
+
+    manager = SubscriptionManager("Binance", mock.wss_url, lambda ws, msg: None, max_streams=DEFAULT_MAX_STREAMS)
+
+    def subscriptions():
+        return sorted(len(client.subscriptions) for client in mock._clients)
+
+    try:
+        manager.acquire(_streams(250))
+        assert _wait(lambda: subscriptions() == [50, DEFAULT_MAX_STREAMS])
+
+        # unsubscribed from the connection that carried them, the slots are free for new streams
+        manager.release(_streams(100))
+        assert _wait(lambda: subscriptions() == [50, 100])
+        manager.acquire(_streams(100, 1000))
+        assert _wait(lambda: subscriptions() == [50, DEFAULT_MAX_STREAMS])
+        assert manager.stats()['connections'] == 2
+
+        # the last streams of a connection released: the connection is closed
+        manager.release(_streams(100, 1000) + _streams(100, 100))
+        assert _wait(lambda: subscriptions() == [50])
+
+        assert {stream for client in mock._clients for stream in client.subscriptions} == set(_streams(50, 200))
+    finally:
+        manager.release(manager.subscribed())
+        mock.stop()